@@ -20,6 +20,7 @@ from app.routes.trainer_routes import trainer_bp
 from app.routes.spark_mapreduce import spark_mapreduce_bp
 from app.routes.spark_kmeans    import spark_kmeans_bp
 from app.routes.spark_regresion import spark_regresion_bp
+from app.routes.analytics_jobs  import analytics_jobs_bp
 
 def create_app():
     app = Flask(__name__)
@@ -50,6 +51,7 @@ def create_app():
     app.register_blueprint(spark_mapreduce_bp)
     app.register_blueprint(spark_kmeans_bp)
     app.register_blueprint(spark_regresion_bp)
+    app.register_blueprint(analytics_jobs_bp)
     app.register_blueprint(user_routines_bp, url_prefix="/api/user")
     app.register_blueprint(miembro_membresias_bp, url_prefix="/api")
 
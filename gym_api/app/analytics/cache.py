@@ -0,0 +1,169 @@
+import threading
+import time
+from datetime import datetime
+
+from app.config import Config
+
+# ──────────────────────────────────────────────
+# CACHÉ DE ANALÍTICA (colección analytics_cache)
+# Cada resultado se guarda con `_cache`: huella de los datos de entrada
+# (conteo + último _id + última fecha_actualizacion de cada colección leída)
+# y fecha de guardado. El último _id detecta altas; fecha_actualizacion, que
+# los modelos sellan al editar, detecta correcciones en sitio.
+# Al leer:
+#   fresco   → dentro del TTL y con la misma huella: se sirve tal cual.
+#   obsoleto → venció el TTL o cambiaron los datos: se sirve igual
+#              (stale-while-revalidate) y se encola el re-entrenamiento
+#              en el worker de analítica.
+# ──────────────────────────────────────────────
+
+COLECCION = "analytics_cache"
+
+FRESCO   = "fresco"
+OBSOLETO = "obsoleto"
+
+# Mínimo entre dos refrescos del mismo resultado desde un mismo proceso,
+# para no encolar en cada GET si el worker está caído o el job falla
+INTERVALO_MIN_REFRESCO = 60
+
+
+class _MetricasCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.aciertos = 0
+            self.fallos = 0
+            self.obsoletos = 0
+            self.refrescos = 0
+            self.por_clave = {}
+            self.desde = time.time()
+
+    def registrar(self, clave, evento):
+        with self._lock:
+            setattr(self, evento, getattr(self, evento) + 1)
+            por_clave = self.por_clave.setdefault(clave, {"aciertos": 0, "fallos": 0, "obsoletos": 0, "refrescos": 0})
+            por_clave[evento] += 1
+
+    def snapshot(self):
+        with self._lock:
+            lecturas = self.aciertos + self.fallos + self.obsoletos
+            return {
+                "desde_segundos": round(time.time() - self.desde),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "obsoletos": self.obsoletos,
+                "refrescos_encolados": self.refrescos,
+                "tasa_acierto": round(self.aciertos / lecturas, 4) if lecturas else None,
+                "por_clave": {k: dict(v) for k, v in self.por_clave.items()}
+            }
+
+
+metricas = _MetricasCache()
+_ultimo_refresco = {}
+_refresco_lock = threading.Lock()
+
+
+def huella(db, colecciones):
+    """
+    Conteo estimado (metadatos), último _id y última fecha_actualizacion
+    (ambos por índice) de cada colección de entrada.
+    """
+    resultado = {}
+    for nombre in colecciones:
+        ultimo = db[nombre].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        editado = db[nombre].find_one(
+            {"fecha_actualizacion": {"$ne": None}},
+            {"fecha_actualizacion": 1},
+            sort=[("fecha_actualizacion", -1)]
+        )
+        resultado[nombre] = {
+            "conteo": db[nombre].estimated_document_count(),
+            "ultimo_id": str(ultimo["_id"]) if ultimo else None,
+            "ultima_actualizacion": str(editado["fecha_actualizacion"]) if editado else None
+        }
+    return resultado
+
+
+def leer(db, clave):
+    """Documento guardado (sin _id) o None. Incluye `_cache` y los campos internos."""
+    try:
+        doc = db[COLECCION].find_one({"_id": clave})
+        if doc:
+            doc.pop("_id", None)
+            return doc
+    except Exception as e:
+        print(f"[analytics cache] Error leyendo {clave}: {e}")
+    return None
+
+
+def guardar(db, clave, payload, colecciones, huella_datos=None):
+    """
+    Guarda (upsert) el resultado. `huella_datos` debe tomarse antes de entrenar:
+    si llegan datos durante el entrenamiento, la próxima lectura lo detecta.
+    """
+    try:
+        if huella_datos is None:
+            huella_datos = huella(db, colecciones)
+        meta = {"huella": huella_datos, "colecciones": list(colecciones), "guardado_en": datetime.now()}
+        datos = {k: v for k, v in payload.items() if k != "_cache"}
+        db[COLECCION].replace_one({"_id": clave}, {"_id": clave, **datos, "_cache": meta}, upsert=True)
+    except Exception as e:
+        print(f"[analytics cache] Error guardando {clave}: {e}")
+
+
+def _refrescar(clave, refrescar):
+    with _refresco_lock:
+        ahora = time.time()
+        if ahora - _ultimo_refresco.get(clave, 0) < INTERVALO_MIN_REFRESCO:
+            return
+        _ultimo_refresco[clave] = ahora
+    try:
+        refrescar()
+        metricas.registrar(clave, "refrescos")
+    except Exception as e:
+        print(f"[analytics cache] Error encolando refresco de {clave}: {e}")
+
+
+def obtener(db, clave, colecciones, refrescar, ttl=None):
+    """
+    Devuelve (payload, estado) con estado FRESCO u OBSOLETO, o (None, None) si
+    no hay nada guardado. En OBSOLETO llama a `refrescar()` (encola el job)
+    y devuelve igualmente lo guardado. El payload trae `cache` con el estado.
+    """
+    doc = leer(db, clave)
+    if doc is None:
+        metricas.registrar(clave, "fallos")
+        return None, None
+
+    ttl = Config.ANALYTICS_CACHE_TTL_SEGUNDOS if ttl is None else ttl
+    meta = doc.pop("_cache", None) or {}
+    guardado_en = meta.get("guardado_en")
+    edad = (datetime.now() - guardado_en).total_seconds() if guardado_en else None
+
+    vencido = edad is None or edad > ttl
+    cambiado = meta.get("huella") != huella(db, colecciones)
+
+    if vencido or cambiado:
+        estado = OBSOLETO
+        metricas.registrar(clave, "obsoletos")
+        _refrescar(clave, refrescar)
+    else:
+        estado = FRESCO
+        metricas.registrar(clave, "aciertos")
+
+    doc["desde_cache"] = True
+    doc["cache"] = {
+        "estado": estado,
+        "motivo": ("datos_modificados" if cambiado else "ttl_vencido") if estado == OBSOLETO else None,
+        "guardado_en": guardado_en.isoformat() if guardado_en else None,
+        "edad_segundos": round(edad) if edad is not None else None
+    }
+    return doc, estado
+
+
+def sin_internos(payload):
+    """Quita los campos internos (_cache, _modelo, _medias...) antes de responder."""
+    return {k: v for k, v in payload.items() if not k.startswith("_")}
@@ -0,0 +1,149 @@
+import json
+import socket
+import os
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# ──────────────────────────────────────────────
+# COLA DE TRABAJOS DE ANALÍTICA
+# Los endpoints /train solo insertan un documento en `analytics_jobs`;
+# app/analytics/worker.py (otro proceso, dueño de la SparkSession) los toma
+# con find_one_and_update, entrena y deja el resultado en analytics_cache.
+#
+# Mientras un trabajo está pendiente o en proceso lleva `clave_activa`
+# (tipo + params); el índice único parcial idx_jobs_clave_activa
+# (spark/DB/crar_db.py) impide que dos peticiones encolen el mismo trabajo.
+# ──────────────────────────────────────────────
+
+COLECCION = "analytics_jobs"
+
+PENDIENTE  = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR      = "error"
+
+MAX_INTENTOS = 3
+
+
+def _clave_activa(tipo, params):
+    return f"{tipo}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def encolar(db, tipo, params=None):
+    """
+    Crea un trabajo y devuelve (job_doc, nuevo). Si ya hay uno igual pendiente
+    o en proceso se devuelve ese, para no entrenar dos veces lo mismo.
+    """
+    params = params or {}
+    clave = _clave_activa(tipo, params)
+    existente = db[COLECCION].find_one({"clave_activa": clave})
+    if existente:
+        return existente, False
+
+    job = {
+        "_id": ObjectId(),
+        "tipo": tipo,
+        "params": params,
+        "estado": PENDIENTE,
+        "intentos": 0,
+        "fecha_creacion": datetime.now(),
+        "fecha_inicio": None,
+        "fecha_fin": None,
+        "worker": None,
+        "error": None,
+        "cache_key": None,
+        "mensaje": None,
+        "clave_activa": clave
+    }
+    try:
+        db[COLECCION].insert_one(job)
+    except DuplicateKeyError:
+        # Otra petición lo encoló entre el find_one y el insert
+        existente = db[COLECCION].find_one({"clave_activa": clave})
+        if existente:
+            return existente, False
+        raise
+    return job, True
+
+
+def obtener(db, job_id):
+    if not ObjectId.is_valid(job_id):
+        return None
+    return db[COLECCION].find_one({"_id": ObjectId(job_id)})
+
+
+def tomar_siguiente(db):
+    """Reserva atómicamente el trabajo pendiente más antiguo (None si no hay)."""
+    return db[COLECCION].find_one_and_update(
+        {"estado": PENDIENTE},
+        {
+            "$set": {
+                "estado": EN_PROCESO,
+                "fecha_inicio": datetime.now(),
+                "worker": f"{socket.gethostname()}:{os.getpid()}"
+            },
+            "$inc": {"intentos": 1}
+        },
+        sort=[("fecha_creacion", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def completar(db, job_id, cache_key, mensaje):
+    db[COLECCION].update_one(
+        {"_id": job_id},
+        {"$set": {
+            "estado": COMPLETADO,
+            "fecha_fin": datetime.now(),
+            "cache_key": cache_key,
+            "mensaje": mensaje,
+            "error": None
+        }, "$unset": {"clave_activa": ""}}
+    )
+
+
+def fallar(db, job_id, error):
+    db[COLECCION].update_one(
+        {"_id": job_id},
+        {"$set": {"estado": ERROR, "fecha_fin": datetime.now(), "error": str(error)},
+         "$unset": {"clave_activa": ""}}
+    )
+
+
+def recuperar_huerfanos(db, minutos):
+    """
+    Devuelve a la cola los trabajos que quedaron en proceso más de `minutos`
+    (el worker murió a mitad). Tras MAX_INTENTOS se marcan como error.
+    """
+    limite = datetime.now() - timedelta(minutes=minutos)
+    filtro = {"estado": EN_PROCESO, "fecha_inicio": {"$lt": limite}}
+    db[COLECCION].update_many(
+        {**filtro, "intentos": {"$gte": MAX_INTENTOS}},
+        {"$set": {"estado": ERROR, "fecha_fin": datetime.now(), "error": "El worker no terminó el trabajo"},
+         "$unset": {"clave_activa": ""}}
+    )
+    db[COLECCION].update_many(
+        filtro,
+        {"$set": {"estado": PENDIENTE, "worker": None}}
+    )
+
+
+def to_dict(job):
+    """Representación JSON del trabajo (sin el resultado)."""
+    def _iso(valor):
+        return valor.isoformat() if valor else None
+
+    return {
+        "job_id": str(job["_id"]),
+        "tipo": job.get("tipo"),
+        "params": job.get("params", {}),
+        "estado": job.get("estado"),
+        "intentos": job.get("intentos", 0),
+        "fecha_creacion": _iso(job.get("fecha_creacion")),
+        "fecha_inicio": _iso(job.get("fecha_inicio")),
+        "fecha_fin": _iso(job.get("fecha_fin")),
+        "error": job.get("error"),
+        "mensaje": job.get("mensaje")
+    }
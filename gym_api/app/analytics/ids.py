@@ -0,0 +1,121 @@
+import re
+from bson.objectid import ObjectId
+
+# ──────────────────────────────────────────────
+# RESOLUCIÓN DE IDS (miembro / usuario)
+# La entrada se convierte a ObjectId una sola vez y el filtro va a Mongo,
+# que lo resuelve con los índices idx_progreso_miembro e idx_miembros_usuario:
+# lecturas puntuales en lugar de recorrer la colección con una UDF por fila.
+# Se acepta también el hex guardado como texto (documentos migrados con ids string).
+# ──────────────────────────────────────────────
+
+_HEX = re.compile(r"[0-9a-fA-F]{24}")
+
+
+def a_object_id(valor):
+    """ObjectId desde un ObjectId, un hex, "{hex}" o 'ObjectId("hex")'; None si no contiene uno válido."""
+    if isinstance(valor, ObjectId):
+        return valor
+    if valor is None:
+        return None
+    m = _HEX.search(str(valor))
+    return ObjectId(m.group(0)) if m else None
+
+
+def filtro_id(campo, oid):
+    """Igualdad sobre `campo` que acepta el ObjectId o su hex en texto (sigue usando el índice)."""
+    return {campo: {"$in": [oid, str(oid)]}}
+
+
+def resolver_id_miembro(db, id_entrada):
+    """
+    Acepta id de miembro o de usuario y devuelve el id (hex) del miembro que
+    tiene registros en progreso_fisico, o None.
+    """
+    oid = a_object_id(id_entrada)
+    if oid is None:
+        return None
+
+    if db.progreso_fisico.find_one(filtro_id("id_miembro", oid), {"_id": 1}):
+        return str(oid)
+
+    miembro = db.miembros.find_one(filtro_id("id_usuario", oid), {"_id": 1})
+    if miembro and db.progreso_fisico.find_one(filtro_id("id_miembro", miembro["_id"]), {"_id": 1}):
+        return str(miembro["_id"])
+    return None
+
+
+def diagnosticar_cadena(db, id_entrada):
+    """Traza usuario → miembro → progreso_fisico para un id (endpoint /debug2)."""
+    oid = a_object_id(id_entrada)
+    resultado = {"id_entrada": id_entrada, "pasos": {}}
+    if oid is None:
+        resultado["id_correcto_para_predecir"] = None
+        resultado["diagnostico"] = "INVALIDO: El id no contiene un ObjectId de 24 caracteres hexadecimales."
+        return resultado
+
+    usuario = db.usuarios.find_one(filtro_id("_id", oid), {"nombre": 1, "email": 1})
+    usuarios = [{"id_usuario": str(usuario["_id"]), "nombre": usuario.get("nombre"),
+                 "email": usuario.get("email")}] if usuario else []
+    resultado["pasos"]["1_en_usuarios"] = {"encontrado": bool(usuarios), "datos": usuarios}
+
+    def _miembro_dict(m):
+        return {"id_miembro": str(m["_id"]), "id_usuario": str(m.get("id_usuario")), "estado": m.get("estado")}
+
+    proyeccion = {"id_usuario": 1, "estado": 1}
+    miembro_por_id = [_miembro_dict(m) for m in db.miembros.find(filtro_id("_id", oid), proyeccion)]
+    resultado["pasos"]["2_en_miembros_como_id"] = {"encontrado": bool(miembro_por_id), "datos": miembro_por_id}
+
+    miembro_por_usuario = [_miembro_dict(m) for m in db.miembros.find(filtro_id("id_usuario", oid), proyeccion)]
+    resultado["pasos"]["3_en_miembros_como_id_usuario"] = {
+        "encontrado": bool(miembro_por_usuario), "datos": miembro_por_usuario
+    }
+
+    registros_progreso = db.progreso_fisico.count_documents(filtro_id("id_miembro", oid))
+    resultado["pasos"]["4_en_progreso_fisico"] = {
+        "encontrado": registros_progreso > 0,
+        "num_registros": registros_progreso
+    }
+
+    id_correcto = None
+    if registros_progreso > 0:
+        id_correcto = str(oid)
+        diagnostico = "OK: Este id ya es correcto para el endpoint predecir."
+    elif miembro_por_usuario:
+        id_correcto = miembro_por_usuario[0]["id_miembro"]
+        diagnostico = f"CORREGIR: Estas pasando el id de USUARIO. El id correcto de MIEMBRO es: {id_correcto}"
+    elif miembro_por_id:
+        id_correcto = str(oid)
+        diagnostico = "PROBLEMA: Es un id de miembro valido pero no tiene registros en progreso_fisico."
+    elif usuarios:
+        diagnostico = "PROBLEMA: Es un id de usuario sin miembro asociado."
+    else:
+        diagnostico = "NOT_FOUND: El id no existe en ninguna coleccion."
+
+    resultado["id_correcto_para_predecir"] = id_correcto
+    resultado["diagnostico"] = diagnostico
+    return resultado
+
+
+def diagnosticar_campo(db, id_miembro):
+    """Cómo está guardado progreso_fisico.id_miembro y cuántos registros coinciden (endpoint /debug)."""
+    muestras = [d.get("id_miembro") for d in db.progreso_fisico.find({}, {"_id": 0, "id_miembro": 1}).limit(5)]
+    oid = a_object_id(id_miembro)
+    hits_oid = db.progreso_fisico.count_documents({"id_miembro": oid}) if oid else 0
+    hits_str = db.progreso_fisico.count_documents({"id_miembro": str(oid) if oid else id_miembro})
+
+    diagnostico = (
+        "OK_OBJECTID" if hits_oid > 0 else
+        "OK_STRING"   if hits_str > 0 else
+        "FALLO: Este id no existe en progreso_fisico. Usa /debug2/{id} para trazar la cadena completa."
+    )
+    return {
+        "id_recibido": id_miembro,
+        "tipos_campo": sorted({type(m).__name__ for m in muestras}),
+        "muestras_raw": [str(m) for m in muestras],
+        "muestras_hex": [str(a_object_id(m)) if a_object_id(m) else None for m in muestras],
+        "total_registros_db": db.progreso_fisico.estimated_document_count(),
+        "hits_object_id": hits_oid,
+        "hits_string": hits_str,
+        "diagnostico": diagnostico
+    }
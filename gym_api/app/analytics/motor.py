@@ -0,0 +1,33 @@
+import importlib.util
+from app.config import Config
+
+# ──────────────────────────────────────────────
+# SELECCIÓN DEL MOTOR DE ANALÍTICA
+# "local": NumPy/Pandas leyendo con pymongo (sin JVM, milisegundos para un gimnasio).
+# "spark": SparkSession local[*] con el conector de MongoDB (volúmenes grandes).
+# Con Config.ANALYTICS_MOTOR = "auto" se usa local mientras las colecciones
+# involucradas sumen menos de Config.ANALYTICS_UMBRAL_FILAS documentos.
+# ──────────────────────────────────────────────
+
+MOTOR_LOCAL = "local"
+MOTOR_SPARK = "spark"
+
+
+def spark_disponible():
+    return importlib.util.find_spec("pyspark") is not None
+
+
+def elegir_motor(db, colecciones):
+    """Devuelve MOTOR_LOCAL o MOTOR_SPARK para un análisis que lee `colecciones`."""
+    preferido = (Config.ANALYTICS_MOTOR or "auto").lower()
+
+    if preferido == MOTOR_LOCAL:
+        return MOTOR_LOCAL
+    if preferido == MOTOR_SPARK:
+        return MOTOR_SPARK if spark_disponible() else MOTOR_LOCAL
+
+    # auto: estimated_document_count lee metadatos, no recorre la colección
+    filas = sum(db[c].estimated_document_count() for c in colecciones)
+    if filas < Config.ANALYTICS_UMBRAL_FILAS or not spark_disponible():
+        return MOTOR_LOCAL
+    return MOTOR_SPARK
@@ -0,0 +1,509 @@
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne
+
+from app.analytics.ids import filtro_id
+from app.models.member_features import MemberFeatures
+
+# ──────────────────────────────────────────────────────────────────────────────
+# MOTOR LOCAL (NumPy / Pandas)
+# Misma salida que las funciones Spark de spark_kmeans.py y spark_regresion.py,
+# pero leyendo con pymongo (solo los campos necesarios) dentro del propio
+# proceso: sin JVM ni conector, pensado para volúmenes de un gimnasio
+# (< 1M de documentos por colección).
+# ──────────────────────────────────────────────────────────────────────────────
+
+SEED = 42
+
+
+def _oid_hex(val):
+    if val is None:
+        return None
+    m = re.search(r"[0-9a-fA-F]{24}", str(val))
+    return m.group(0) if m else str(val)
+
+
+def _a_float(valor):
+    """Equivalente a .cast("double"): Decimal128, int o str numérico → float; lo demás → NaN."""
+    if valor is None:
+        return np.nan
+    if hasattr(valor, "to_decimal"):
+        return float(valor.to_decimal())
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _frame(cursor, columnas):
+    """DataFrame con `columnas` garantizadas aunque falten en los documentos."""
+    df = pd.DataFrame(list(cursor))
+    for c in columnas:
+        if c not in df.columns:
+            df[c] = None
+    return df[columnas]
+
+
+def _numericas(df, columnas):
+    for c in columnas:
+        df[c] = df[c].map(_a_float).astype(float)
+    return df
+
+
+def _registros(df):
+    """to_dict('records') con None en lugar de NaN y tipos nativos de Python."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# K-MEANS
+# ──────────────────────────────────────────────────────────────────────────────
+
+COLUMNAS_KMEANS = ["peso", "imc", "grasa", "musculo"]
+TAM_LOTE = 1024
+
+
+def _distancias(X, centros):
+    """Distancia euclidiana al cuadrado (n × k) sin materializar el tensor n × k × d."""
+    d = (X ** 2).sum(axis=1)[:, None] - 2 * X @ centros.T + (centros ** 2).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0)
+
+
+def _kmeans_pp(X, k, rng):
+    """Inicialización k-means++."""
+    centros = [X[rng.integers(len(X))]]
+    d2 = _distancias(X, np.array(centros)).min(axis=1)
+    for _ in range(1, k):
+        total = d2.sum()
+        idx = rng.choice(len(X), p=d2 / total) if total > 0 else rng.integers(len(X))
+        centros.append(X[idx])
+        d2 = np.minimum(d2, _distancias(X, X[idx][None, :])[:, 0])
+    return np.array(centros, dtype=float)
+
+
+def _lloyd(X, centros, max_iter, tol=1e-4):
+    """Iteraciones de Lloyd; se detiene cuando ningún centroide se mueve más de `tol`."""
+    for _ in range(max_iter):
+        etiquetas = _distancias(X, centros).argmin(axis=1)
+        nuevos = centros.copy()
+        for c in range(len(centros)):
+            miembros = X[etiquetas == c]
+            if len(miembros):
+                nuevos[c] = miembros.mean(axis=0)
+        movimiento = np.sqrt(((nuevos - centros) ** 2).sum(-1)).max()
+        centros = nuevos
+        if movimiento <= tol:
+            break
+    return _distancias(X, centros).argmin(axis=1), centros
+
+
+def _minibatch(X, centros, max_iter, rng, tam_lote=TAM_LOTE, tol=1e-4):
+    """
+    Mini-batch k-means (Sculley, 2010): cada iteración mueve los centros con un
+    lote aleatorio y tasa 1/n_c, donde n_c son los puntos que ya vio ese centro.
+    Sumar el lote de una vez equivale a aplicar los puntos uno a uno.
+    """
+    centros = centros.copy()
+    conteos = np.zeros(len(centros))
+    for _ in range(max_iter):
+        lote = X[rng.choice(len(X), size=min(tam_lote, len(X)), replace=False)]
+        etiquetas = _distancias(lote, centros).argmin(axis=1)
+        previos = centros.copy()
+        for c in range(len(centros)):
+            sel = lote[etiquetas == c]
+            if len(sel):
+                conteos[c] += len(sel)
+                centros[c] += (sel.sum(axis=0) - len(sel) * centros[c]) / conteos[c]
+        if np.sqrt(((centros - previos) ** 2).sum(-1)).max() <= tol:
+            break
+    return _distancias(X, centros).argmin(axis=1), centros
+
+
+def _silhouette(X, etiquetas, k):
+    """
+    Silhouette con distancia euclidiana al cuadrado, igual que ClusteringEvaluator.
+    La distancia media de un punto a un cluster se obtiene en forma cerrada
+    (‖x‖² − 2·x·μ + media(‖y‖²)), así el costo es O(n·k) y no O(n²).
+    """
+    normas = (X ** 2).sum(axis=1)
+    tamanos = np.bincount(etiquetas, minlength=k)
+    D = np.full((len(X), k), np.inf)
+    for c in range(k):
+        if tamanos[c]:
+            sel = etiquetas == c
+            D[:, c] = normas - 2 * X @ X[sel].mean(axis=0) + normas[sel].mean()
+
+    filas = np.arange(len(X))
+    propio = tamanos[etiquetas]
+    a = np.where(propio > 1, D[filas, etiquetas] * propio / np.maximum(propio - 1, 1), 0.0)
+    D[filas, etiquetas] = np.inf
+    b = D.min(axis=1)
+
+    s = np.where(a < b, 1 - a / np.where(b == 0, 1, b), np.where(a > b, b / np.where(a == 0, 1, a) - 1, 0.0))
+    s[propio <= 1] = 0.0
+    return float(s.mean())
+
+
+def matriz_kmeans(db):
+    """
+    (df, X, media, std): miembros con sus features y la matriz estandarizada.
+    En un barrido de k se calcula una sola vez y la comparten todos los k.
+    """
+    # 1-2. Perfil + último progreso de cada miembro, ya materializados en member_features
+    MemberFeatures.asegurar(db)
+    df = _frame(
+        db[MemberFeatures.collection].find(
+            {}, {"sexo": 1, "peso_inicial": 1, "estatura": 1, "peso": 1, "bmi": 1,
+                 "grasa_corporal": 1, "masa_muscular": 1}
+        ),
+        ["_id", "sexo", "peso_inicial", "estatura", "peso", "bmi", "grasa_corporal", "masa_muscular"]
+    ).rename(columns={"_id": "id_miembro"})
+    df = _numericas(df, ["peso_inicial", "estatura", "peso", "bmi", "grasa_corporal", "masa_muscular"])
+    df = df[df["peso_inicial"].notna() & df["estatura"].notna() & (df["estatura"] > 0)].copy()
+
+    # 3. Imputación (mismos valores por defecto que la versión Spark)
+    df["imc"] = df["bmi"].where(df["bmi"].notna(), df["peso_inicial"] / (df["estatura"] ** 2))
+    df["peso"] = df["peso"].where(df["peso"].notna(), df["peso_inicial"])
+    df["grasa"] = df["grasa_corporal"].fillna(20.0)
+    df["musculo"] = df["masa_muscular"].fillna(30.0)
+    df = df[df["peso"].notna() & df["imc"].notna()].reset_index(drop=True)
+
+    # 4. Estandarización (StandardScaler withMean/withStd usa desviación muestral)
+    X_raw = df[COLUMNAS_KMEANS].to_numpy(dtype=float)
+    media = X_raw.mean(axis=0) if len(X_raw) else np.zeros(len(COLUMNAS_KMEANS))
+    std = X_raw.std(axis=0, ddof=1) if len(X_raw) > 1 else np.ones(len(COLUMNAS_KMEANS))
+    std = np.where(std > 0, std, 1.0)
+    return df, (X_raw - media) / std, media, std
+
+
+def entrenar_kmeans(df, X, media, std, k: int, max_iter: int = 20, seed: int = SEED,
+                    centros_previos=None, mini_batch: bool = False):
+    """
+    Entrena sobre la matriz ya escalada. `centros_previos` (en unidades reales,
+    k × 4) arranca desde el modelo anterior en lugar de k-means++; con
+    `mini_batch` se usa _minibatch en vez de Lloyd completo.
+    Devuelve (resumen_clusters, asignaciones, centroides, silhouette, modelo).
+    """
+    if len(df) < k:
+        raise ValueError(f"Datos insuficientes: se necesitan al menos {k} miembros con datos.")
+
+    rng = np.random.default_rng(seed)
+    iniciales = None
+    if centros_previos is not None:
+        previos = np.asarray(centros_previos, dtype=float)
+        if previos.shape == (k, X.shape[1]):
+            iniciales = (previos - media) / std
+    warm_start = iniciales is not None
+    if not warm_start:
+        iniciales = _kmeans_pp(X, k, rng)
+
+    if mini_batch:
+        etiquetas, centros = _minibatch(X, iniciales, max_iter, rng)
+    else:
+        etiquetas, centros = _lloyd(X, iniciales, max_iter)
+    silhouette = _silhouette(X, etiquetas, k)
+    inercia = float(_distancias(X, centros)[np.arange(len(X)), etiquetas].sum())
+
+    df = df.assign(cluster=etiquetas)
+    centroides = [
+        {
+            "cluster":      i,
+            "peso_norm":    round(float(c[0]), 4),
+            "imc_norm":     round(float(c[1]), 4),
+            "grasa_norm":   round(float(c[2]), 4),
+            "musculo_norm": round(float(c[3]), 4),
+        }
+        for i, c in enumerate(centros)
+    ]
+
+    resumen = (
+        df.groupby("cluster")
+        .agg(
+            num_miembros=("peso", "size"),
+            peso_promedio=("peso", "mean"),
+            imc_promedio=("imc", "mean"),
+            grasa_promedio=("grasa", "mean"),
+            musculo_promedio=("musculo", "mean")
+        )
+        .round(2)
+        .reset_index()
+        .sort_values("cluster")
+    )
+
+    asignaciones = pd.DataFrame({
+        "id_miembro": df["id_miembro"].map(_oid_hex),
+        "cluster":    df["cluster"],
+        "sexo":       df["sexo"],
+        "peso":       df["peso"].round(1),
+        "imc":        df["imc"].round(2),
+        "grasa":      df["grasa"].round(1),
+        "musculo":    df["musculo"].round(1),
+    }).sort_values("cluster", kind="stable")
+
+    modelo = {
+        "inercia": round(inercia, 4),
+        "centros": (centros * std + media).tolist(),
+        "warm_start": warm_start,
+        "mini_batch": bool(mini_batch)
+    }
+    return _registros(resumen), _registros(asignaciones), centroides, round(silhouette, 4), modelo
+
+
+def kmeans(db, k: int = 3, max_iter: int = 20, seed: int = SEED,
+           centros_previos=None, mini_batch: bool = False):
+    """Un solo k: como _ejecutar_kmeans() más el dict `modelo` (inercia, centros reales)."""
+    df, X, media, std = matriz_kmeans(db)
+    return entrenar_kmeans(df, X, media, std, k, max_iter, seed, centros_previos, mini_batch)
+
+
+def barrido_kmeans(db, ks, max_iter: int = 20, seed: int = SEED,
+                   centros_previos=None, mini_batch: bool = False):
+    """{k: resultado de entrenar_kmeans} leyendo y escalando los datos una sola vez."""
+    df, X, media, std = matriz_kmeans(db)
+    centros_previos = centros_previos or {}
+    return {
+        k: entrenar_kmeans(df, X, media, std, k, max_iter, seed, centros_previos.get(k), mini_batch)
+        for k in ks
+    }
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# REGRESIÓN RIDGE (PREDICCIÓN DE PESO)
+# ──────────────────────────────────────────────────────────────────────────────
+
+FEATURES_REGRESION = ["dias", "cintura", "grasa_corporal", "bmi"]
+REG_PARAM = 0.1
+
+
+def _ajustar_ridge(X, y, reg_param=REG_PARAM):
+    """
+    Forma cerrada equivalente a LinearRegression(regParam, elasticNetParam=0,
+    standardization=True) de Spark: la penalización L2 se aplica sobre los
+    coeficientes de las features estandarizadas, es decir
+        (XcᵀXc/n + λ·diag(σ²))·w = Xcᵀyc/n,   intercepto = ȳ − x̄·w
+    Las columnas constantes (σ = 0) quedan con coeficiente 0, como en Spark.
+    """
+    n = len(X)
+    media_x, media_y = X.mean(axis=0), y.mean()
+    Xc, yc = X - media_x, y - media_y
+    var = Xc.var(axis=0)
+
+    w = np.zeros(X.shape[1])
+    activas = var > 0
+    if activas.any():
+        Xa = Xc[:, activas]
+        A = Xa.T @ Xa / n + reg_param * np.diag(var[activas])
+        w[activas] = np.linalg.lstsq(A, Xa.T @ yc / n, rcond=None)[0]
+    return w, float(media_y - media_x @ w)
+
+
+def _metricas(y, pred):
+    err = y - pred
+    ss_tot = ((y - y.mean()) ** 2).sum()
+    return {
+        "rmse": round(float(np.sqrt((err ** 2).mean())), 4),
+        "r2":   round(float(1 - (err ** 2).sum() / ss_tot) if ss_tot > 0 else 0.0, 4),
+        "mae":  round(float(np.abs(err).mean()), 4)
+    }
+
+
+def regresion_global(db):
+    """
+    Devuelve (modelo, metricas, coeficientes, tendencia, media_cintura, media_grasa)
+    como _regresion_global(); `modelo` es un dict con los coeficientes crudos.
+    """
+    df = _frame(
+        db.progreso_fisico.find(
+            {"fecha_registro": {"$ne": None}},
+            {"_id": 0, "id_miembro": 1, "peso": 1, "bmi": 1, "cintura": 1, "grasa_corporal": 1, "fecha_registro": 1}
+        ),
+        ["id_miembro", "peso", "bmi", "cintura", "grasa_corporal", "fecha_registro"]
+    )
+    df = _numericas(df, ["peso", "bmi", "cintura", "grasa_corporal"])
+    df["fecha_registro"] = pd.to_datetime(df["fecha_registro"], errors="coerce")
+    df = df[df["peso"].notna() & df["fecha_registro"].notna() & (df["peso"] > 0)].copy()
+
+    if len(df) < 10:
+        raise ValueError("Se necesitan al menos 10 registros de progreso para entrenar el modelo.")
+
+    # Días desde el primer registro de cada miembro: fecha_inicio de member_features;
+    # solo se calcula sobre los datos para ids que la vista no tenga
+    MemberFeatures.asegurar(db)
+    inicios = {
+        _oid_hex(d["_id"]): d["fecha_inicio"]
+        for d in db[MemberFeatures.collection].find({"fecha_inicio": {"$ne": None}}, {"fecha_inicio": 1})
+    }
+    df["id_miembro"] = df["id_miembro"].map(_oid_hex)
+    fecha = df["fecha_registro"].dt.normalize()
+    inicio = pd.to_datetime(df["id_miembro"].map(inicios), errors="coerce").dt.normalize()
+    if inicio.isna().any():
+        inicio = inicio.fillna(fecha.groupby(df["id_miembro"], dropna=False).transform("min"))
+    df["dias"] = (fecha - inicio).dt.days.astype(float)
+
+    media_cintura = df["cintura"].mean()
+    media_grasa = df["grasa_corporal"].mean()
+    media_cintura = float(media_cintura) if pd.notna(media_cintura) and media_cintura else 80.0
+    media_grasa = float(media_grasa) if pd.notna(media_grasa) and media_grasa else 22.0
+    df = df.fillna({"cintura": media_cintura, "grasa_corporal": media_grasa, "bmi": 25.0})
+
+    X = df[FEATURES_REGRESION].to_numpy(dtype=float)
+    y = df["peso"].to_numpy(dtype=float)
+
+    # 80/20 con semilla fija (misma proporción que randomSplit)
+    entrenamiento = np.random.default_rng(SEED).random(len(df)) < 0.8
+    if entrenamiento.sum() < 2 or (~entrenamiento).sum() == 0:
+        entrenamiento[:] = True
+    prueba = ~entrenamiento if (~entrenamiento).any() else entrenamiento
+
+    w, intercepto = _ajustar_ridge(X[entrenamiento], y[entrenamiento])
+    metricas = _metricas(y[prueba], X[prueba] @ w + intercepto)
+
+    coeficientes = {
+        "dias":           round(float(w[0]), 6),
+        "cintura":        round(float(w[1]), 6),
+        "grasa_corporal": round(float(w[2]), 6),
+        "bmi":            round(float(w[3]), 6),
+        "intercepto":     round(intercepto,  4)
+    }
+
+    tendencia = (
+        df.groupby(df["fecha_registro"].dt.strftime("%Y-%m").rename("mes"))["peso"]
+        .agg(peso_promedio="mean", registros="count")
+        .reset_index()
+        .sort_values("mes")
+    )
+    tendencia["peso_promedio"] = tendencia["peso_promedio"].round(2)
+
+    modelo = {"features": FEATURES_REGRESION, "pesos": [float(v) for v in w], "intercepto": intercepto}
+    return modelo, metricas, coeficientes, _registros(tendencia), media_cintura, media_grasa
+
+
+HORIZONTES = [30, 60, 90, 120, 150, 180]
+COLECCION_PREDICCIONES = "predicciones_peso"
+
+
+def _base_prediccion(ultimo, primer_registro, media_cintura, media_grasa, ahora):
+    """
+    Vector [dias_actuales, cintura, grasa, bmi] del miembro. Ceteris paribus:
+    cintura, grasa y BMI del último registro; solo avanzan los días.
+    """
+    dias_actuales = (ahora - primer_registro).days if primer_registro else 0
+    cintura = _a_float(ultimo.get("cintura"))
+    grasa = _a_float(ultimo.get("grasa_corporal"))
+    bmi = _a_float(ultimo.get("bmi"))
+    cintura = media_cintura if np.isnan(cintura) or not cintura else cintura
+    grasa = media_grasa if np.isnan(grasa) or not grasa else grasa
+    bmi = 25.0 if np.isnan(bmi) or not bmi else bmi
+    return [dias_actuales, cintura, grasa, bmi]
+
+
+def proyectar(modelo, bases, horizontes):
+    """
+    Pesos predichos (n_miembros × n_horizontes) en una sola operación:
+        peso(d) = intercepto + bases·w + w_dias·d
+    ya que entre horizontes solo cambia la feature "dias".
+    """
+    w = np.array(modelo["pesos"], dtype=float)
+    bases = np.asarray(bases, dtype=float).reshape(-1, len(w))
+    d = np.asarray(horizontes, dtype=float)
+    i_dias = modelo.get("features", FEATURES_REGRESION).index("dias")
+    return (bases @ w + modelo["intercepto"])[:, None] + w[i_dias] * d[None, :]
+
+
+def formatear_predicciones(horizontes, pesos, ahora=None):
+    ahora = ahora or datetime.now()
+    return [
+        {
+            "dias_desde_hoy":   int(d),
+            "fecha_estimada":   (ahora + timedelta(days=int(d))).strftime("%Y-%m-%d"),
+            "peso_predicho_kg": round(float(p), 2)
+        }
+        for d, p in zip(horizontes, pesos)
+    ]
+
+
+def historial_miembro(db, id_miembro: str):
+    """Registros con peso del miembro, en orden cronológico (lectura indexada por id_miembro)."""
+    return list(db.progreso_fisico.find(
+        {**filtro_id("id_miembro", ObjectId(id_miembro)), "peso": {"$ne": None}},
+        {"_id": 0, "peso": 1, "bmi": 1, "cintura": 1, "grasa_corporal": 1, "fecha_registro": 1}
+    ).sort("fecha_registro", 1))
+
+
+def formatear_historial(registros):
+    return [
+        {
+            "fecha": r["fecha_registro"].strftime("%Y-%m-%d")
+                     if hasattr(r.get("fecha_registro"), "strftime")
+                     else str(r.get("fecha_registro")),
+            "peso": round(_a_float(r["peso"]), 1)
+        }
+        for r in registros
+    ]
+
+
+def predecir_miembro(db, modelo, id_miembro: str, dias_futuro: int,
+                     media_cintura: float, media_grasa: float, registros=None):
+    """Historial del miembro + predicciones cada 30 días con la fórmula lineal del modelo."""
+    if registros is None:
+        registros = historial_miembro(db, id_miembro)
+    if not registros:
+        return None, []
+
+    ahora = datetime.now()
+    base = _base_prediccion(
+        registros[-1], registros[0].get("fecha_registro"), media_cintura, media_grasa, ahora
+    )
+    horizontes = [d for d in HORIZONTES if d <= dias_futuro]
+    pesos = proyectar(modelo, [base], horizontes)[0] if horizontes else []
+    return formatear_historial(registros), formatear_predicciones(horizontes, pesos, ahora)
+
+
+def precalcular_predicciones(db, modelo, media_cintura: float, media_grasa: float,
+                             version: str, lote: int = 1000):
+    """
+    Calcula las predicciones de todos los miembros con progreso y las deja en
+    `predicciones_peso` (un documento por miembro, _id = id_miembro).
+    El último registro y la fecha de inicio salen de member_features; la
+    proyección de todos los horizontes es una sola multiplicación de matrices.
+    Devuelve el número de miembros escritos.
+    """
+    MemberFeatures.asegurar(db)
+    grupos = [
+        g for g in db[MemberFeatures.collection].find(
+            {"peso": {"$ne": None}, "fecha_inicio": {"$ne": None}},
+            {"peso": 1, "cintura": 1, "grasa_corporal": 1, "bmi": 1, "fecha_inicio": 1, "fecha_ultimo": 1}
+        )
+        if isinstance(g["_id"], ObjectId)
+    ]
+    if not grupos:
+        return 0
+
+    ahora = datetime.now()
+    bases = [
+        _base_prediccion(g, g["fecha_inicio"], media_cintura, media_grasa, ahora)
+        for g in grupos
+    ]
+    matriz = proyectar(modelo, bases, HORIZONTES)
+
+    ops = [
+        ReplaceOne({"_id": g["_id"]}, {
+            "_id": g["_id"],
+            "peso_actual_kg": round(_a_float(g["peso"]), 1),
+            "fecha_ultimo_registro": g.get("fecha_ultimo"),
+            "predicciones": [
+                {"dias_desde_hoy": d, "peso_predicho_kg": round(float(p), 2)}
+                for d, p in zip(HORIZONTES, fila)
+            ],
+            "modelo_version": version,
+            "fecha_calculo": ahora
+        }, upsert=True)
+        for g, fila in zip(grupos, matriz)
+    ]
+    for i in range(0, len(ops), lote):
+        db[COLECCION_PREDICCIONES].bulk_write(ops[i:i + lote], ordered=False)
+    return len(ops)
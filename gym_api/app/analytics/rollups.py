@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import DeleteMany, InsertOne
+
+# ──────────────────────────────────────────────
+# AGREGADOS INCREMENTALES (MapReduce de ingresos y asistencia)
+# `analytics_rollups` guarda parciales por mes (yyyy-MM): por método de pago
+# para `pagos` y por día de la semana para `asistencias`. Cada ejecución lee
+# solo los documentos con _id posterior a la marca de agua guardada en
+# `analytics_rollups_estado`, recalcula únicamente los meses que tocan y
+# mueve la marca. Ediciones o borrados de pagos antiguos no mueven el _id:
+# para eso está la reconstrucción completa (completo=True).
+# ──────────────────────────────────────────────
+
+COLECCION        = "analytics_rollups"
+COLECCION_ESTADO = "analytics_rollups_estado"
+
+INGRESOS   = "ingresos"
+ASISTENCIA = "asistencia"
+
+FUENTES = {
+    INGRESOS:   {"coleccion": "pagos",       "campo_fecha": "fecha_pago"},
+    ASISTENCIA: {"coleccion": "asistencias", "campo_fecha": "fecha"},
+}
+
+# Los ObjectId los genera cada cliente con su reloj: se relee un margen
+# anterior a la marca (recalcular un mes dos veces no cambia el resultado)
+SOLAPE = timedelta(minutes=5)
+
+# $dayOfWeek: 1 = domingo … 7 = sábado. Nombres en inglés como date_format(..., "EEEE")
+DIAS_SEMANA = {1: "Sunday", 2: "Monday", 3: "Tuesday", 4: "Wednesday",
+               5: "Thursday", 6: "Friday", 7: "Saturday"}
+
+
+def _expr_periodo(campo):
+    """yyyy-MM del campo fecha (UTC); None si no es una fecha."""
+    return {"$cond": [
+        {"$eq": [{"$type": f"${campo}"}, "date"]},
+        {"$dateToString": {"format": "%Y-%m", "date": f"${campo}"}},
+        None
+    ]}
+
+
+def _filtro_periodo(campo, periodo):
+    if periodo is None:
+        return {campo: {"$not": {"$type": "date"}}}
+    inicio = datetime.strptime(periodo, "%Y-%m")
+    fin = (inicio + timedelta(days=32)).replace(day=1)
+    return {campo: {"$gte": inicio, "$lt": fin}}
+
+
+def _pipeline_parciales(tipo, match):
+    campo = FUENTES[tipo]["campo_fecha"]
+    if tipo == INGRESOS:
+        return [
+            {"$match": match},
+            {"$project": {
+                "periodo": _expr_periodo(campo),
+                "metodo_pago": 1,
+                "monto": {"$convert": {"input": "$monto", "to": "double", "onError": None, "onNull": None}}
+            }},
+            {"$match": {"monto": {"$ne": None}}},
+            {"$group": {
+                "_id": {"periodo": "$periodo", "metodo_pago": "$metodo_pago"},
+                "total": {"$sum": "$monto"},
+                "num":   {"$sum": 1}
+            }}
+        ]
+    return [
+        {"$match": {"$and": [match, {campo: {"$type": "date"}}]}},
+        {"$group": {
+            "_id": {"periodo": _expr_periodo(campo), "dia": {"$dayOfWeek": f"${campo}"}},
+            "num": {"$sum": 1}
+        }}
+    ]
+
+
+def _doc_parcial(tipo, fila):
+    clave = fila["_id"]
+    doc = {"tipo": tipo, "periodo": clave["periodo"], "num": fila["num"]}
+    if tipo == INGRESOS:
+        doc["metodo_pago"] = clave.get("metodo_pago")
+        doc["total"] = fila["total"]
+    else:
+        doc["dia_semana"] = DIAS_SEMANA.get(clave["dia"])
+    return doc
+
+
+def actualizar(db, tipo, completo=False):
+    """
+    Procesa los documentos nuevos de la fuente de `tipo` y recalcula sus meses.
+    Devuelve la lista de periodos recalculados.
+    """
+    fuente = FUENTES[tipo]
+    origen = db[fuente["coleccion"]]
+    campo = fuente["campo_fecha"]
+
+    estado = None if completo else db[COLECCION_ESTADO].find_one({"_id": tipo})
+    filtro_nuevos = {}
+    if estado and estado.get("marca"):
+        desde = estado["marca"].generation_time - SOLAPE
+        filtro_nuevos = {"_id": {"$gt": ObjectId.from_datetime(desde)}}
+
+    # Meses tocados por los documentos nuevos y el _id más alto visto
+    tocados = list(origen.aggregate([
+        {"$match": filtro_nuevos},
+        {"$group": {"_id": _expr_periodo(campo), "max_id": {"$max": "$_id"}}}
+    ], allowDiskUse=True))
+
+    periodos = [t["_id"] for t in tocados]
+    marcas = [t["max_id"] for t in tocados] + ([estado["marca"]] if estado and estado.get("marca") else [])
+    marca = max(marcas, default=None)
+
+    ops = [DeleteMany({"tipo": tipo})] if completo else []
+    if periodos:
+        match = {"$or": [_filtro_periodo(campo, p) for p in periodos]}
+        parciales = origen.aggregate(_pipeline_parciales(tipo, match), allowDiskUse=True)
+        if not completo:
+            ops.append(DeleteMany({"tipo": tipo, "periodo": {"$in": periodos}}))
+        ops.extend(InsertOne(_doc_parcial(tipo, f)) for f in parciales)
+    if ops:
+        db[COLECCION].bulk_write(ops, ordered=True)
+
+    db[COLECCION_ESTADO].replace_one(
+        {"_id": tipo},
+        {"_id": tipo, "marca": marca, "periodos_recalculados": len(periodos),
+         "completo": bool(completo), "actualizado_en": datetime.now()},
+        upsert=True
+    )
+    return periodos
+
+
+def _orden_periodo(fila):
+    # Periodo nulo primero, como el orderBy de Spark
+    return (fila["periodo"] is not None, fila["periodo"] or "")
+
+
+def ingresos(db):
+    """(detalle por periodo y método, resumen por periodo) desde los parciales."""
+    detalle, resumen = [], {}
+    for p in db[COLECCION].find({"tipo": INGRESOS}, {"_id": 0}):
+        detalle.append({
+            "periodo":        p["periodo"],
+            "metodo_pago":    p.get("metodo_pago"),
+            "total_ingresos": p["total"],
+            "num_pagos":      p["num"],
+            "promedio_pago":  p["total"] / p["num"] if p["num"] else None
+        })
+        r = resumen.setdefault(p["periodo"], {"periodo": p["periodo"], "total_periodo": 0.0, "total_transacciones": 0})
+        r["total_periodo"] += p["total"]
+        r["total_transacciones"] += p["num"]
+
+    detalle.sort(key=lambda f: (*_orden_periodo(f), f["metodo_pago"] is not None, f["metodo_pago"] or ""))
+    return detalle, sorted(resumen.values(), key=_orden_periodo)
+
+
+def asistencia(db):
+    """(visitas por mes, visitas por día de la semana) desde los parciales."""
+    por_mes, por_dia = {}, {}
+    for p in db[COLECCION].find({"tipo": ASISTENCIA}, {"_id": 0}):
+        por_mes[p["periodo"]] = por_mes.get(p["periodo"], 0) + p["num"]
+        por_dia[p["dia_semana"]] = por_dia.get(p["dia_semana"], 0) + p["num"]
+
+    meses = sorted(
+        ({"periodo": k, "total_visitas": v} for k, v in por_mes.items()), key=_orden_periodo
+    )
+    dias = sorted(
+        ({"dia_semana": k, "total_visitas": v} for k, v in por_dia.items()),
+        key=lambda f: f["total_visitas"], reverse=True
+    )
+    return meses, dias
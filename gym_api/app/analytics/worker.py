@@ -0,0 +1,68 @@
+"""
+Worker de analítica: proceso aparte que atiende la cola `analytics_jobs`.
+
+Es el único proceso que levanta la SparkSession (cuando el motor elegido es
+Spark), así los workers web no cargan la JVM ni quedan ocupados durante un
+entrenamiento. Los resultados se escriben en analytics_cache con las mismas
+claves que leen los endpoints GET.
+
+Uso (desde gym_api/):
+    python -m app.analytics.worker
+"""
+import time
+import traceback
+
+from app.mongo import get_db
+from app.analytics import cola
+
+INTERVALO_SEGUNDOS = 2
+MINUTOS_HUERFANO = 30
+
+
+def _tareas():
+    # Import diferido: los módulos de rutas se cargan solo en el worker que los usa
+    from app.routes import spark_kmeans, spark_mapreduce, spark_regresion
+    return {
+        "kmeans":    lambda p: spark_kmeans.reentrenar(
+            int(p.get("k", 3)), int(p.get("max_iter", 20)), bool(p.get("mini_batch"))
+        ),
+        "kmeans_barrido": lambda p: spark_kmeans.reentrenar_barrido(
+            int(p.get("k_min", 2)), int(p.get("k_max", 10)), int(p.get("max_iter", 20)), bool(p.get("mini_batch"))
+        ),
+        "mapreduce": lambda p: spark_mapreduce.reentrenar(bool(p.get("completo"))),
+        "regresion": lambda p: spark_regresion.reentrenar(),
+        "predicciones": lambda p: spark_regresion.precalcular(),
+    }
+
+
+def ejecutar(db, job, tareas):
+    tarea = tareas.get(job["tipo"])
+    if tarea is None:
+        cola.fallar(db, job["_id"], f"Tipo de trabajo desconocido: {job['tipo']}")
+        return
+    try:
+        cache_key, mensaje = tarea(job.get("params") or {})
+        cola.completar(db, job["_id"], cache_key, mensaje)
+        print(f"✅ [{job['tipo']}] {mensaje}")
+    except Exception as e:
+        traceback.print_exc()
+        cola.fallar(db, job["_id"], e)
+
+
+def main():
+    db = get_db()
+    tareas = _tareas()
+    print(f"🧮 Worker de analítica escuchando '{cola.COLECCION}'...")
+
+    while True:
+        cola.recuperar_huerfanos(db, MINUTOS_HUERFANO)
+        job = cola.tomar_siguiente(db)
+        if job is None:
+            time.sleep(INTERVALO_SEGUNDOS)
+            continue
+        print(f"⏳ [{job['tipo']}] trabajo {job['_id']} (intento {job['intentos']})")
+        ejecutar(db, job, tareas)
+
+
+if __name__ == "__main__":
+    main()
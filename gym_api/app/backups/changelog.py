@@ -0,0 +1,329 @@
+"""
+Change log de respaldos: copia local de los change streams de la base de datos.
+
+Cada sincronización reanuda `db.watch()` desde el resume token guardado,
+vuelca los eventos pendientes (inserciones, actualizaciones, reemplazos,
+borrados y colecciones eliminadas) en segmentos NDJSON numerados con una
+secuencia global y persiste el token. Los respaldos guardan la secuencia
+como marca: un incremental o diferencial reproduce exactamente los cambios
+posteriores a su marca, borrados incluidos, compactados a la última
+operación de cada documento.
+
+Los respaldos sincronizan por su cuenta antes de leer el log; este proceso
+opcional lo mantiene al día para no depender de la ventana del oplog entre
+un respaldo y el siguiente.
+
+Uso (desde gym_api/):
+    python -m app.backups.changelog
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from bson import json_util
+from pymongo.errors import OperationFailure
+
+from app.backups import ndjson, pipeline
+from app.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializa dentro del proceso
+    fcntl = None
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+CHANGELOG_DIR = os.path.join(BASE_DIR, "storage", "backups", "changelog")
+ESTADO_FILE = os.path.join(CHANGELOG_DIR, "estado.json")
+LOCK_FILE = os.path.join(CHANGELOG_DIR, ".lock")
+
+MAX_EVENTOS_SEGMENTO = 100000
+ESPERA_MS = 1000
+
+# Marcas que guardan los respaldos
+MARCA_FULL = "full"
+MARCA_ULTIMO = "ultimo"
+
+# Operaciones del log
+UPSERT = "upsert"
+DELETE = "delete"
+DROP = "drop"
+
+# Resume token fuera del oplog / stream invalidado: hay que volver a empezar con un full
+_CODIGOS_CONTINUIDAD = {260, 280, 286}
+
+_lock = threading.Lock()
+
+
+class ContinuidadPerdida(Exception):
+    """El change log ya no cubre todos los cambios desde su última posición."""
+
+
+# ──────────────────────────────────────────────
+# ESTADO
+# ──────────────────────────────────────────────
+
+@contextmanager
+def _bloqueo():
+    """Un solo sincronizador a la vez (hilos del proceso y, con fcntl, otros procesos)."""
+    os.makedirs(CHANGELOG_DIR, exist_ok=True)
+    with _lock:
+        with open(LOCK_FILE, "w") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def cargar_estado():
+    if not os.path.exists(ESTADO_FILE):
+        return {"token": None, "seq": 0, "segmentos": [], "marcas": {}}
+    with open(ESTADO_FILE, "r", encoding="utf-8") as f:
+        return json_util.loads(f.read())
+
+
+def _guardar_estado(estado):
+    estado["actualizado_en"] = datetime.now().isoformat()
+    temporal = ESTADO_FILE + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps(estado, indent=2))
+    os.replace(temporal, ESTADO_FILE)
+
+
+def marca(nombre):
+    """Secuencia guardada por el último respaldo de ese tipo, o None."""
+    return cargar_estado().get("marcas", {}).get(nombre)
+
+
+def marcar(nombre, seq):
+    with _bloqueo():
+        estado = cargar_estado()
+        estado.setdefault("marcas", {})[nombre] = seq
+        _guardar_estado(estado)
+
+
+def podar(seq):
+    """Borra los segmentos que ya no necesita ningún respaldo (todo lo anterior a `seq`)."""
+    with _bloqueo():
+        estado = cargar_estado()
+        vigentes = []
+        for segmento in estado["segmentos"]:
+            if segmento["seq_max"] <= seq:
+                ruta = os.path.join(CHANGELOG_DIR, segmento["archivo"])
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            else:
+                vigentes.append(segmento)
+        estado["segmentos"] = vigentes
+        _guardar_estado(estado)
+
+
+# ──────────────────────────────────────────────
+# SINCRONIZACIÓN
+# ──────────────────────────────────────────────
+
+def _evento(cambio, seq):
+    """Evento del log para un cambio del stream, o None si no afecta a los datos."""
+    tipo = cambio["operationType"]
+    if tipo in ("invalidate", "dropDatabase"):
+        raise ContinuidadPerdida(f"Change stream invalidado ({tipo})")
+
+    coll = cambio.get("ns", {}).get("coll")
+    evento = {"seq": seq, "coll": coll, "ts": cambio.get("clusterTime")}
+    if tipo in ("insert", "update", "replace"):
+        # Con updateLookup, fullDocument es el documento vigente (None si ya se borró:
+        # el borrado llegará como su propio evento)
+        evento.update(op=UPSERT, _id=cambio["documentKey"]["_id"], doc=cambio.get("fullDocument"))
+    elif tipo == "delete":
+        evento.update(op=DELETE, _id=cambio["documentKey"]["_id"])
+    elif tipo in ("drop", "rename"):
+        # Un rename se registra como baja del origen; el destino lo cubre el siguiente full
+        evento.update(op=DROP)
+    else:
+        return None
+    return evento
+
+
+def _abrir_stream(db, token=None):
+    # Sin las colecciones que no se respaldan (progreso de backup_jobs, caché de analítica...)
+    excluir = [{"$match": {"ns.coll": {"$nin": list(pipeline.COLECCIONES_EXCLUIDAS)}}}]
+    return db.watch(excluir, full_document="updateLookup", resume_after=token, max_await_time_ms=ESPERA_MS)
+
+
+def _segmento(seq_min):
+    return f"cambios_{seq_min:012d}{ndjson.EXTENSIONES['gzip']}"
+
+
+def sincronizar(db):
+    """
+    Vuelca en el log los cambios pendientes desde el token guardado y devuelve
+    la secuencia alcanzada. ContinuidadPerdida si no hay token o ya no es válido.
+    """
+    with _bloqueo():
+        estado = cargar_estado()
+        if not estado.get("token"):
+            raise ContinuidadPerdida("El change log no está iniciado: ejecute un respaldo completo")
+
+        try:
+            with _abrir_stream(db, estado["token"]) as stream:
+                while True:
+                    seq_min = estado["seq"] + 1
+                    archivo = _segmento(seq_min)
+                    colecciones, cambio = {}, None
+                    with ndjson.EscritorNDJSON(os.path.join(CHANGELOG_DIR, archivo)) as escritor:
+                        while escritor.documentos < MAX_EVENTOS_SEGMENTO:
+                            cambio = stream.try_next()
+                            if cambio is None:
+                                break
+                            evento = _evento(cambio, estado["seq"] + 1)
+                            if evento is None:
+                                continue
+                            escritor.escribir(evento)
+                            estado["seq"] = evento["seq"]
+                            colecciones[evento["coll"]] = colecciones.get(evento["coll"], 0) + 1
+                        entrada = escritor.cerrar()
+
+                    if entrada["documentos"]:
+                        estado["segmentos"].append({
+                            "archivo": archivo, "seq_min": seq_min, "seq_max": estado["seq"],
+                            "colecciones": colecciones, "sha256": entrada["sha256"]
+                        })
+                    else:
+                        os.remove(os.path.join(CHANGELOG_DIR, archivo))
+
+                    # El token se guarda con el segmento: si el proceso cae antes,
+                    # la próxima sincronización reescribe el mismo segmento
+                    estado["token"] = stream.resume_token
+                    _guardar_estado(estado)
+                    if cambio is None:
+                        break
+
+        except OperationFailure as e:
+            if e.code in _CODIGOS_CONTINUIDAD:
+                raise ContinuidadPerdida(f"El resume token ya no es válido: {e}")
+            raise
+
+        return estado["seq"]
+
+
+def iniciar(db):
+    """
+    Posición de partida para un respaldo completo: sincroniza si el log está
+    al día o, si no hay token o se perdió la continuidad, descarta el log y
+    abre un stream nuevo. Devuelve la secuencia que el full guardará como marca.
+    """
+    try:
+        return sincronizar(db)
+    except ContinuidadPerdida as e:
+        print(f"[changelog] {e}. Se reinicia el change log.")
+
+    with _bloqueo():
+        estado = cargar_estado()
+        for segmento in estado["segmentos"]:
+            ruta = os.path.join(CHANGELOG_DIR, segmento["archivo"])
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        with _abrir_stream(db) as stream:
+            # postBatchResumeToken del aggregate inicial: la posición actual del oplog
+            estado.update(token=stream.resume_token, segmentos=[], marcas={})
+        estado["iniciado_en"] = datetime.now().isoformat()
+        _guardar_estado(estado)
+        return estado["seq"]
+
+
+# ──────────────────────────────────────────────
+# LECTURA (respaldos incrementales y diferenciales)
+# ──────────────────────────────────────────────
+
+def _clave(doc_id):
+    # Los _id pueden ser subdocumentos (no hashables)
+    return json_util.dumps(doc_id)
+
+
+class Compactacion:
+    """
+    Cambios con secuencia en (desde, hasta] reducidos a la última operación de
+    cada documento. La primera pasada guarda solo {clave: seq} por colección;
+    `fuente(coll)` relee los segmentos de esa colección y emite lo vigente.
+    """
+
+    def __init__(self, desde, hasta):
+        self.desde = desde
+        self.hasta = hasta
+        self.segmentos = [
+            s for s in cargar_estado()["segmentos"]
+            if s["seq_max"] > desde and s["seq_min"] <= hasta
+        ]
+        self.ultimo = {}
+        self.vaciado = {}
+        for evento in self._eventos():
+            coll = evento["coll"]
+            if evento["op"] == DROP:
+                self.vaciado[coll] = evento["seq"]
+                self.ultimo[coll] = {}
+            else:
+                self.ultimo.setdefault(coll, {})[_clave(evento["_id"])] = evento["seq"]
+
+    @property
+    def colecciones(self):
+        return sorted(set(self.ultimo) | set(self.vaciado))
+
+    def _eventos(self, coll=None):
+        for segmento in self.segmentos:
+            if coll is not None and coll not in segmento["colecciones"]:
+                continue
+            for evento in ndjson.leer_documentos(os.path.join(CHANGELOG_DIR, segmento["archivo"])):
+                if self.desde < evento["seq"] <= self.hasta and (coll is None or evento["coll"] == coll):
+                    yield evento
+
+    def fuente(self, coll):
+        """Fuente para app/backups/pipeline.py: (operación, valor) de la colección."""
+        if coll in self.vaciado:
+            yield pipeline.VACIADO, None
+        ultimos = self.ultimo.get(coll, {})
+        for evento in self._eventos(coll):
+            if evento["op"] == DROP or ultimos.get(_clave(evento["_id"])) != evento["seq"]:
+                continue
+            if evento["op"] == DELETE:
+                yield pipeline.ELIMINADO, evento["_id"]
+            elif evento.get("doc") is not None:
+                yield pipeline.DOCUMENTO, evento["doc"]
+
+    def resumen(self):
+        return {
+            "desde": self.desde,
+            "hasta": self.hasta,
+            "segmentos": len(self.segmentos),
+            "documentos": sum(len(v) for v in self.ultimo.values()),
+            "vaciadas": sorted(self.vaciado)
+        }
+
+
+# ──────────────────────────────────────────────
+# PROCESO DE SEGUIMIENTO
+# ──────────────────────────────────────────────
+
+def main():
+    from app.mongo import get_db
+
+    db = get_db()
+    print(f"📼 Change log de respaldos en '{CHANGELOG_DIR}' (cada {Config.BACKUP_CHANGELOG_INTERVALO}s)...")
+    ultimo_seq = None
+    while True:
+        try:
+            seq = sincronizar(db)
+            if seq != ultimo_seq:
+                print(f"[changelog] al día en seq {seq}")
+                ultimo_seq = seq
+        except ContinuidadPerdida as e:
+            print(f"[changelog] {e}")
+        except Exception as e:
+            print(f"[changelog] Error sincronizando: {e}")
+        time.sleep(Config.BACKUP_CHANGELOG_INTERVALO)
+
+
+if __name__ == "__main__":
+    main()
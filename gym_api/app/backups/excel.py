@@ -0,0 +1,160 @@
+import threading
+from datetime import datetime
+from bson import json_util
+from bson.objectid import ObjectId
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+# ──────────────────────────────────────────────
+# EXCEL EN STREAMING (openpyxl write-only)
+# Una hoja por colección: las filas se vuelcan por lotes a los archivos
+# temporales del workbook write-only, sin DataFrame ni documentos en memoria.
+# Los subdocumentos se aplanan en columnas con punto (medidas.cintura); las
+# listas y lo que no admite una celda va como Extended JSON.
+#
+# Esquema estable: las columnas salen de los primeros MUESTRA_ESQUEMA
+# documentos (_id primero) y no cambian después; los campos que aparezcan
+# más tarde van juntos, en JSON, en la columna COLUMNA_EXTRA.
+# Las colecciones que superan el límite de filas de Excel continúan en
+# hojas <coleccion>_2, <coleccion>_3... con la misma cabecera.
+# ──────────────────────────────────────────────
+
+MAX_FILAS_HOJA   = 1048576   # límite de Excel, cabecera incluida
+MAX_LARGO_CELDA  = 32767
+MAX_NOMBRE_HOJA  = 31
+MUESTRA_ESQUEMA  = 1000
+LOTE_FILAS       = 500
+COLUMNA_EXTRA    = "_otros"
+HOJA_VACIA       = "sin_datos"
+
+
+def aplanar(doc, prefijo="", fila=None):
+    """{"a": {"b": 1}} → {"a.b": 1}. Los subdocumentos vacíos y las listas se dejan como valor."""
+    fila = {} if fila is None else fila
+    for clave, valor in doc.items():
+        nombre = f"{prefijo}{clave}"
+        if isinstance(valor, dict) and valor:
+            aplanar(valor, f"{nombre}.", fila)
+        else:
+            fila[nombre] = valor
+    return fila
+
+
+def _texto(valor):
+    valor = ILLEGAL_CHARACTERS_RE.sub("", valor)
+    return valor[:MAX_LARGO_CELDA]
+
+
+def celda(valor):
+    """Valor admitido por openpyxl para una celda."""
+    if valor is None or isinstance(valor, (bool, int, float)):
+        return valor
+    if isinstance(valor, datetime):
+        # Excel no guarda zona horaria
+        return valor.replace(tzinfo=None) if valor.tzinfo else valor
+    if isinstance(valor, str):
+        return _texto(valor)
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, (dict, list)):
+        return _texto(json_util.dumps(valor))
+    return _texto(str(valor))
+
+
+class LibroExcel:
+    """Salida Excel del pipeline de respaldo (app/backups/pipeline.py)."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._libro = Workbook(write_only=True)
+        # Crear hojas y añadir filas toca estado compartido del workbook
+        self._lock = threading.Lock()
+
+    def coleccion(self, coll):
+        return _HojaColeccion(self, coll)
+
+    def finalizar(self):
+        with self._lock:
+            if not self._libro.worksheets:
+                # Un workbook sin hojas no se puede guardar (p. ej. incremental sin cambios)
+                self._libro.create_sheet(title=HOJA_VACIA).append(["Sin registros en este respaldo"])
+            self._libro.save(self.ruta)
+        return self.ruta
+
+
+class _HojaColeccion:
+    def __init__(self, libro, coll):
+        self._libro = libro
+        self._coll = coll
+        self._muestra = []
+        self._columnas = None
+        self._conocidas = None
+        self._pendientes = []
+        self._hojas = []
+        self._filas_hoja = 0
+
+    def escribir(self, doc):
+        fila = aplanar(doc)
+        if self._columnas is None:
+            self._muestra.append(fila)
+            if len(self._muestra) >= MUESTRA_ESQUEMA:
+                self._fijar_esquema()
+            return
+        self._agregar(fila)
+
+    def _fijar_esquema(self):
+        columnas = {"_id": None} if any("_id" in f for f in self._muestra) else {}
+        for fila in self._muestra:
+            for clave in fila:
+                columnas.setdefault(clave, None)
+        self._columnas = list(columnas)
+        self._conocidas = set(columnas)
+
+        muestra, self._muestra = self._muestra, []
+        for fila in muestra:
+            self._agregar(fila)
+
+    def _agregar(self, fila):
+        valores = [celda(fila.get(c)) for c in self._columnas]
+        extra = {k: v for k, v in fila.items() if k not in self._conocidas}
+        valores.append(celda(extra) if extra else None)
+        self._pendientes.append(valores)
+        if len(self._pendientes) >= LOTE_FILAS:
+            self._volcar()
+
+    def _nueva_hoja(self):
+        parte = len(self._hojas) + 1
+        if parte == 1:
+            titulo = self._coll[:MAX_NOMBRE_HOJA]
+        else:
+            sufijo = f"_{parte}"
+            titulo = f"{self._coll[:MAX_NOMBRE_HOJA - len(sufijo)]}{sufijo}"
+        hoja = self._libro._libro.create_sheet(title=titulo)
+        hoja.append(self._columnas + [COLUMNA_EXTRA])
+        self._hojas.append(hoja)
+        self._filas_hoja = 1
+
+    def _volcar(self):
+        if not self._pendientes:
+            return
+        with self._libro._lock:
+            for valores in self._pendientes:
+                if not self._hojas or self._filas_hoja >= MAX_FILAS_HOJA:
+                    self._nueva_hoja()
+                self._hojas[-1].append(valores)
+                self._filas_hoja += 1
+        self._pendientes = []
+
+    def cerrar(self):
+        if self._columnas is None:
+            if not self._muestra:
+                return
+            self._fijar_esquema()
+        self._volcar()
+
+    def descartar(self):
+        self._muestra, self._pendientes = [], []
+        with self._libro._lock:
+            for hoja in self._hojas:
+                self._libro._libro.remove(hoja)
+        self._hojas = []
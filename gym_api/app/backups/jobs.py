@@ -0,0 +1,298 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.config import Config
+
+# ──────────────────────────────────────────────
+# TRABAJOS DE RESPALDO (colección backup_jobs)
+# Cada respaldo es un documento con su estado, progreso, pasos con tiempos,
+# progreso por colección, bytes escritos y throughput; /api/backups/status
+# lo lee de Mongo, así todos los workers de gunicorn ven lo mismo.
+#
+# Un solo respaldo a la vez: el documento `backup_jobs_lock` {_id: "backup"}
+# se toma con un find_one_and_update con upsert (atómico: si otro lo tiene,
+# el upsert choca con el _id y se recibe DuplicateKeyError). Mientras corre,
+# un hilo renueva el latido; un lock sin latido durante
+# BACKUP_MINUTOS_HUERFANO (el proceso murió) se puede volver a tomar.
+# ──────────────────────────────────────────────
+
+COLECCION = "backup_jobs"
+COLECCION_LOCK = "backup_jobs_lock"
+LOCK_ID = "backup"
+
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR      = "error"
+
+INTERVALO_LATIDO = 30
+# Mínimo entre dos escrituras de progreso por colección (los pasos se escriben siempre)
+INTERVALO_PROGRESO = 1.0
+
+
+def _worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _tomar_lock(db, job_id):
+    """True si el lock quedó para `job_id`. Si estaba huérfano, marca como error al trabajo anterior."""
+    ahora = datetime.now()
+    limite = ahora - timedelta(minutes=Config.BACKUP_MINUTOS_HUERFANO)
+    try:
+        anterior = db[COLECCION_LOCK].find_one_and_update(
+            {"_id": LOCK_ID, "$or": [{"job_id": None}, {"latido": {"$lt": limite}}]},
+            {"$set": {"job_id": job_id, "desde": ahora, "latido": ahora, "worker": _worker()}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        return False
+
+    if anterior and anterior.get("job_id"):
+        db[COLECCION].update_one(
+            {"_id": anterior["job_id"], "estado": EN_PROCESO},
+            {"$set": {"estado": ERROR, "fecha_fin": ahora, "error": "El proceso del respaldo no terminó"}}
+        )
+    return True
+
+
+def liberar_lock(db, job_id):
+    db[COLECCION_LOCK].update_one({"_id": LOCK_ID, "job_id": job_id}, {"$set": {"job_id": None}})
+
+
+def crear(db, job_id, tipo):
+    """
+    Toma el lock y registra el trabajo. Devuelve (job, True), o (trabajo en
+    curso, False) si ya hay un respaldo corriendo.
+    """
+    if not _tomar_lock(db, job_id):
+        lock = db[COLECCION_LOCK].find_one({"_id": LOCK_ID}) or {}
+        return obtener(db, lock.get("job_id")), False
+
+    ahora = datetime.now()
+    job = {
+        "_id": job_id,
+        "tipo": tipo,
+        "estado": EN_PROCESO,
+        "progreso": 0,
+        "paso_actual": "En cola",
+        "fecha_creacion": ahora,
+        "fecha_inicio": None,
+        "fecha_fin": None,
+        "latido": ahora,
+        "worker": _worker(),
+        "pasos": [],
+        "colecciones": {},
+        "documentos": 0,
+        "bytes_escritos": 0,
+        "archivos": {},
+        "error": None
+    }
+    db[COLECCION].insert_one(job)
+    return job, True
+
+
+def obtener(db, job_id):
+    if not job_id:
+        return None
+    return db[COLECCION].find_one({"_id": job_id})
+
+
+def actual(db):
+    """El trabajo en curso o, si no hay, el más reciente."""
+    return (
+        db[COLECCION].find_one({"estado": EN_PROCESO}, sort=[("fecha_creacion", DESCENDING)])
+        or db[COLECCION].find_one({}, sort=[("fecha_creacion", DESCENDING)])
+    )
+
+
+def ultimo_completado(db):
+    return db[COLECCION].find_one({"estado": COMPLETADO}, sort=[("fecha_fin", DESCENDING)])
+
+
+def listar(db, limite=20, tipo=None, estado=None):
+    filtro = {}
+    if tipo:
+        filtro["tipo"] = tipo
+    if estado:
+        filtro["estado"] = estado
+    return list(db[COLECCION].find(filtro, {"colecciones": 0}).sort("fecha_creacion", DESCENDING).limit(limite))
+
+
+def en_curso(db):
+    lock = db[COLECCION_LOCK].find_one({"_id": LOCK_ID})
+    return bool(lock and lock.get("job_id"))
+
+
+def to_dict(job, detalle=True):
+    """Representación JSON del trabajo; sin `detalle` omite colecciones y pasos."""
+    def _iso(valor):
+        return valor.isoformat() if valor else None
+
+    def _mb_s(n, segundos):
+        return round(n / (1024 * 1024) / segundos, 3) if segundos else None
+
+    inicio, fin = job.get("fecha_inicio"), job.get("fecha_fin")
+    segundos = ((fin or datetime.now()) - inicio).total_seconds() if inicio else None
+    bytes_escritos = job.get("bytes_escritos", 0)
+
+    resultado = {
+        "job_id": job["_id"],
+        "tipo": job.get("tipo"),
+        "estado": job.get("estado"),
+        "progreso": job.get("progreso", 0),
+        "paso_actual": job.get("paso_actual"),
+        "fecha_creacion": _iso(job.get("fecha_creacion")),
+        "fecha_inicio": _iso(inicio),
+        "fecha_fin": _iso(fin),
+        "latido": _iso(job.get("latido")),
+        "worker": job.get("worker"),
+        "duracion_segundos": round(segundos, 1) if segundos is not None else None,
+        "documentos": job.get("documentos", 0),
+        "bytes_escritos": bytes_escritos,
+        "throughput_mb_s": _mb_s(bytes_escritos, segundos),
+        "documentos_por_segundo": (
+            round(job.get("documentos", 0) / segundos, 1) if segundos else None
+        ),
+        "archivos": job.get("archivos", {}),
+        "error": job.get("error")
+    }
+    if detalle:
+        resultado["pasos"] = [
+            {
+                **p,
+                "inicio": _iso(p.get("inicio")),
+                "fin": _iso(p.get("fin")),
+                "throughput_mb_s": _mb_s(p.get("bytes", 0), p.get("segundos"))
+            }
+            # Los pasos concurrentes (mongodump) se registran al terminar: orden por inicio
+            for p in sorted(job.get("pasos", []), key=lambda p: p["inicio"])
+        ]
+        resultado["colecciones"] = job.get("colecciones", {})
+    return resultado
+
+
+class SeguimientoJob:
+    """
+    Registra el avance de un respaldo en su documento de backup_jobs: pasos
+    secuenciales con tiempos y bytes, pasos concurrentes (mongodump) y el
+    progreso por colección que llega desde los hilos del pipeline.
+    """
+
+    def __init__(self, db, job_id):
+        self.db = db
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._paso = None
+        self._ultima_escritura = 0
+        self._colecciones = {}
+        self._terminadas = set()
+        self._rango = (0, 100)
+        self._fin = threading.Event()
+        self._latido = threading.Thread(target=self._latir, daemon=True)
+
+    def _set(self, campos):
+        self.db[COLECCION].update_one({"_id": self.job_id}, {"$set": campos})
+
+    def _latir(self):
+        while not self._fin.wait(INTERVALO_LATIDO):
+            ahora = datetime.now()
+            try:
+                self.db[COLECCION_LOCK].update_one({"_id": LOCK_ID, "job_id": self.job_id}, {"$set": {"latido": ahora}})
+                self._set({"latido": ahora})
+            except Exception as e:
+                print(f"[backup jobs] Error renovando el latido: {e}")
+
+    def iniciar(self):
+        self._set({"fecha_inicio": datetime.now(), "worker": _worker()})
+        self._latido.start()
+
+    def _cerrar_paso(self, ahora):
+        if self._paso is None:
+            return
+        paso, self._paso = self._paso, None
+        paso["fin"] = ahora
+        paso["segundos"] = round((ahora - paso["inicio"]).total_seconds(), 3)
+        self.db[COLECCION].update_one({"_id": self.job_id}, {"$push": {"pasos": paso}})
+
+    def paso(self, nombre, progreso=None):
+        """Cierra el paso anterior (con su duración) y abre `nombre`."""
+        with self._lock:
+            ahora = datetime.now()
+            self._cerrar_paso(ahora)
+            self._paso = {"nombre": nombre, "inicio": ahora, "bytes": 0}
+            campos = {"paso_actual": nombre, "latido": ahora}
+            if progreso is not None:
+                campos["progreso"] = progreso
+            self._set(campos)
+
+    def bytes_paso(self, n):
+        """Bytes escritos por el paso actual (se suman al total del trabajo)."""
+        with self._lock:
+            if self._paso is not None:
+                self._paso["bytes"] += n
+            self.db[COLECCION].update_one({"_id": self.job_id}, {"$inc": {"bytes_escritos": n}})
+
+    def registrar_paso(self, nombre, inicio, fin, bytes_escritos=0):
+        """Paso que corrió en paralelo a los demás (p. ej. mongodump)."""
+        with self._lock:
+            paso = {
+                "nombre": nombre, "inicio": inicio, "fin": fin, "bytes": bytes_escritos,
+                "segundos": round((fin - inicio).total_seconds(), 3)
+            }
+            self.db[COLECCION].update_one(
+                {"_id": self.job_id},
+                {"$push": {"pasos": paso}, "$inc": {"bytes_escritos": bytes_escritos}}
+            )
+
+    def colecciones(self, nombres, estado, desde, hasta):
+        """Colecciones del pipeline; el progreso avanza de `desde` a `hasta` según las terminadas."""
+        with self._lock:
+            self._colecciones = {c: {"estado": estado, "documentos": 0} for c in nombres}
+            self._terminadas = set()
+            self._rango = (desde, hasta)
+            self._set({"colecciones": dict(self._colecciones), "progreso": desde})
+
+    def coleccion(self, coll, estado, documentos, terminada=False):
+        """
+        Progreso de una colección (hilos del pipeline). Los avances parciales se
+        escriben como mucho una vez por segundo; el fin de una colección, siempre.
+        """
+        with self._lock:
+            self._colecciones[coll] = {"estado": estado, "documentos": documentos}
+            ahora = time.time()
+            if not terminada and ahora - self._ultima_escritura < INTERVALO_PROGRESO:
+                return
+            self._ultima_escritura = ahora
+            if terminada:
+                self._terminadas.add(coll)
+            desde, hasta = self._rango
+            self._set({
+                "colecciones": dict(self._colecciones),
+                "documentos": sum(c["documentos"] for c in self._colecciones.values()),
+                "progreso": desde + int((hasta - desde) * len(self._terminadas) / len(self._colecciones))
+            })
+
+    def progreso(self, porcentaje):
+        self._set({"progreso": porcentaje})
+
+    def _terminar(self, campos):
+        self._fin.set()
+        with self._lock:
+            ahora = datetime.now()
+            self._cerrar_paso(ahora)
+            if self._colecciones:
+                campos["colecciones"] = dict(self._colecciones)
+                campos["documentos"] = sum(c["documentos"] for c in self._colecciones.values())
+            self._set({**campos, "fecha_fin": ahora, "latido": ahora})
+
+    def completar(self, archivos):
+        self._terminar({"estado": COMPLETADO, "progreso": 100, "paso_actual": "Completado",
+                        "archivos": archivos, "error": None})
+
+    def fallar(self, error):
+        self._terminar({"estado": ERROR, "paso_actual": f"Error: {error}", "error": str(error)})
@@ -0,0 +1,288 @@
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from bson import json_util
+
+# ──────────────────────────────────────────────
+# RESPALDO JSON EN STREAMING (NDJSON)
+# Un archivo por colección con un documento Extended JSON por línea,
+# comprimido con gzip (o zstd si está instalado `zstandard`), y un
+# manifiesto <prefijo>.manifest.json con conteos, bytes y sha256 de cada
+# archivo. Los documentos llegan del pipeline de respaldo, que recorre los
+# cursores por lotes (batch_size): la memoria no depende del tamaño de la
+# base de datos.
+#
+#   <tipo>/backup_full_<ts>.manifest.json
+#   <tipo>/backup_full_<ts>/backup_full_<ts>.<coleccion>.ndjson.gz
+# ──────────────────────────────────────────────
+
+FORMATO = "ndjson"
+VERSION_MANIFIESTO = 1
+SUFIJO_MANIFIESTO = ".manifest.json"
+
+EXTENSIONES = {
+    "gzip": ".ndjson.gz",
+    "zstd": ".ndjson.zst",
+    "none": ".ndjson",
+}
+
+BLOQUE_LECTURA = 1024 * 1024
+
+
+def zstd_disponible():
+    return importlib.util.find_spec("zstandard") is not None
+
+
+def resolver_compresion(compresion):
+    """Compresión efectiva: zstd cae a gzip si falta el paquete; valores desconocidos también."""
+    compresion = (compresion or "gzip").lower()
+    if compresion == "zstd" and not zstd_disponible():
+        print("[backup ndjson] zstandard no está instalado, se usa gzip")
+        return "gzip"
+    return compresion if compresion in EXTENSIONES else "gzip"
+
+
+def es_manifiesto(ruta):
+    return ruta.endswith(SUFIJO_MANIFIESTO)
+
+
+class _SalidaContada:
+    """Envuelve el archivo en disco: cuenta los bytes comprimidos y calcula su sha256."""
+
+    def __init__(self, archivo):
+        self._archivo = archivo
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, datos):
+        self.sha256.update(datos)
+        self.bytes += len(datos)
+        return self._archivo.write(datos)
+
+    def flush(self):
+        self._archivo.flush()
+
+
+class EscritorNDJSON:
+    """Escribe documentos de una colección, uno por línea, sin acumularlos en memoria."""
+
+    def __init__(self, ruta, compresion="gzip"):
+        self.ruta = ruta
+        self.compresion = compresion
+        self.documentos = 0
+        self._archivo = open(ruta, "wb")
+        self._contada = _SalidaContada(self._archivo)
+
+        if compresion == "gzip":
+            # mtime=0: el mismo contenido produce el mismo sha256
+            self._salida = gzip.GzipFile(fileobj=self._contada, mode="wb", mtime=0)
+        elif compresion == "zstd":
+            import zstandard
+            self._salida = zstandard.ZstdCompressor().stream_writer(self._contada, closefd=False)
+        else:
+            self._salida = self._contada
+
+    def escribir(self, doc):
+        self._salida.write(json_util.dumps(doc).encode("utf-8") + b"\n")
+        self.documentos += 1
+
+    def cerrar(self):
+        """Cierra el archivo y devuelve su entrada del manifiesto."""
+        if self._salida is not self._contada:
+            self._salida.close()
+        self._archivo.close()
+        return {
+            "documentos": self.documentos,
+            "bytes": self._contada.bytes,
+            "sha256": self._contada.sha256.hexdigest()
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self._archivo.closed:
+            self.cerrar()
+
+
+def _abrir_lectura(ruta):
+    if ruta.endswith(EXTENSIONES["gzip"]):
+        return gzip.open(ruta, "rb")
+    if ruta.endswith(EXTENSIONES["zstd"]):
+        import zstandard
+        lector = zstandard.ZstdDecompressor().stream_reader(open(ruta, "rb"), closefd=True)
+        return io.BufferedReader(lector)
+    return open(ruta, "rb")
+
+
+def leer_documentos(ruta):
+    """Itera los documentos de un archivo NDJSON línea a línea."""
+    with _abrir_lectura(ruta) as f:
+        for linea in f:
+            if linea.strip():
+                yield json_util.loads(linea)
+
+
+def sha256_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE_LECTURA), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+# ──────────────────────────────────────────────
+# EXPORTACIÓN / MANIFIESTO
+# ──────────────────────────────────────────────
+
+class RespaldoNDJSON:
+    """
+    Salida NDJSON del pipeline de respaldo (app/backups/pipeline.py): un
+    escritor por colección, que puede correr en su propio hilo, y el
+    manifiesto al finalizar.
+    """
+
+    def __init__(self, directorio, prefijo, tipo=None, desde=None, compresion="gzip", extra=None):
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.tipo = tipo
+        self.desde = desde
+        # Metadatos adicionales del manifiesto (origen de los cambios, marcas del change log...)
+        self.extra = extra or {}
+        self.compresion = resolver_compresion(compresion)
+        # Un full registra también las colecciones vacías: al restaurar con drop
+        # el manifiesto dice qué colecciones existían aunque no tengan archivo
+        self.registrar_vacias = tipo == "full"
+        self.carpeta = os.path.join(directorio, prefijo)
+        self._colecciones = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.carpeta, exist_ok=True)
+
+    def coleccion(self, coll):
+        return _EscritorColeccion(self, coll)
+
+    def _registrar(self, coll, entrada):
+        with self._lock:
+            self._colecciones[coll] = entrada
+
+    def finalizar(self):
+        """Escribe el manifiesto y devuelve (ruta del manifiesto, manifiesto)."""
+        colecciones = {c: self._colecciones[c] for c in sorted(self._colecciones)}
+        manifiesto = {
+            "formato": FORMATO,
+            "version": VERSION_MANIFIESTO,
+            "tipo": self.tipo,
+            "creado_en": datetime.now().isoformat(),
+            "desde": self.desde,
+            **self.extra,
+            "compresion": self.compresion,
+            "total_documentos": sum(c["documentos"] for c in colecciones.values()),
+            "total_eliminados": sum(c.get("eliminados", {}).get("documentos", 0) for c in colecciones.values()),
+            "total_bytes": sum(c["bytes"] + c.get("eliminados", {}).get("bytes", 0) for c in colecciones.values()),
+            "colecciones": colecciones
+        }
+
+        ruta_manifiesto = os.path.join(self.directorio, f"{self.prefijo}{SUFIJO_MANIFIESTO}")
+        # Se escribe al final y de forma atómica: un manifiesto presente implica archivos completos
+        temporal = ruta_manifiesto + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+        os.replace(temporal, ruta_manifiesto)
+
+        return ruta_manifiesto, manifiesto
+
+
+class _EscritorColeccion(EscritorNDJSON):
+    def __init__(self, respaldo, coll):
+        self._respaldo = respaldo
+        self._coll = coll
+        self._nombre = f"{respaldo.prefijo}.{coll}{EXTENSIONES[respaldo.compresion]}"
+        self._eliminados = None
+        self._vaciar = False
+        super().__init__(os.path.join(respaldo.carpeta, self._nombre), respaldo.compresion)
+
+    def eliminar(self, doc_id):
+        """_id borrado desde la marca (respaldos por change log): van a <coleccion>.eliminados."""
+        if self._eliminados is None:
+            nombre = f"{self._respaldo.prefijo}.{self._coll}.eliminados{EXTENSIONES[self._respaldo.compresion]}"
+            self._eliminados = EscritorNDJSON(os.path.join(self._respaldo.carpeta, nombre), self._respaldo.compresion)
+        self._eliminados.escribir({"_id": doc_id})
+
+    def vaciar(self):
+        """La colección se eliminó desde la marca: al restaurar se vacía antes de aplicar el resto."""
+        self._vaciar = True
+
+    def _relativa(self, ruta):
+        return os.path.join(self._respaldo.prefijo, os.path.basename(ruta))
+
+    def cerrar(self):
+        entrada = super().cerrar()
+        # Las colecciones sin documentos no dejan archivo (y en un incremental
+        # sin cambios ni borrados tampoco entrada en el manifiesto)
+        if entrada["documentos"] == 0:
+            os.remove(self.ruta)
+            entrada.update(archivo=None, bytes=0, sha256=None)
+        else:
+            entrada["archivo"] = self._relativa(self.ruta)
+
+        if self._eliminados is not None:
+            entrada["eliminados"] = {"archivo": self._relativa(self._eliminados.ruta), **self._eliminados.cerrar()}
+        if self._vaciar:
+            entrada["vaciar"] = True
+
+        if entrada["archivo"] or "eliminados" in entrada or self._vaciar or self._respaldo.registrar_vacias:
+            self._respaldo._registrar(self._coll, entrada)
+        return entrada
+
+    def descartar(self):
+        for escritor in (self, self._eliminados):
+            if escritor is None:
+                continue
+            if not escritor._archivo.closed:
+                escritor._archivo.close()
+            if os.path.exists(escritor.ruta):
+                os.remove(escritor.ruta)
+
+
+def cargar_manifiesto(ruta_manifiesto):
+    with open(ruta_manifiesto, "r", encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    if manifiesto.get("formato") != FORMATO:
+        raise Exception(f"Manifiesto no reconocido: {ruta_manifiesto}")
+    return manifiesto
+
+
+def _verificar(base, coll, entrada):
+    ruta = os.path.join(base, entrada["archivo"])
+    if not os.path.exists(ruta):
+        raise Exception(f"Falta el archivo de {coll}: {entrada['archivo']}")
+    if sha256_archivo(ruta) != entrada["sha256"]:
+        raise Exception(f"Checksum incorrecto en {entrada['archivo']}")
+    return ruta
+
+
+def archivos_del_manifiesto(ruta_manifiesto, verificar=True):
+    """
+    [(coleccion, ruta documentos, ruta eliminados, entrada)] de un manifiesto;
+    las rutas son None si la colección no tiene ese archivo. Con `verificar`
+    comprueba que cada archivo exista y coincida su sha256 antes de devolver nada.
+    """
+    manifiesto = cargar_manifiesto(ruta_manifiesto)
+    base = os.path.dirname(ruta_manifiesto)
+    archivos = []
+    for coll, entrada in manifiesto["colecciones"].items():
+        rutas = []
+        for parte in (entrada, entrada.get("eliminados")):
+            if not parte or not parte.get("archivo"):
+                rutas.append(None)
+            elif verificar:
+                rutas.append(_verificar(base, coll, parte))
+            else:
+                rutas.append(os.path.join(base, parte["archivo"]))
+        archivos.append((coll, rutas[0], rutas[1], entrada))
+    return archivos
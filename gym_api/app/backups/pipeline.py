@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# ──────────────────────────────────────────────
+# PIPELINE DE RESPALDO
+# Cada colección se lee una sola vez (cursor por lotes) y cada documento se
+# reparte a todas las salidas habilitadas (NDJSON, Excel, PDF). Varias
+# colecciones se procesan a la vez en un pool de hilos acotado; el
+# MongoClient es thread-safe y cada hilo toma su propia conexión del pool.
+#
+# Una salida expone:
+#   coleccion(nombre) → escritor con escribir(doc), cerrar() y opcionalmente
+#                       eliminar(_id), vaciar() y descartar(); se usa solo
+#                       desde el hilo de esa colección
+#   finalizar()       → lo llama quien creó la salida, al terminar el pipeline
+#
+# Por defecto cada colección se lee con find(query). Los respaldos
+# incrementales por change log (app/backups/changelog.py) pasan una `fuente`
+# que devuelve (operación, valor): documentos, _id eliminados y vaciados.
+# ──────────────────────────────────────────────
+
+PENDIENTE  = "pendiente"
+EN_CURSO   = "en_curso"
+COMPLETADA = "completada"
+ERROR      = "error"
+
+# Operaciones de una fuente
+DOCUMENTO = "documento"
+ELIMINADO = "eliminado"
+VACIADO   = "vaciado"
+
+# Estado operativo que vive en la misma base pero no se respalda ni se
+# restaura: los trabajos y el lock de respaldos (app/backups/jobs.py; un
+# restore traería un respaldo "en proceso" fantasma) y la caché y la cola
+# de analítica. analytics_rollups sí se respalda: sus marcas deben ir con
+# los pagos y asistencias de los que salen.
+COLECCIONES_EXCLUIDAS = ("backup_jobs", "backup_jobs_lock", "analytics_cache", "analytics_jobs")
+
+
+def respaldable(coll):
+    return coll not in COLECCIONES_EXCLUIDAS
+
+
+def colecciones_respaldables(db):
+    return [c for c in db.list_collection_names() if respaldable(c)]
+
+
+def _descartar(escritores):
+    for escritor in escritores:
+        try:
+            if hasattr(escritor, "descartar"):
+                escritor.descartar()
+        except Exception as e:
+            print(f"Error descartando salida parcial: {e}")
+
+
+def _fuente_find(db, query, lote):
+    def fuente(coll):
+        for doc in db[coll].find(query or {}, batch_size=lote):
+            yield DOCUMENTO, doc
+    return fuente
+
+
+def _aplicar(escritor, operacion, valor):
+    if operacion == DOCUMENTO:
+        escritor.escribir(valor)
+    elif operacion == ELIMINADO:
+        if hasattr(escritor, "eliminar"):
+            escritor.eliminar(valor)
+    elif operacion == VACIADO:
+        if hasattr(escritor, "vaciar"):
+            escritor.vaciar()
+
+
+def _procesar(coll, salidas, fuente, lote, progreso):
+    escritores, documentos = [], 0
+    try:
+        for salida in salidas:
+            escritores.append(salida.coleccion(coll))
+        progreso(coll, EN_CURSO, 0)
+
+        for operacion, valor in fuente(coll):
+            for escritor in escritores:
+                _aplicar(escritor, operacion, valor)
+            documentos += 1
+            if documentos % lote == 0:
+                progreso(coll, EN_CURSO, documentos)
+
+        for escritor in escritores:
+            escritor.cerrar()
+        progreso(coll, COMPLETADA, documentos)
+        return {"estado": COMPLETADA, "documentos": documentos}
+
+    except Exception as e:
+        # Como antes, una colección con error se omite y el respaldo sigue con las demás
+        print(f"Error procesando colección {coll} para el respaldo: {e}")
+        _descartar(escritores)
+        progreso(coll, ERROR, documentos)
+        return {"estado": ERROR, "documentos": documentos, "error": str(e)}
+
+
+def ejecutar(db, colecciones, salidas, query=None, max_hilos=4, lote=1000, progreso=None, fuente=None):
+    """
+    Recorre `colecciones` con hasta `max_hilos` en paralelo. `progreso(coll,
+    estado, documentos)` se llama desde los hilos del pool; `fuente(coll)`
+    reemplaza a find(query). Devuelve {coleccion: {"estado", "documentos"[, "error"]}}.
+    """
+    progreso = progreso or (lambda *args: None)
+    fuente = fuente or _fuente_find(db, query, lote)
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_hilos), thread_name_prefix="backup") as pool:
+        futuros = {
+            pool.submit(_procesar, coll, salidas, fuente, lote, progreso): coll
+            for coll in colecciones
+        }
+        for futuro in as_completed(futuros):
+            resultados[futuros[futuro]] = futuro.result()
+    return resultados
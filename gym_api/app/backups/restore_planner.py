@@ -0,0 +1,244 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from bson import json_util
+from pymongo import DeleteOne
+
+from app.config import Config
+from app.mongo import get_db
+from app.backups import ndjson, pipeline
+from app.backups.changelog import CHANGELOG_DIR
+from app.backups.service import BACKUP_DIR
+from app.backups.restore_service import (
+    _batches,
+    _bulk,
+    _collection_progress,
+    _replace,
+    restore_state,
+    run_restore
+)
+
+# ================= RESTAURACIÓN A UN PUNTO EN EL TIEMPO =================
+# El índice son los manifiestos NDJSON de storage/backups (backup_history.json
+# solo guarda los 10 últimos). Para llegar a un instante se aplica la cadena
+# mínima: el último full anterior, el último diferencial posterior a ese
+# full y los incrementales posteriores al diferencial (o al full).
+#
+# Cada colección se aplica en una pasada, del archivo más nuevo al más
+# antiguo: un _id ya escrito (o borrado) por un archivo más nuevo se omite en
+# los anteriores, así cada documento se escribe una sola vez.
+
+DIFFERENTIAL = "differential"
+INCREMENTAL = "incremental"
+FULL = "full"
+
+
+def _created(manifest):
+    return datetime.fromisoformat(manifest["creado_en"])
+
+
+def load_manifest_index():
+    """Manifiestos de respaldo ordenados por fecha de creación."""
+    index = []
+    for root, dirs, files in os.walk(BACKUP_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != CHANGELOG_DIR]
+        for name in files:
+            if not ndjson.es_manifiesto(name):
+                continue
+            path = os.path.join(root, name)
+            try:
+                manifest = ndjson.cargar_manifiesto(path)
+                index.append({
+                    "path": path,
+                    "file": name,
+                    "type": manifest.get("tipo"),
+                    "created": _created(manifest),
+                    "manifest": manifest
+                })
+            except Exception as e:
+                print(f"Manifiesto ignorado ({name}): {e}")
+    return sorted(index, key=lambda e: e["created"])
+
+
+def _warnings(chain):
+    warnings = []
+    for previous, link in zip(chain, chain[1:]):
+        manifest = link["manifest"]
+        if manifest.get("origen") == "fechas":
+            warnings.append(f"{link['file']} se generó por campos de fecha: no incluye borrados")
+            continue
+        since = manifest.get("changelog", {}).get("desde")
+        until = previous["manifest"].get("changelog", {}).get("hasta")
+        if since is not None and until is not None and since != until:
+            warnings.append(
+                f"{link['file']} parte de la marca {since} del change log y "
+                f"{previous['file']} terminó en {until}"
+            )
+    return warnings
+
+
+def _local(until):
+    """Los manifiestos guardan creado_en en hora local sin zona: un `until` con zona se convierte."""
+    if until.tzinfo is not None:
+        return until.astimezone().replace(tzinfo=None)
+    return until
+
+
+def plan_restore(until=None):
+    """Cadena full → diferencial → incrementales para llegar a `until` (datetime; por defecto ahora)."""
+    until = _local(until) if until else datetime.now()
+    index = [e for e in load_manifest_index() if e["created"] <= until]
+
+    fulls = [e for e in index if e["type"] == FULL]
+    if not fulls:
+        raise Exception(f"No hay un respaldo completo NDJSON anterior a {until.isoformat()}")
+    chain = [fulls[-1]]
+
+    later = [e for e in index if e["created"] > chain[0]["created"]]
+    differentials = [e for e in later if e["type"] == DIFFERENTIAL]
+    if differentials:
+        # El diferencial contiene todo lo cambiado desde el full: los incrementales anteriores sobran
+        chain.append(differentials[-1])
+        later = [e for e in later if e["created"] > differentials[-1]["created"]]
+    chain += [e for e in later if e["type"] == INCREMENTAL]
+
+    return {
+        "until": until.isoformat(),
+        "chain": chain,
+        "warnings": _warnings(chain)
+    }
+
+
+def plan_to_dict(plan):
+    return {
+        "until": plan["until"],
+        "warnings": plan["warnings"],
+        "chain": [
+            {
+                "file": link["file"],
+                "type": link["type"],
+                "created": link["created"].isoformat(),
+                "origen": link["manifest"].get("origen"),
+                "documentos": link["manifest"].get("total_documentos"),
+                "eliminados": link["manifest"].get("total_eliminados", 0),
+                "bytes": link["manifest"].get("total_bytes")
+            }
+            for link in plan["chain"]
+        ]
+    }
+
+# ================= APLICACIÓN =================
+
+def _key(doc_id):
+    # Los _id pueden ser subdocumentos (no hashables)
+    return json_util.dumps(doc_id)
+
+
+def _restore_collection_chain(db, coll, parts, drop, size):
+    """`parts`: [(ruta documentos, ruta eliminados, entrada)] del archivo más nuevo al más antiguo."""
+    _collection_progress(coll, pipeline.EN_CURSO)
+    try:
+        # Una colección vaciada (eliminada) deja sin efecto todo lo anterior
+        for i, (_, _, entry) in enumerate(parts):
+            if entry.get("vaciar"):
+                parts = parts[:i + 1]
+                break
+        clear = drop or any(entry.get("vaciar") for _, _, entry in parts)
+        if clear:
+            db[coll].delete_many({})
+
+        seen = set()
+        for i, (path, deleted_path, _) in enumerate(parts):
+            # El archivo más antiguo no necesita recordar _id: no queda nada detrás
+            remember = i < len(parts) - 1
+
+            if deleted_path:
+                ops = []
+                for doc in ndjson.leer_documentos(deleted_path):
+                    key = _key(doc["_id"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    # Sobre una colección vaciada el borrado ya está hecho
+                    if not clear:
+                        ops.append(DeleteOne({"_id": doc["_id"]}))
+                    if len(ops) >= size:
+                        _bulk(db, coll, ops)
+                        ops = []
+                    _collection_progress(coll, eliminados=1)
+                _bulk(db, coll, ops)
+
+            if path:
+                def _current(docs):
+                    for doc in docs:
+                        key = _key(doc["_id"])
+                        if key in seen:
+                            _collection_progress(coll, omitidos=1)
+                            continue
+                        if remember:
+                            seen.add(key)
+                        yield doc
+
+                for ops in _batches(_current(ndjson.leer_documentos(path)), _replace, size):
+                    _bulk(db, coll, ops)
+                    _collection_progress(coll, documentos=len(ops))
+
+        _collection_progress(coll, pipeline.COMPLETADA)
+    except Exception:
+        _collection_progress(coll, pipeline.ERROR)
+        raise
+
+
+def _apply(plan, drop, size, workers):
+    db = get_db()
+
+    restore_state["current_step"] = "Verificando checksums"
+    parts_by_coll = {}
+    for link in reversed(plan["chain"]):
+        for coll, path, deleted_path, entry in ndjson.archivos_del_manifiesto(link["path"]):
+            if not pipeline.respaldable(coll):
+                continue
+            parts_by_coll.setdefault(coll, []).append((path, deleted_path, entry))
+
+    if drop:
+        # Lo que hoy existe y ningún respaldo de la cadena trae no tenía
+        # documentos en `until` (p. ej. colecciones creadas después): se vacía
+        for coll in pipeline.colecciones_respaldables(db):
+            parts_by_coll.setdefault(coll, [])
+
+    for coll, parts in parts_by_coll.items():
+        total = sum(e.get("documentos", 0) + e.get("eliminados", {}).get("documentos", 0) for _, _, e in parts)
+        _collection_progress(coll, total=total)
+
+    restore_state["current_step"] = (
+        f"Restaurando {len(plan['chain'])} respaldos hasta {plan['until']} ({len(parts_by_coll)} colecciones)"
+    )
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="restore") as pool:
+        futures = [
+            pool.submit(_restore_collection_chain, db, coll, parts, drop, size)
+            for coll, parts in parts_by_coll.items()
+        ]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(str(e))
+    if errors:
+        raise Exception("; ".join(errors))
+
+
+def restore_point_in_time(until=None, drop=True, size=None, workers=None):
+    """
+    Planifica y aplica la cadena hasta `until`. Con `drop` (por defecto) se
+    vacían antes todas las colecciones respaldables, estén o no en la cadena
+    (las vacías del full solo figuran en su manifiesto), como mongorestore
+    --drop: la base queda exactamente como en el respaldo. Devuelve el plan
+    aplicado.
+    """
+    plan = plan_restore(until)
+    run_restore(
+        f"Punto en el tiempo {plan['until']}",
+        lambda: _apply(plan, drop, size or Config.BACKUP_RESTORE_LOTE, workers or Config.BACKUP_HILOS)
+    )
+    return plan
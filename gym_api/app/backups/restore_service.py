@@ -1,16 +1,291 @@
 import os
+import json
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
 from bson import json_util
+from pymongo import DeleteOne, ReplaceOne
+
+from app.config import Config
 from app.mongo import get_db
+from app.backups import ndjson, pipeline
 
 MONGORESTORE_PATH = "mongorestore"
 
+BLOQUE_LECTURA = 1024 * 1024
+
+# ================= STATE =================
+
+restore_state = {
+    "is_running": False,
+    "progress_percentage": 0,
+    "current_step": None,
+    "file": None,
+    "start_time": None,
+    "last_restore": None,
+    "error": None,
+    # {coleccion: {"estado", "documentos", "eliminados", "omitidos", "total"}}
+    "collections": {}
+}
+
+_state_lock = threading.Lock()
+
+
+class RestoreInProgress(Exception):
+    pass
+
+
+def _start_state(name):
+    with _state_lock:
+        if restore_state["is_running"]:
+            raise RestoreInProgress("Ya hay una restauración en curso")
+        restore_state.update({
+            "is_running": True,
+            "progress_percentage": 0,
+            "current_step": "Iniciando restauración",
+            "file": name,
+            "start_time": datetime.now(),
+            "error": None,
+            "collections": {}
+        })
+
+
+def _collection_progress(coll, estado=None, documentos=0, eliminados=0, total=None, omitidos=0):
+    """Suma documentos/eliminados aplicados a la colección (se llama desde los hilos del pool)."""
+    with _state_lock:
+        c = restore_state["collections"].setdefault(
+            coll, {"estado": pipeline.PENDIENTE, "documentos": 0, "eliminados": 0, "omitidos": 0, "total": None}
+        )
+        c["documentos"] += documentos
+        c["eliminados"] += eliminados
+        c["omitidos"] += omitidos
+        if estado:
+            c["estado"] = estado
+        if total is not None:
+            c["total"] = total
+
+        totales = [x["total"] for x in restore_state["collections"].values()]
+        if totales and all(t is not None for t in totales) and sum(totales):
+            hechos = sum(x["documentos"] + x["eliminados"] + x["omitidos"] for x in restore_state["collections"].values())
+            restore_state["progress_percentage"] = min(99, int(100 * hechos / sum(totales)))
+
+# ================= ESCRITURA POR LOTES =================
+
+def _bulk(db, coll, ops):
+    if ops:
+        db[coll].bulk_write(ops, ordered=False)
+
+
+def _batches(docs, make_op, size):
+    ops = []
+    for doc in docs:
+        ops.append(make_op(doc))
+        if len(ops) >= size:
+            yield ops
+            ops = []
+    if ops:
+        yield ops
+
+
+def _replace(doc):
+    return ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+
+
+def _delete(doc):
+    return DeleteOne({"_id": doc["_id"]})
+
+# ================= NDJSON (MANIFIESTO) =================
+
+def _restore_ndjson_collection(db, coll, path, deleted_path, entry, size):
+    _collection_progress(coll, pipeline.EN_CURSO)
+    try:
+        # Respaldos por change log: colección eliminada y documentos borrados desde la marca
+        if entry.get("vaciar"):
+            db[coll].delete_many({})
+        if deleted_path:
+            for ops in _batches(ndjson.leer_documentos(deleted_path), _delete, size):
+                _bulk(db, coll, ops)
+                _collection_progress(coll, eliminados=len(ops))
+        if path:
+            for ops in _batches(ndjson.leer_documentos(path), _replace, size):
+                _bulk(db, coll, ops)
+                _collection_progress(coll, documentos=len(ops))
+        _collection_progress(coll, pipeline.COMPLETADA)
+    except Exception:
+        _collection_progress(coll, pipeline.ERROR)
+        raise
+
+
+def restore_ndjson(db, manifest_path, size=None, workers=None):
+    """Verifica los checksums y restaura las colecciones del manifiesto en paralelo."""
+    size = size or Config.BACKUP_RESTORE_LOTE
+    workers = workers or Config.BACKUP_HILOS
+
+    restore_state["current_step"] = "Verificando checksums"
+    # Los respaldos anteriores a la exclusión pueden traer backup_jobs y la caché de analítica
+    files = [f for f in ndjson.archivos_del_manifiesto(manifest_path) if pipeline.respaldable(f[0])]
+    for coll, _, _, entry in files:
+        total = entry.get("documentos", 0) + entry.get("eliminados", {}).get("documentos", 0)
+        _collection_progress(coll, total=total)
+
+    restore_state["current_step"] = f"Restaurando {len(files)} colecciones"
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="restore") as pool:
+        futures = [
+            pool.submit(_restore_ndjson_collection, db, coll, path, deleted_path, entry, size)
+            for coll, path, deleted_path, entry in files
+        ]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(str(e))
+    if errors:
+        raise Exception("; ".join(errors))
+
+# ================= JSON (FORMATO ANTERIOR) =================
+
+class _LegacyJsonReader:
+    """
+    Recorre {"coleccion": [doc, ...], ...} (un solo .json, formato anterior
+    a los respaldos NDJSON) documento a documento, sin cargar el archivo.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._buf = ""
+        self._pos = 0
+        # json_util.object_hook convierte $oid, $date... como json_util.loads
+        self._decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+
+    def _fill(self):
+        chunk = self._f.read(BLOQUE_LECTURA)
+        if not chunk:
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("JSON del respaldo truncado")
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c not in chars:
+            raise ValueError(f"JSON del respaldo inválido: se esperaba {chars!r} y hay {c!r}")
+        self._pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                self._pos = end
+                return value
+            except json.JSONDecodeError:
+                # Documento partido entre dos bloques
+                if not self._fill():
+                    raise
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            coll = self._value()
+            self._expect(":")
+            self._expect("[")
+            if self._peek() == "]":
+                self._pos += 1
+            else:
+                while True:
+                    yield coll, self._value()
+                    if self._expect(",]") == "]":
+                        break
+            if self._expect(",}") == "}":
+                return
+
+
+def restore_legacy_json(db, file_path, size=None, workers=None):
+    """Lotes de ReplaceOne por colección, escritos por un pool con pocos lotes en vuelo."""
+    size = size or Config.BACKUP_RESTORE_LOTE
+    workers = max(1, workers or Config.BACKUP_HILOS)
+    restore_state["current_step"] = "Restaurando JSON"
+
+    def _write(coll, ops):
+        _bulk(db, coll, ops)
+        _collection_progress(coll, documentos=len(ops))
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="restore") as pool:
+        def _submit(coll, ops):
+            # Memoria acotada: como mucho 2 lotes en vuelo por hilo
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                pending.difference_update(done)
+            pending.add(pool.submit(_write, coll, ops))
+
+        batches = {}
+        with open(file_path, "r", encoding="utf-8") as f:
+            for coll, doc in _LegacyJsonReader(f):
+                if not pipeline.respaldable(coll):
+                    continue
+                if coll not in batches:
+                    _collection_progress(coll, pipeline.EN_CURSO)
+                ops = batches.setdefault(coll, [])
+                ops.append(_replace(doc))
+                if len(ops) >= size:
+                    _submit(coll, ops)
+                    batches[coll] = []
+        for coll, ops in batches.items():
+            if ops:
+                _submit(coll, ops)
+
+        for future in pending:
+            future.result()
+
+    for coll in batches:
+        _collection_progress(coll, pipeline.COMPLETADA)
+
+# ================= MAIN =================
+
+def run_restore(name, restore):
+    """Ejecuta `restore()` registrando su avance en restore_state (una restauración a la vez)."""
+    _start_state(name)
+    try:
+        result = restore()
+        restore_state["current_step"] = "Completado"
+        restore_state["progress_percentage"] = 100
+        restore_state["last_restore"] = datetime.now()
+        return result
+    except Exception as e:
+        restore_state["current_step"] = f"Error: {str(e)}"
+        restore_state["error"] = str(e)
+        raise
+    finally:
+        restore_state["is_running"] = False
+
+
 def restore_backup_file(file_path):
-    """Restaura un backup de MongoDB dependiendo de si es .archive o .json"""
-    
+    """Restaura un backup de MongoDB: .archive, manifiesto NDJSON (.manifest.json) o .json"""
+
     if not os.path.exists(file_path):
         raise Exception("Archivo de respaldo no existe")
 
+    run_restore(os.path.basename(file_path), lambda: _restore_file(file_path))
+
+
+def _restore_file(file_path):
     # Archivo de Backup Completo (Generado por mongodump)
     if file_path.endswith(".archive"):
         db_user = os.getenv("MONGO_USER")
@@ -20,17 +295,18 @@ def restore_backup_file(file_path):
 
         mongo_uri = f"mongodb+srv://{db_user}:{db_pass}@{db_cluster}/"
 
+        restore_state["current_step"] = "Ejecutando mongorestore"
         try:
             # --nsInclude asegura que solo restauremos nuestra base de datos específica
             # --drop elimina las colecciones actuales antes de restaurarlas para evitar duplicados
             subprocess.run(
                 [
-                    MONGORESTORE_PATH, 
-                    "--uri", mongo_uri, 
-                    "--nsInclude", f"{db_name}.*", 
-                    f"--archive={file_path}", 
+                    MONGORESTORE_PATH,
+                    "--uri", mongo_uri,
+                    "--nsInclude", f"{db_name}.*",
+                    f"--archive={file_path}",
                     "--drop"
-                ],
+                ] + [f"--nsExclude={db_name}.{c}" for c in pipeline.COLECCIONES_EXCLUIDAS],
                 check=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
@@ -38,22 +314,20 @@ def restore_backup_file(file_path):
         except subprocess.CalledProcessError as e:
             raise Exception(f"Error crítico en mongorestore: {e.stderr.decode('utf-8', errors='ignore')}")
 
-    # Archivo de Backup Incremental/Diferencial (Generado por nuestro script en Python)
+    # Respaldo NDJSON por colección: se verifican los checksums del manifiesto
+    # y cada archivo se lee línea a línea
+    elif ndjson.es_manifiesto(file_path):
+        try:
+            restore_ndjson(get_db(), file_path)
+        except Exception as e:
+            raise Exception(f"Error restaurando backup NDJSON: {str(e)}")
+
+    # Archivo JSON único (formato anterior a los respaldos NDJSON)
     elif file_path.endswith(".json"):
         try:
-            db = get_db()
-            with open(file_path, "r", encoding="utf-8") as f:
-                # json_util convierte correctamente las fechas y los ObjectId guardados en el JSON
-                data = json_util.loads(f.read())
-                
-                # Iteramos sobre cada colección y hacemos un "upsert" (Actualizar si existe, insertar si no)
-                for coll_name, docs in data.items():
-                    coll = db[coll_name]
-                    for doc in docs:
-                        coll.update_one({"_id": doc["_id"]}, {"$set": doc}, upsert=True)
-                        
+            restore_legacy_json(get_db(), file_path)
         except Exception as e:
             raise Exception(f"Error restaurando backup incremental JSON: {str(e)}")
 
     else:
-        raise Exception("Formato de archivo no soportado para restauración. Solo se permiten .archive y .json")
\ No newline at end of file
+        raise Exception("Formato de archivo no soportado para restauración. Solo se permiten .archive, .manifest.json y .json")
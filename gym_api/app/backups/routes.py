@@ -3,8 +3,9 @@ from datetime import datetime, timedelta
 import uuid
 import threading
 import os
+from app.mongo import get_db
+from app.backups import jobs
 from app.backups.service import (
-    backup_state,
     run_backup,
     BACKUP_DIR,
     load_history,
@@ -12,7 +13,16 @@ from app.backups.service import (
 )
 
 # Cambiamos el nombre de la función a uno más genérico
-from app.backups.restore_service import restore_backup_file 
+from app.backups.restore_service import (
+    restore_backup_file,
+    restore_state,
+    RestoreInProgress
+)
+from app.backups.restore_planner import (
+    plan_restore,
+    plan_to_dict,
+    restore_point_in_time
+)
 
 backups_bp = Blueprint("backups", __name__, url_prefix="/api/backups")
 
@@ -20,12 +30,14 @@ backups_bp = Blueprint("backups", __name__, url_prefix="/api/backups")
 @backups_bp.route("/dashboard-summary", methods=["GET"])
 def dashboard_summary():
     history = load_history()
+    db = get_db()
+    last_job = jobs.ultimo_completado(db)
     
     response = {
-        "system_status": "OK" if not backup_state["is_running"] else "PENDIENTE",
+        "system_status": "OK" if not jobs.en_curso(db) else "PENDIENTE",
         "last_backup": (
-            backup_state["last_backup"].isoformat()
-            if backup_state["last_backup"]
+            last_job["fecha_fin"].isoformat()
+            if last_job
             else None
         ),
         "config": {
@@ -53,13 +65,6 @@ def backup_history():
 
 @backups_bp.route("/trigger", methods=["POST"])
 def trigger_backup():
-    if backup_state["is_running"]:
-        return jsonify({
-            "message": "Ya hay un backup en curso",
-            "status": "running",
-            "job_id": backup_state.get("job_id")
-        }), 409
-
     data = request.get_json() or {}
     backup_type = data.get("type", "incremental")
     
@@ -69,7 +74,16 @@ def trigger_backup():
             "error": f"Tipo de backup inválido. Use: {', '.join(valid_types)}"
         }), 400
     
+    # El lock de backup_jobs es compartido por todos los workers: un respaldo a la vez
     job_id = f"job_{uuid.uuid4().hex[:8]}"
+    job, created = jobs.crear(get_db(), job_id, backup_type)
+    if not created:
+        return jsonify({
+            "message": "Ya hay un backup en curso",
+            "status": "running",
+            "job_id": job["_id"] if job else None
+        }), 409
+
     app_instance = current_app._get_current_object()
 
     thread = threading.Thread(
@@ -86,29 +100,68 @@ def trigger_backup():
     }), 202
 
 
+def _download_links(files):
+    links = {}
+    for f_type, f_path in (files or {}).items():
+        if f_path and os.path.exists(f_path):
+            filename = os.path.basename(f_path)
+            links[f_type] = f"/api/backups/download/{filename}"
+    return links
+
+
 @backups_bp.route("/status", methods=["GET"])
 def backup_status():
+    """Respaldo en curso o, si no hay, el último (ver /status/<job_id> para el detalle)."""
+    db = get_db()
+    job = jobs.actual(db)
+    last_job = jobs.ultimo_completado(db)
+
     response = {
-        "is_running": backup_state["is_running"],
-        "progress_percentage": backup_state["progress_percentage"],
-        "current_step": backup_state["current_step"],
+        "job_id": job["_id"] if job else None,
+        "is_running": bool(job and job["estado"] == jobs.EN_PROCESO),
+        "progress_percentage": job.get("progreso", 0) if job else 0,
+        "current_step": job.get("paso_actual") if job else None,
         "last_backup": (
-            backup_state["last_backup"].isoformat() 
-            if backup_state["last_backup"] 
+            last_job["fecha_fin"].isoformat() 
+            if last_job 
             else None
         ),
-        "files": {}
+        "collections": job.get("colecciones", {}) if job else {},
+        "files": _download_links(job.get("archivos") if job else None)
     }
 
-    if backup_state.get("generated_files"):
-        for f_type, f_path in backup_state["generated_files"].items():
-            if f_path and os.path.exists(f_path):
-                filename = os.path.basename(f_path)
-                response["files"][f_type] = f"/api/backups/download/{filename}"
+    return jsonify(response), 200
+
+
+@backups_bp.route("/status/<job_id>", methods=["GET"])
+def backup_job_status(job_id):
+    """Detalle de un respaldo: pasos con tiempos, colecciones, bytes escritos y throughput."""
+    job = jobs.obtener(get_db(), job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
 
+    response = jobs.to_dict(job)
+    response["files"] = _download_links(job.get("archivos"))
     return jsonify(response), 200
 
 
+@backups_bp.route("/jobs", methods=["GET"])
+def backup_jobs():
+    """Últimos respaldos (?limit=20&type=full&status=completado), para planificar ventanas de respaldo."""
+    try:
+        limit = min(int(request.args.get("limit", 20)), 200)
+    except ValueError:
+        return jsonify({"error": "limit debe ser un número"}), 400
+
+    items = jobs.listar(
+        get_db(),
+        limite=limit,
+        tipo=request.args.get("type"),
+        estado=request.args.get("status")
+    )
+    return jsonify([jobs.to_dict(job, detalle=False) for job in items]), 200
+
+
 @backups_bp.route("/download/<filename>", methods=["GET"])
 def download_backup(filename):
     for root, dirs, files in os.walk(BACKUP_DIR):
@@ -129,7 +182,7 @@ def restore_backup():
     raw_filename = data["filename"]
     filename = os.path.basename(raw_filename)
 
-    # Buscar el archivo (Ahora aceptamos .archive para Full y .json para Incrementales)
+    # Buscar el archivo (.archive para Full, .manifest.json para los NDJSON y .json del formato anterior)
     file_path = None
     for root, _, files in os.walk(BACKUP_DIR):
         if filename in files and (filename.endswith(".archive") or filename.endswith(".json")):
@@ -140,8 +193,16 @@ def restore_backup():
         print(f"DEBUG: Buscaba '{filename}' en '{BACKUP_DIR}' y no lo encontré.")
         return jsonify({"error": "Backup no encontrado o formato inválido"}), 404
 
+    if restore_state["is_running"]:
+        return jsonify({
+            "message": "Ya hay una restauración en curso",
+            "status": "running",
+            "file": restore_state.get("file")
+        }), 409
+
     try:
         # 1. Ejecutar la restauración usando nuestra nueva función
+        #    (el avance se consulta en /restore/status mientras dura)
         restore_backup_file(file_path)
 
         # 2. Guardar en el historial que se hizo una restauración
@@ -157,6 +218,9 @@ def restore_backup():
             "file": filename
         }), 200
 
+    except RestoreInProgress as e:
+        return jsonify({"message": str(e), "status": "running"}), 409
+
     except Exception as e:
         print(f"Error crítico restaurando backup: {e}")
         return jsonify({
@@ -165,6 +229,93 @@ def restore_backup():
         }), 500
 
 
+def _parse_until(value):
+    """Instante ISO 8601 pedido (None = ahora). ValueError si no es válido."""
+    if not value:
+        return None
+    # fromisoformat no acepta el sufijo Z antes de Python 3.11; la zona la resuelve plan_restore
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+@backups_bp.route("/restore/plan", methods=["GET"])
+def restore_plan():
+    """Cadena de respaldos que se aplicaría para llegar a ?until=<ISO 8601> (sin restaurar)."""
+    try:
+        until = _parse_until(request.args.get("until"))
+    except ValueError:
+        return jsonify({"error": "Fecha 'until' inválida, use ISO 8601"}), 400
+
+    try:
+        return jsonify(plan_to_dict(plan_restore(until))), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 404
+
+
+@backups_bp.route("/restore/point-in-time", methods=["POST"])
+def restore_to_point_in_time():
+    data = request.get_json() or {}
+    try:
+        until = _parse_until(data.get("until"))
+    except ValueError:
+        return jsonify({"error": "Fecha 'until' inválida, use ISO 8601"}), 400
+
+    if restore_state["is_running"]:
+        return jsonify({
+            "message": "Ya hay una restauración en curso",
+            "status": "running",
+            "file": restore_state.get("file")
+        }), 409
+
+    try:
+        plan = restore_point_in_time(until, drop=bool(data.get("drop", True)))
+
+        save_history({
+            "date": datetime.utcnow().isoformat(),
+            "type": "restore",
+            "size": "N/A",
+            "url": f"point-in-time {plan['until']}"
+        })
+
+        return jsonify({
+            "message": "Base de datos restaurada correctamente",
+            "plan": plan_to_dict(plan)
+        }), 200
+
+    except RestoreInProgress as e:
+        return jsonify({"message": str(e), "status": "running"}), 409
+
+    except Exception as e:
+        print(f"Error crítico restaurando a un punto en el tiempo: {e}")
+        return jsonify({
+            "error": "Error al restaurar",
+            "detail": str(e)
+        }), 500
+
+
+@backups_bp.route("/restore/status", methods=["GET"])
+def restore_status():
+    return jsonify({
+        "is_running": restore_state["is_running"],
+        "progress_percentage": restore_state["progress_percentage"],
+        "current_step": restore_state["current_step"],
+        "file": restore_state["file"],
+        "start_time": (
+            restore_state["start_time"].isoformat()
+            if restore_state["start_time"]
+            else None
+        ),
+        "last_restore": (
+            restore_state["last_restore"].isoformat()
+            if restore_state["last_restore"]
+            else None
+        ),
+        "error": restore_state["error"],
+        "collections": restore_state["collections"]
+    }), 200
+
+
 @backups_bp.route("/test-email", methods=["GET"])
 def test_email():
     from flask_mail import Message
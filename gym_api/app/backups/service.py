@@ -1,15 +1,15 @@
 import os
 import subprocess
 import json
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from fpdf import FPDF
 from datetime import datetime
 from flask_mail import Message
-from bson import json_util
-from bson.objectid import ObjectId
 
+from app.config import Config
 from app.extensions import mail
 from app.mongo import get_db
+from app.backups import changelog, excel, jobs, ndjson, pipeline
 
 # ================= CONFIG =================
 
@@ -22,18 +22,6 @@ LAST_FULL_BACKUP_FILE = os.path.join(BACKUP_DIR, "last_full_backup.txt")
 LAST_BACKUP_FILE = os.path.join(BACKUP_DIR, "last_backup_any.txt")
 HISTORY_FILE = os.path.join(BACKUP_DIR, "backup_history.json")
 
-# ================= STATE =================
-
-backup_state = {
-    "is_running": False,
-    "progress_percentage": 0,
-    "current_step": None,
-    "start_time": None,
-    "job_id": None,
-    "last_backup": None,
-    "generated_files": {}
-}
-
 # ================= UTILS =================
 
 def ensure_dirs(backup_type):
@@ -54,6 +42,21 @@ def get_last_backup(path):
     with open(path, "r") as f:
         return f.read().strip()
 
+def _collection_progress(job):
+    """Callback del pipeline (hilos del pool): avanza del 20% al 85% según las colecciones terminadas."""
+    def progress(coll, estado, documentos):
+        job.coleccion(coll, estado, documentos, terminada=estado in (pipeline.COMPLETADA, pipeline.ERROR))
+    return progress
+
+def _file_size(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+def _mongodump(job, command, archive):
+    """mongodump en su propio proceso; su paso se registra con sus tiempos aunque corra en paralelo."""
+    start = datetime.now()
+    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    job.registrar_paso("mongodump (.archive)", start, datetime.now(), _file_size(archive))
+
 # ================= HISTORY =================
 
 def load_history():
@@ -93,105 +96,166 @@ def _construir_query_fechas(since_date):
     }
 
 
-# ================= EXCEL =================
+# ================= SALIDAS DEL PIPELINE =================
+# Cada formato recibe los documentos que lee app/backups/pipeline.py
+# (una lectura por colección para todos los formatos). Excel y NDJSON
+# están en app/backups/excel.py y app/backups/ndjson.py
 
-def generate_excel(db, output_path, since_date=None):
-    collections = db.list_collection_names()
-    query = _construir_query_fechas(since_date)
-
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-        for coll in collections:
-            try:
-                docs = list(db[coll].find(query))
-                if not docs:
-                    continue
-                
-                # Aplanar los ObjectIds para que Pandas los soporte en Excel
-                for d in docs:
-                    for k, v in d.items():
-                        if isinstance(v, ObjectId):
-                            d[k] = str(v)
-                        elif isinstance(v, (dict, list)):
-                            d[k] = str(v) # Convertir anidados a string
-                            
-                df = pd.DataFrame(docs)
-                sheet_name = coll[:31]
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
-            except Exception as e:
-                print(f"Error procesando colección {coll} para Excel: {e}")
-                continue
-
-# ================= PDF =================
+class PdfOutput:
+    def __init__(self, output_path, since_date=None, mode="FULL"):
+        self.output_path = output_path
+        self.since_date = since_date
+        self.mode = mode
+        self.counts = {}
+        self.deleted = {}
 
-def generate_pdf(db, output_path, since_date=None, mode="FULL"):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=10)
+    def coleccion(self, coll):
+        return _PdfCounter(self, coll)
 
-    pdf.cell(0, 10, f"Reporte de Respaldo {mode}", ln=True, align="C")
-    pdf.cell(0, 8, f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
+    def finalizar(self):
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", size=10)
 
-    if since_date:
-        pdf.cell(0, 8, f"Desde: {since_date}", ln=True)
+        pdf.cell(0, 10, f"Reporte de Respaldo {self.mode}", ln=True, align="C")
+        pdf.cell(0, 8, f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
 
-    collections = db.list_collection_names()
-    query = _construir_query_fechas(since_date)
-
-    for coll in collections:
-        try:
-            docs = list(db[coll].find(query).limit(20))
-            if not docs:
-                continue
+        if self.since_date:
+            pdf.cell(0, 8, f"Desde: {self.since_date}", ln=True)
 
+        for coll in sorted(set(self.counts) | set(self.deleted)):
             pdf.ln(5)
             pdf.set_font("Arial", "B", 11)
             pdf.cell(0, 8, f"Colección: {coll}", ln=True)
             pdf.set_font("Arial", size=8)
-            
-            pdf.multi_cell(0, 5, f"Registros exportados en muestra: {len(docs)}")
-        except Exception as e:
-            print(f"Error en PDF para colección {coll}: {e}")
-            continue
 
-    pdf.output(output_path)
+            pdf.multi_cell(0, 5, f"Registros exportados: {self.counts.get(coll, 0)}")
+            if coll in self.deleted:
+                pdf.multi_cell(0, 5, f"Registros eliminados: {self.deleted[coll]}")
 
-# ================= JSON =================
+        pdf.output(self.output_path)
+        return self.output_path
 
-def generate_incremental_json(db, output_path, since_date):
-    collections = db.list_collection_names()
-    query = _construir_query_fechas(since_date)
-    
-    backup_data = {}
-    
-    for coll in collections:
-        try:
-            docs = list(db[coll].find(query))
-            if docs:
-                backup_data[coll] = docs
-        except Exception as e:
-            print(f"Error extrayendo {coll} para JSON incremental: {e}")
 
-    # Guardamos usando json_util de bson para preservar las fechas y ObjectIds correctamente
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(json_util.dumps(backup_data, indent=2))
+class _PdfCounter:
+    def __init__(self, output, coll):
+        self._output = output
+        self._coll = coll
+        self._count = 0
+        self._deleted = 0
 
-def generate_full_json(db, output_path):
-    collections = db.list_collection_names()
-    backup_data = {}
+    def escribir(self, doc):
+        self._count += 1
+
+    def eliminar(self, doc_id):
+        self._deleted += 1
+
+    def cerrar(self):
+        # Cada hilo escribe una clave distinta de los dicts
+        if self._count:
+            self._output.counts[self._coll] = self._count
+        if self._deleted:
+            self._output.deleted[self._coll] = self._deleted
 
-    for coll in collections:
-        try:
-            docs = list(db[coll].find())
-            if docs:
-                backup_data[coll] = docs
-        except Exception as e:
-            print(f"Error extrayendo {coll} para JSON FULL: {e}")
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(json_util.dumps(backup_data, indent=2))
+def run_pipeline(db, outputs, query=None, progress=None, collections=None, source=None):
+    if collections is None:
+        collections = pipeline.colecciones_respaldables(db)
+    return pipeline.ejecutar(
+        db, collections, outputs,
+        query=query,
+        max_hilos=Config.BACKUP_HILOS,
+        lote=Config.BACKUP_LOTE_CURSOR,
+        progreso=progress,
+        fuente=source
+    )
+
+# ================= EXCEL / PDF / JSON =================
+# Generación de un solo formato (una pasada del pipeline con una salida)
+
+def generate_excel(db, output_path, since_date=None):
+    output = excel.LibroExcel(output_path)
+    run_pipeline(db, [output], _construir_query_fechas(since_date))
+    return output.finalizar()
+
+def generate_pdf(db, output_path, since_date=None, mode="FULL"):
+    output = PdfOutput(output_path, since_date, mode)
+    run_pipeline(db, [output], _construir_query_fechas(since_date))
+    return output.finalizar()
+
+def json_output(output_dir, prefix, backup_type, since_date=None, extra=None):
+    # NDJSON por colección + manifiesto (ver app/backups/ndjson.py); json_util
+    # preserva las fechas y ObjectIds
+    return ndjson.RespaldoNDJSON(
+        output_dir, prefix,
+        tipo=backup_type,
+        desde=since_date,
+        compresion=Config.BACKUP_COMPRESION,
+        extra=extra
+    )
+
+def generate_incremental_json(db, output_dir, prefix, since_date, backup_type="incremental"):
+    """Devuelve (ruta del manifiesto, manifiesto)."""
+    output = json_output(output_dir, prefix, backup_type, since_date)
+    run_pipeline(db, [output], _construir_query_fechas(since_date))
+    return output.finalizar()
+
+def generate_full_json(db, output_dir, prefix):
+    """Devuelve (ruta del manifiesto, manifiesto)."""
+    output = json_output(output_dir, prefix, "full")
+    run_pipeline(db, [output])
+    return output.finalizar()
+
+# ================= CHANGE LOG =================
+# Con BACKUP_INCREMENTAL_MODO = "changelog", diferenciales e incrementales
+# reproducen los cambios registrados desde la marca del respaldo anterior
+# (app/backups/changelog.py). Sin marca o sin continuidad en el log se
+# vuelve a la consulta por campos de fecha.
+
+def _changelog_enabled():
+    return Config.BACKUP_INCREMENTAL_MODO == "changelog"
+
+def _changelog_start(db):
+    """Full: posición del change log que guardará como marca (None si no está disponible)."""
+    if not _changelog_enabled():
+        return None
+    try:
+        return changelog.iniciar(db)
+    except Exception as e:
+        print(f"[BACKUP] Change log no disponible, los incrementales usarán fechas: {e}")
+        return None
+
+def _changelog_changes(db, backup_type):
+    """Cambios desde el full (diferencial) o desde el último respaldo (incremental), o None."""
+    if not _changelog_enabled():
+        return None
+    nombre = changelog.MARCA_FULL if backup_type == "differential" else changelog.MARCA_ULTIMO
+    since_seq = changelog.marca(nombre)
+    if since_seq is None:
+        print("[BACKUP] El change log no tiene marca de un respaldo previo: se usan los campos de fecha")
+        return None
+    try:
+        until_seq = changelog.sincronizar(db)
+    except Exception as e:
+        print(f"[BACKUP] {e}. Se usan los campos de fecha")
+        return None
+    return changelog.Compactacion(since_seq, until_seq)
 
 # ================= EMAIL =================
 
+def _attachment_paths(files):
+    """Rutas a adjuntar: un manifiesto NDJSON va con los archivos de datos que lista."""
+    paths = []
+    for file_path in files.values():
+        if not file_path or not os.path.exists(file_path):
+            continue
+        paths.append(file_path)
+        if ndjson.es_manifiesto(file_path):
+            for _, docs_path, deleted_path, _ in ndjson.archivos_del_manifiesto(file_path, verificar=False):
+                paths += [p for p in (docs_path, deleted_path) if p and os.path.exists(p)]
+    # Sin .archive el "db_dump" es el mismo manifiesto
+    return list(dict.fromkeys(paths))
+
 def send_email_with_attachments(app, files, backup_type):
     try:
         recipient = app.config.get("MAIL_RECIPIENT") or app.config.get("MAIL_USERNAME")
@@ -200,17 +264,21 @@ def send_email_with_attachments(app, files, backup_type):
             subject=f"[Backup] Respaldo {backup_type.upper()} generado",
             sender=app.config.get("MAIL_USERNAME"),
             recipients=[recipient],
-            body=f"El respaldo {backup_type} se generó correctamente en MongoDB.\n\nFecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            body=(
+                f"El respaldo {backup_type} se generó correctamente en MongoDB.\n\n"
+                f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+                "Para restaurar los datos JSON, coloque los archivos .ndjson en una carpeta "
+                "con el nombre del manifiesto (sin .manifest.json), junto a este."
+            )
         )
 
-        for file_type, file_path in files.items():
-            if os.path.exists(file_path):
-                with open(file_path, "rb") as f:
-                    msg.attach(
-                        os.path.basename(file_path), 
-                        "application/octet-stream", 
-                        f.read()
-                    )
+        for file_path in _attachment_paths(files):
+            with open(file_path, "rb") as f:
+                msg.attach(
+                    os.path.basename(file_path), 
+                    "application/octet-stream", 
+                    f.read()
+                )
 
         mail.send(msg)
         return True
@@ -221,19 +289,19 @@ def send_email_with_attachments(app, files, backup_type):
 # ================= MAIN =================
 
 def run_backup(job_id: str, backup_type: str, app):
+    """
+    Ejecuta el respaldo `job_id`, ya registrado (y con el lock tomado) por
+    jobs.crear; el avance, los tiempos por paso y los bytes quedan en backup_jobs.
+    """
     with app.app_context():
-        backup_state.update({
-            "is_running": True,
-            "progress_percentage": 10,
-            "current_step": "Iniciando respaldo",
-            "job_id": job_id,
-            "generated_files": {}
-        })
+        db = get_db()
+        job = jobs.SeguimientoJob(db, job_id)
 
         try:
+            job.iniciar()
+            job.paso("Iniciando respaldo", 10)
             timestamp = now_str()
             path = ensure_dirs(backup_type)
-            db = get_db()
 
             # Construir URI base para MongoDump
             db_user = os.getenv("MONGO_USER")
@@ -243,131 +311,153 @@ def run_backup(job_id: str, backup_type: str, app):
             mongo_uri = f"mongodb+srv://{db_user}:{db_pass}@{db_cluster}/"
 
             archive = None
-            json_file = None
-            xlsx = None
-            pdf = None
             file_size = 0
 
             if backup_type == "full":
-                backup_state["current_step"] = "Generando backup completo (.archive)"
-                backup_state["progress_percentage"] = 20
-                
-                archive = os.path.join(path, f"backup_full_{timestamp}.archive")
-                json_file = os.path.join(path, f"backup_full_{timestamp}.json")  # AÑADIDO
-                xlsx = os.path.join(path, f"backup_full_{timestamp}.xlsx")
-                pdf = os.path.join(path, f"backup_full_{timestamp}.pdf")
-
-                # Llamar a mongodump nativo
-                subprocess.run(
-                    [MONGODUMP_PATH, "--uri", mongo_uri, "--db", db_name, f"--archive={archive}"],
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
-                )
-
-                backup_state["progress_percentage"] = 40  # Ajustado
-                backup_state["current_step"] = "Generando JSON completo"
-                generate_full_json(db, json_file)  # AÑADIDO
-
-                backup_state["progress_percentage"] = 60  # Ajustado
-                backup_state["current_step"] = "Generando Excel"
-                generate_excel(db, xlsx)
-
-                backup_state["progress_percentage"] = 80  # Ajustado
-                backup_state["current_step"] = "Generando PDF"
-                generate_pdf(db, pdf, mode="FULL")
-
-                save_last_backup(LAST_FULL_BACKUP_FILE)
-                save_last_backup(LAST_BACKUP_FILE)
+                since = None
+                prefix = f"backup_full_{timestamp}"
+                mode = "FULL"
 
             elif backup_type == "differential":
                 since = get_last_backup(LAST_FULL_BACKUP_FILE)
                 if not since:
                     raise Exception("No existe respaldo FULL previo. Ejecute primero un backup completo.")
-
-                backup_state["current_step"] = "Generando backup diferencial (.json)"
-                backup_state["progress_percentage"] = 30
-                
-                json_file = os.path.join(path, f"backup_diff_{timestamp}.json")
-                xlsx = os.path.join(path, f"backup_diff_{timestamp}.xlsx")
-                pdf = os.path.join(path, f"backup_diff_{timestamp}.pdf")
-
-                generate_incremental_json(db, json_file, since)
-                
-                backup_state["progress_percentage"] = 60
-                generate_excel(db, xlsx, since)
-                
-                backup_state["progress_percentage"] = 80
-                generate_pdf(db, pdf, since, "DIFERENCIAL")
-
-                save_last_backup(LAST_BACKUP_FILE)
+                prefix = f"backup_diff_{timestamp}"
+                mode = "DIFERENCIAL"
 
             elif backup_type == "incremental":
                 since = get_last_backup(LAST_BACKUP_FILE)
                 if not since:
                     raise Exception("No existe respaldo previo. Ejecute primero un backup completo.")
+                prefix = f"backup_inc_{timestamp}"
+                mode = "INCREMENTAL"
 
-                backup_state["current_step"] = "Generando backup incremental (.json)"
-                backup_state["progress_percentage"] = 30
-                
-                json_file = os.path.join(path, f"backup_inc_{timestamp}.json")
-                xlsx = os.path.join(path, f"backup_inc_{timestamp}.xlsx")
-                pdf = os.path.join(path, f"backup_inc_{timestamp}.pdf")
+            else:
+                raise Exception("Tipo de respaldo no válido")
 
-                generate_incremental_json(db, json_file, since)
-                
-                backup_state["progress_percentage"] = 60
-                generate_excel(db, xlsx, since)
-                
-                backup_state["progress_percentage"] = 80
-                generate_pdf(db, pdf, since, "INCREMENTAL")
+            job.paso("Sincronizando change log")
+            changes, changelog_seq = None, None
+            if backup_type == "full":
+                changelog_seq = _changelog_start(db)
+            else:
+                changes = _changelog_changes(db, backup_type)
+
+            if changes:
+                # Solo las colecciones con cambios, compactados a la última operación por documento
+                collections = [c for c in changes.colecciones if pipeline.respaldable(c)]
+                source, query = changes.fuente, None
+                changelog_seq = changes.hasta
+                manifest_extra = {"origen": "changelog", "changelog": changes.resumen()}
+            else:
+                collections = pipeline.colecciones_respaldables(db)
+                source, query = None, _construir_query_fechas(since)
+                manifest_extra = {"origen": "completo" if backup_type == "full" else "fechas"}
+                if changelog_seq is not None:
+                    manifest_extra["changelog"] = {"hasta": changelog_seq}
+
+            xlsx = os.path.join(path, f"{prefix}.xlsx")
+            pdf = os.path.join(path, f"{prefix}.pdf")
+            json_out = json_output(path, prefix, backup_type, since, manifest_extra)
+            excel_out = excel.LibroExcel(xlsx)
+            pdf_out = PdfOutput(pdf, since, mode)
+
+            # mongodump corre en su propio proceso a la vez que el pipeline
+            with ThreadPoolExecutor(max_workers=1) as dump_pool:
+                dump = None
+                if backup_type == "full":
+                    archive = os.path.join(path, f"{prefix}.archive")
+                    dump = dump_pool.submit(
+                        _mongodump, job,
+                        [MONGODUMP_PATH, "--uri", mongo_uri, "--db", db_name, f"--archive={archive}"]
+                        + [f"--excludeCollection={c}" for c in pipeline.COLECCIONES_EXCLUIDAS],
+                        archive
+                    )
 
-                save_last_backup(LAST_BACKUP_FILE)
+                job.paso(f"Exportando {len(collections)} colecciones (JSON, Excel, PDF)")
+                job.colecciones(collections, pipeline.PENDIENTE, 20, 85)
+                results = run_pipeline(
+                    db, [json_out, excel_out, pdf_out], query,
+                    progress=_collection_progress(job), collections=collections, source=source
+                )
 
-            else:
-                raise Exception("Tipo de respaldo no válido")
+                # Excel y PDF se escriben al finalizar: sus bytes cuentan en este mismo paso
+                json_file, manifest = json_out.finalizar()
+                excel_out.finalizar()
+                pdf_out.finalizar()
+                job.bytes_paso(
+                    (manifest["total_bytes"] if manifest else 0) + _file_size(json_file)
+                    + _file_size(xlsx) + _file_size(pdf)
+                )
+
+                if dump:
+                    job.paso("Esperando mongodump (.archive)")
+                    dump.result()
+
+            # Un respaldo con colecciones a medias no cuenta: sin fecha de último
+            # respaldo ni marca en el change log, el siguiente vuelve a cubrirlas
+            failed = {c: r.get("error") for c, r in results.items() if r["estado"] == pipeline.ERROR}
+            if failed:
+                raise Exception(
+                    "Fallaron colecciones del respaldo: "
+                    + ", ".join(f"{c} ({error})" for c, error in failed.items())
+                )
+
+            if backup_type == "full":
+                save_last_backup(LAST_FULL_BACKUP_FILE)
+            save_last_backup(LAST_BACKUP_FILE)
 
-            # Calcular tamaño del archivo principal
+            if changelog_seq is not None:
+                if backup_type == "full":
+                    changelog.marcar(changelog.MARCA_FULL, changelog_seq)
+                    # Ningún respaldo necesita ya los cambios anteriores al full
+                    changelog.podar(changelog_seq)
+                changelog.marcar(changelog.MARCA_ULTIMO, changelog_seq)
+
+            # Calcular tamaño del archivo principal (sin .archive: los NDJSON del manifiesto)
             main_file = archive if archive else json_file
-            if main_file and os.path.exists(main_file):
-                file_size = os.path.getsize(main_file) / (1024 * 1024)  # MB
+            if archive and os.path.exists(archive):
+                file_size = os.path.getsize(archive) / (1024 * 1024)  # MB
+            elif manifest:
+                file_size = manifest["total_bytes"] / (1024 * 1024)
 
-            backup_state["generated_files"] = {
+            generated_files = {
                 "db_dump": main_file,
-                "json": json_file,  # AÑADIDO explícitamente para todos los tipos
+                "json": json_file,  # manifiesto .manifest.json (los NDJSON van en su carpeta)
                 "excel": xlsx,
                 "pdf": pdf
             }
 
-            backup_state["progress_percentage"] = 90
-            backup_state["current_step"] = "Guardando historial"
+            job.paso("Guardando historial", 90)
 
             save_history({
                 "date": datetime.now().isoformat(),
                 "type": backup_type,
                 "size": f"{file_size:.2f} MB",
-                "url": main_file
+                "url": main_file,
+                "job_id": job_id
             })
 
-            backup_state["progress_percentage"] = 95
-            backup_state["current_step"] = "Enviando email"
+            job.paso("Enviando email", 95)
             
-            send_email_with_attachments(app, backup_state["generated_files"], backup_type)
+            send_email_with_attachments(app, generated_files, backup_type)
 
-            backup_state["current_step"] = "Completado"
-            backup_state["progress_percentage"] = 100
-            backup_state["last_backup"] = datetime.now()
+            job.completar(generated_files)
 
         except Exception as e:
-            backup_state["current_step"] = f"Error: {str(e)}"
-            backup_state["progress_percentage"] = 0
             print("[BACKUP ERROR]", e)
+            try:
+                job.fallar(e)
+            except Exception as track_error:
+                print(f"[BACKUP ERROR] No se pudo registrar el error del job {job_id}: {track_error}")
             
             save_history({
                 "date": datetime.now().isoformat(),
                 "type": backup_type,
                 "size": "ERROR",
                 "url": None,
-                "error": str(e)
+                "error": str(e),
+                "job_id": job_id
             })
 
         finally:
-            backup_state["is_running"] = False
\ No newline at end of file
+            jobs.liberar_lock(db, job_id)
@@ -1,4 +1,8 @@
 import os
+from dotenv import load_dotenv
+
+# Config se importa antes que app/mongo.py: el .env debe estar cargado aquí
+load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
@@ -13,6 +17,49 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # --- POOL DE MONGODB (app/mongo.py) ---
+    # Un MongoClient por proceso (por worker de gunicorn)
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000))
+    # Cuánto espera una petición por una conexión libre antes de fallar
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    # Lista separada por comas: zlib no requiere paquetes extra (zstd/snappy sí)
+    MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zlib')
+    MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+    MONGO_APP_NAME = os.getenv('MONGO_APP_NAME', 'gym_api')
+
+    # --- ANALÍTICA (app/analytics) ---
+    # 'auto' usa el motor local (NumPy/Pandas) por debajo del umbral de filas y Spark por encima;
+    # 'local' o 'spark' fuerzan uno de los dos.
+    ANALYTICS_MOTOR = os.getenv('ANALYTICS_MOTOR', 'auto')
+    ANALYTICS_UMBRAL_FILAS = int(os.getenv('ANALYTICS_UMBRAL_FILAS', 1000000))
+    # Vida de un resultado en analytics_cache; pasado el TTL (o si cambian los datos
+    # de entrada) se sirve igualmente y se encola el re-entrenamiento
+    ANALYTICS_CACHE_TTL_SEGUNDOS = int(os.getenv('ANALYTICS_CACHE_TTL_SEGUNDOS', 21600))
+
+    # Formato de las rutinas nuevas/editadas: 'normalizado' (rutina_dias + rutina_ejercicios)
+    # o 'embebido' (días y ejercicios dentro de rutinas). Ver spark/DB/migrar_rutinas.py
+    RUTINAS_MODO = os.getenv('RUTINAS_MODO', 'normalizado')
+
+    # --- RESPALDOS (app/backups) ---
+    # Compresión de los archivos NDJSON por colección: 'gzip', 'zstd' (requiere zstandard) o 'none'
+    BACKUP_COMPRESION = os.getenv('BACKUP_COMPRESION', 'gzip')
+    # Documentos por lote al recorrer los cursores (batch_size)
+    BACKUP_LOTE_CURSOR = int(os.getenv('BACKUP_LOTE_CURSOR', 1000))
+    # Colecciones que el pipeline de respaldo procesa a la vez (cada una ocupa una conexión del pool)
+    BACKUP_HILOS = int(os.getenv('BACKUP_HILOS', 4))
+    # Documentos por bulk_write (ReplaceOne con upsert) al restaurar respaldos JSON/NDJSON
+    BACKUP_RESTORE_LOTE = int(os.getenv('BACKUP_RESTORE_LOTE', 1000))
+    # Origen de incrementales y diferenciales: 'changelog' (change streams, requiere replica set
+    # o Atlas; ver app/backups/changelog.py) o 'fechas' (campos fecha_* de cada documento)
+    BACKUP_INCREMENTAL_MODO = os.getenv('BACKUP_INCREMENTAL_MODO', 'changelog')
+    # Cada cuánto sincroniza el proceso `python -m app.backups.changelog`
+    BACKUP_CHANGELOG_INTERVALO = int(os.getenv('BACKUP_CHANGELOG_INTERVALO', 60))
+    # Minutos sin latido tras los que el lock de un respaldo se da por huérfano (worker caído)
+    BACKUP_MINUTOS_HUERFANO = int(os.getenv('BACKUP_MINUTOS_HUERFANO', 10))
+
     # --- CONFIGURACIÓN DE CORREO (AÑADIDA Y CORREGIDA) ---
     # Convertimos el puerto a entero
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
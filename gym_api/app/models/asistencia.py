@@ -1,5 +1,6 @@
-from datetime import datetime, timezone, time
+from datetime import datetime, timezone, time, timedelta
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 from app.mongo import get_db
 
 class Asistencia:
@@ -60,5 +61,78 @@ class Asistencia:
         except Exception:
             return None
             
+    # ──────────────────────────────────────────────
+    # RACHA INCREMENTAL
+    # El miembro guarda racha_actual, ultima_fecha_asistencia y racha_max;
+    # se actualizan en cada check-in y la lectura es O(1).
+    # ──────────────────────────────────────────────
+
+    @staticmethod
+    def registrar_racha(db, id_miembro, fecha):
+        """
+        Actualiza atómicamente la racha del miembro para un check-in en `fecha`
+        (pipeline de actualización: sin leer-modificar-escribir en Python).
+        Repetir el check-in del mismo día no altera la racha.
+        """
+        hoy = datetime(fecha.year, fecha.month, fecha.day)
+        ayer = hoy - timedelta(days=1)
+        return db.miembros.find_one_and_update(
+            {"_id": id_miembro},
+            [
+                {"$set": {
+                    "racha_actual": {"$switch": {
+                        "branches": [
+                            {"case": {"$eq": ["$ultima_fecha_asistencia", hoy]},
+                             "then": {"$ifNull": ["$racha_actual", 1]}},
+                            {"case": {"$eq": ["$ultima_fecha_asistencia", ayer]},
+                             "then": {"$add": [{"$ifNull": ["$racha_actual", 0]}, 1]}}
+                        ],
+                        "default": 1
+                    }}
+                }},
+                {"$set": {
+                    "ultima_fecha_asistencia": hoy,
+                    "racha_max": {"$max": [{"$ifNull": ["$racha_max", 0]}, "$racha_actual"]}
+                }}
+            ],
+            projection={"racha_actual": 1, "racha_max": 1, "ultima_fecha_asistencia": 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def racha_vigente(miembro_doc, hoy=None):
+        """Racha guardada en el miembro; vale 0 si la última asistencia fue antes de ayer."""
+        if not miembro_doc:
+            return 0
+        ultima = miembro_doc.get("ultima_fecha_asistencia")
+        if not ultima:
+            return 0
+        hoy = hoy or datetime.now().date()
+        ultima = ultima.date() if isinstance(ultima, datetime) else ultima
+        if (hoy - ultima).days > 1:
+            return 0
+        return int(miembro_doc.get("racha_actual") or 0)
+
+    @staticmethod
+    def calcular_rachas(fechas):
+        """
+        Recalcula (racha_actual, racha_max, ultima_fecha) desde un historial de fechas
+        (datetime/date/str, en cualquier orden y con repetidos). Se usa para reparar datos.
+        """
+        dias = set()
+        for f in fechas:
+            if isinstance(f, datetime): f = f.date()
+            elif isinstance(f, str): f = datetime.strptime(f[:10], "%Y-%m-%d").date()
+            if f: dias.add(f)
+        if not dias:
+            return 0, 0, None
+
+        ordenados = sorted(dias)
+        racha_max = racha = 1
+        for anterior, actual in zip(ordenados, ordenados[1:]):
+            racha = racha + 1 if (actual - anterior).days == 1 else 1
+            racha_max = max(racha_max, racha)
+        return racha, racha_max, ordenados[-1]
+
     def __repr__(self):
         return f'<Asistencia {self._id} - Miembro {self.id_miembro}>'
\ No newline at end of file
@@ -0,0 +1,140 @@
+from datetime import datetime
+from pymongo import ReplaceOne
+
+
+class MemberFeatures:
+    """
+    Features físicas de cada miembro ya materializadas (_id = id del miembro),
+    las que K-Means y la regresión derivaban en cada entrenamiento:
+    datos del perfil (sexo, peso_inicial, estatura) y el último registro de
+    progreso (peso, bmi, grasa_corporal, masa_muscular, cintura), más la fecha
+    del primer registro para calcular los días desde el inicio.
+
+    Se guardan los valores crudos; la imputación (medias, 20% de grasa...) la
+    sigue haciendo cada motor. Se actualiza al insertar progreso y al guardar
+    el miembro; spark/DB/refrescar_member_features.py la reconstruye completa.
+    """
+    collection = "member_features"
+
+    CAMPOS_MIEMBRO = ["id_usuario", "sexo", "peso_inicial", "estatura"]
+    CAMPOS_PROGRESO = ["peso", "bmi", "grasa_corporal", "masa_muscular", "cintura"]
+
+    @classmethod
+    def _datos_miembro(cls, miembro):
+        return {c: miembro.get(c) for c in cls.CAMPOS_MIEMBRO}
+
+    # ──────────────────────────────────────────────
+    # ACTUALIZACIÓN INCREMENTAL
+    # ──────────────────────────────────────────────
+
+    @classmethod
+    def registrar_progreso(cls, db, miembro, progreso):
+        """
+        Aplica un registro de progreso recién insertado. Sus medidas pasan a ser
+        las últimas solo si no es anterior a fecha_ultimo (un registro con fecha
+        atrasada solo cuenta para fecha_inicio y num_registros). Un update con
+        pipeline para decidirlo en el servidor, sin leer antes el documento.
+        """
+        fecha = progreso.get("fecha_registro")
+        es_ultimo = {"$or": [
+            {"$eq": [{"$ifNull": ["$fecha_ultimo", None]}, None]},
+            {"$lte": ["$fecha_ultimo", {"$literal": fecha}]}
+        ]}
+        db[cls.collection].update_one(
+            {"_id": miembro["_id"]},
+            [
+                {"$set": {"_es_ultimo": es_ultimo}},
+                {"$set": {
+                    **{c: {"$literal": v} for c, v in cls._datos_miembro(miembro).items()},
+                    **{
+                        c: {"$cond": ["$_es_ultimo", {"$literal": progreso.get(c)}, f"${c}"]}
+                        for c in cls.CAMPOS_PROGRESO
+                    },
+                    # $min/$max de agregación ignoran los null (documento nuevo)
+                    "fecha_inicio": {"$min": ["$fecha_inicio", {"$literal": fecha}]},
+                    "fecha_ultimo": {"$max": ["$fecha_ultimo", {"$literal": fecha}]},
+                    "num_registros": {"$add": [{"$ifNull": ["$num_registros", 0]}, 1]},
+                    "fecha_calculo": datetime.now()
+                }},
+                {"$unset": "_es_ultimo"}
+            ],
+            upsert=True
+        )
+
+    @classmethod
+    def actualizar_miembro(cls, db, miembro):
+        """Refleja cambios del perfil (alta del miembro, estatura, sexo...)."""
+        db[cls.collection].update_one(
+            {"_id": miembro["_id"]},
+            {
+                "$set": {**cls._datos_miembro(miembro), "fecha_calculo": datetime.now()},
+                "$setOnInsert": {
+                    **{c: None for c in cls.CAMPOS_PROGRESO},
+                    "fecha_inicio": None, "fecha_ultimo": None, "num_registros": 0
+                }
+            },
+            upsert=True
+        )
+
+    # ──────────────────────────────────────────────
+    # RECONSTRUCCIÓN
+    # ──────────────────────────────────────────────
+
+    @classmethod
+    def reconstruir(cls, db, lote=1000):
+        """Recalcula todos los documentos: una agregación sobre progreso_fisico y un recorrido de miembros."""
+        ultimos = {
+            g["_id"]: g for g in db.progreso_fisico.aggregate([
+                {"$sort": {"id_miembro": 1, "fecha_registro": -1}},
+                {"$group": {
+                    "_id": "$id_miembro",
+                    **{c: {"$first": f"${c}"} for c in cls.CAMPOS_PROGRESO},
+                    "fecha_inicio": {"$min": "$fecha_registro"},
+                    "fecha_ultimo": {"$max": "$fecha_registro"},
+                    "num_registros": {"$sum": 1}
+                }}
+            ], allowDiskUse=True)
+        }
+
+        def _fuente():
+            # Todos los miembros y, además, los id_miembro de progreso sin miembro
+            # (los motores entrenan con todo progreso_fisico)
+            vistos = set()
+            for miembro in db.miembros.find({}, {c: 1 for c in cls.CAMPOS_MIEMBRO}):
+                vistos.add(miembro["_id"])
+                yield miembro
+            for id_miembro in ultimos:
+                if id_miembro is not None and id_miembro not in vistos:
+                    yield {"_id": id_miembro}
+
+        now = datetime.now()
+        ops, total = [], 0
+        for miembro in _fuente():
+            ultimo = ultimos.get(miembro["_id"], {})
+            ops.append(ReplaceOne({"_id": miembro["_id"]}, {
+                "_id": miembro["_id"],
+                **cls._datos_miembro(miembro),
+                **{c: ultimo.get(c) for c in cls.CAMPOS_PROGRESO},
+                "fecha_inicio": ultimo.get("fecha_inicio"),
+                "fecha_ultimo": ultimo.get("fecha_ultimo"),
+                "num_registros": ultimo.get("num_registros", 0),
+                "fecha_calculo": now
+            }, upsert=True))
+            if len(ops) >= lote:
+                db[cls.collection].bulk_write(ops, ordered=False)
+                total += len(ops)
+                ops = []
+        if ops:
+            db[cls.collection].bulk_write(ops, ordered=False)
+            total += len(ops)
+
+        # Lo que no se reescribió en esta pasada es de miembros eliminados
+        # (las actualizaciones concurrentes llevan una fecha_calculo posterior)
+        db[cls.collection].delete_many({"fecha_calculo": {"$lt": now}})
+        return total
+
+    @classmethod
+    def asegurar(cls, db):
+        """Construye la colección la primera vez que un motor la necesita."""
+        if db[cls.collection].estimated_document_count() == 0 and db.miembros.estimated_document_count() > 0:
+            cls.reconstruir(db)
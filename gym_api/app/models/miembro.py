@@ -1,5 +1,9 @@
+from datetime import datetime, timezone
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.utils.busqueda import CAMPO_TOKENS
+from app.models.member_features import MemberFeatures
+from app.models.trainer_client_stats import TrainerClientStats
 
 class Miembro:
     collection = "miembros"
@@ -8,7 +12,8 @@ class Miembro:
                  peso_inicial=None, estatura=None, fecha_registro=None, estado="Activo",
                  foto_perfil=None, id_entrenador=None, objetivo=None, peso_objetivo=None,
                  grasa_objetivo=None, masa_muscular_objetivo=None, fecha_asignacion=None,
-                 ultima_sesion=None, _id=None):
+                 ultima_sesion=None, _id=None, **kwargs):
+        # kwargs absorbe campos derivados (p. ej. busqueda_tokens) que no se reescriben en save()
         self._id = _id
         self.id_usuario = ObjectId(id_usuario) if isinstance(id_usuario, str) else id_usuario
         self.telefono = telefono
@@ -30,27 +35,35 @@ class Miembro:
 
     def to_dict(self):
         db = get_db()
-        foto_url = f"/static/uploads/{self.foto_perfil}" if self.foto_perfil else None
 
         # --- Obtener datos del Usuario ---
         usuario_doc = db.usuarios.find_one({"_id": self.id_usuario}) if self.id_usuario else None
-        nombre_usuario = usuario_doc["nombre"] if usuario_doc and "nombre" in usuario_doc else "Sin Usuario"
-        email_usuario = usuario_doc["email"] if usuario_doc and "email" in usuario_doc else "Sin Email"
 
         # --- Obtener Membresía Activa ---
-        membresia_activa_data = None
+        membresia_doc = None
         # Buscar la asignación de membresía activa para este miembro
         mm_doc = db.miembro_membresia.find_one({"id_miembro": self._id, "estado": "Activa"})
         if mm_doc:
             # Si hay asignación, buscar los detalles de la membresía (nombre)
             membresia_doc = db.membresias.find_one({"_id": mm_doc["id_membresia"]})
-            if membresia_doc:
-                membresia_activa_data = {
-                    "nombre": membresia_doc["nombre"],
-                    "fecha_inicio": str(mm_doc.get("fecha_inicio", "")),
-                    "fecha_fin": str(mm_doc.get("fecha_fin", "")),
-                    "estado": mm_doc["estado"]
-                }
+
+        return self._serializar(usuario_doc, mm_doc, membresia_doc)
+
+    def _serializar(self, usuario_doc, mm_doc, membresia_doc):
+        """Arma el diccionario de salida a partir de los documentos ya resueltos."""
+        foto_url = f"/static/uploads/{self.foto_perfil}" if self.foto_perfil else None
+
+        nombre_usuario = usuario_doc["nombre"] if usuario_doc and "nombre" in usuario_doc else "Sin Usuario"
+        email_usuario = usuario_doc["email"] if usuario_doc and "email" in usuario_doc else "Sin Email"
+
+        membresia_activa_data = None
+        if mm_doc and membresia_doc:
+            membresia_activa_data = {
+                "nombre": membresia_doc["nombre"],
+                "fecha_inicio": str(mm_doc.get("fecha_inicio", "")),
+                "fecha_fin": str(mm_doc.get("fecha_fin", "")),
+                "estado": mm_doc["estado"]
+            }
 
         return {
             "id": str(self._id) if self._id else None,
@@ -79,10 +92,19 @@ class Miembro:
             del data["_id"]
 
         if self._id:
+            # fecha_actualizacion: la huella de app/analytics/cache.py detecta las ediciones
+            data["fecha_actualizacion"] = datetime.now(timezone.utc)
             db[self.collection].update_one({"_id": self._id}, {"$set": data})
         else:
+            # Al crear, copiamos los tokens de búsqueda ya calculados en el usuario
+            usuario_doc = db.usuarios.find_one({"_id": self.id_usuario}, {CAMPO_TOKENS: 1}) if self.id_usuario else None
+            if usuario_doc and usuario_doc.get(CAMPO_TOKENS):
+                data[CAMPO_TOKENS] = usuario_doc[CAMPO_TOKENS]
             result = db[self.collection].insert_one(data)
             self._id = result.inserted_id
+        MemberFeatures.actualizar_miembro(db, {**data, "_id": self._id})
+        # Alta o cambio de entrenador: la fila en la cartera del entrenador (o su baja)
+        TrainerClientStats.refrescar(db, self._id)
         return self._id
 
     @classmethod
@@ -108,19 +130,13 @@ class Miembro:
             diferencia = abs(self.peso_inicial - float(progreso_reciente.get("peso", 0)))
             progreso_porcentaje = min(int((diferencia / self.peso_inicial) * 100), 100)
             
-        # Calcular racha (días consecutivos con asistencia)
+        # Racha (días consecutivos con asistencia), mantenida en cada check-in
+        from app.models.asistencia import Asistencia
         fecha_actual = date.today()
-        racha = 0
-        for i in range(30):
-            fecha_check = (fecha_actual - timedelta(days=i)).strftime('%Y-%m-%d')
-            asistencia = db.asistencias.find_one({
-                "id_miembro": self._id,
-                "fecha": fecha_check # Recuerda que guardamos fechas aisladas o como str
-            })
-            if asistencia:
-                racha += 1
-            elif i > 0:
-                break
+        racha = Asistencia.racha_vigente(
+            db[self.collection].find_one({"_id": self._id}, {"racha_actual": 1, "ultima_fecha_asistencia": 1}),
+            fecha_actual
+        )
                 
         # Total de sesiones
         sesiones_total = db.sesiones.count_documents({
@@ -220,7 +236,9 @@ class Miembro:
     def to_dict_full(self, include_stats=False):
         """Reemplaza al to_dict() sobrecargado, evita recursión infinita"""
         base_dict = self.to_dict() # Llama al to_dict() original que creamos antes
-        
+        return self._completar_dict_full(base_dict, include_stats)
+
+    def _completar_dict_full(self, base_dict, include_stats=False):
         # Añadimos datos extra que pedía tu función original
         base_dict['id'] = str(self._id)
         base_dict['birthDate'] = str(self.fecha_nacimiento) if self.fecha_nacimiento else None
@@ -240,4 +258,48 @@ class Miembro:
                 'stats': client_card['stats']
             })
             
-        return base_dict
\ No newline at end of file
+        return base_dict
+
+    @classmethod
+    def to_dicts_bulk(cls, docs, include_stats=False):
+        """
+        Versión por lotes de to_dict_full() para una página de miembros.
+        Resuelve usuarios, membresías activas y planes con una consulta $in
+        por colección (3 en total) en lugar de 3 consultas por miembro.
+        Acepta documentos crudos de Mongo o instancias de Miembro.
+        """
+        miembros = [d if isinstance(d, cls) else cls(**d) for d in docs]
+        if not miembros:
+            return []
+
+        db = get_db()
+
+        # --- Usuarios de toda la página ---
+        ids_usuario = list({m.id_usuario for m in miembros if m.id_usuario})
+        usuarios = {}
+        if ids_usuario:
+            cursor = db.usuarios.find({"_id": {"$in": ids_usuario}}, {"nombre": 1, "email": 1})
+            usuarios = {u["_id"]: u for u in cursor}
+
+        # --- Asignaciones activas (se conserva la primera, igual que find_one) ---
+        ids_miembro = [m._id for m in miembros if m._id]
+        asignaciones = {}
+        if ids_miembro:
+            cursor = db.miembro_membresia.find({"id_miembro": {"$in": ids_miembro}, "estado": "Activa"})
+            for mm in cursor:
+                asignaciones.setdefault(mm["id_miembro"], mm)
+
+        # --- Planes referenciados por esas asignaciones ---
+        ids_membresia = list({mm["id_membresia"] for mm in asignaciones.values() if mm.get("id_membresia")})
+        membresias = {}
+        if ids_membresia:
+            cursor = db.membresias.find({"_id": {"$in": ids_membresia}}, {"nombre": 1})
+            membresias = {p["_id"]: p for p in cursor}
+
+        resultado = []
+        for m in miembros:
+            mm_doc = asignaciones.get(m._id)
+            membresia_doc = membresias.get(mm_doc.get("id_membresia")) if mm_doc else None
+            base_dict = m._serializar(usuarios.get(m.id_usuario), mm_doc, membresia_doc)
+            resultado.append(m._completar_dict_full(base_dict, include_stats))
+        return resultado
@@ -5,7 +5,8 @@ from app.mongo import get_db
 class Pago:
     collection = "pagos"
 
-    def __init__(self, id_miembro, monto, metodo_pago, concepto, id_entrenador=None, fecha_pago=None, _id=None):
+    def __init__(self, id_miembro, monto, metodo_pago, concepto, id_entrenador=None, fecha_pago=None,
+                 fecha_actualizacion=None, _id=None):
         self._id = _id
         self.id_miembro = ObjectId(id_miembro) if isinstance(id_miembro, str) else id_miembro
         self.id_entrenador = ObjectId(id_entrenador) if isinstance(id_entrenador, str) and id_entrenador else id_entrenador
@@ -13,6 +14,7 @@ class Pago:
         self.metodo_pago = metodo_pago
         self.concepto = concepto
         self.fecha_pago = fecha_pago or datetime.now(timezone.utc)
+        self.fecha_actualizacion = fecha_actualizacion
 
     def to_dict(self):
         db = get_db()
@@ -51,6 +53,8 @@ class Pago:
         }
         
         if self._id:
+            # fecha_actualizacion: la huella de app/analytics/cache.py detecta las ediciones
+            self.fecha_actualizacion = data["fecha_actualizacion"] = datetime.now(timezone.utc)
             db[self.collection].update_one({"_id": self._id}, {"$set": data})
         else:
             result = db[self.collection].insert_one(data)
@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.models.member_features import MemberFeatures
 
 class ProgresoFisico:
     collection = "progreso_fisico"
@@ -8,7 +9,7 @@ class ProgresoFisico:
     def __init__(self, id_miembro, peso=None, bmi=None, grasa_corporal=None, masa_muscular=None,
                  agua_corporal=None, masa_osea=None, cintura=None, cadera=None, pecho=None,
                  brazo_derecho=None, brazo_izquierdo=None, muslo_derecho=None, muslo_izquierdo=None,
-                 pantorrilla=None, notas=None, fecha_registro=None, _id=None):
+                 pantorrilla=None, notas=None, fecha_registro=None, fecha_actualizacion=None, _id=None):
         
         self._id = _id
         self.id_miembro = ObjectId(id_miembro) if isinstance(id_miembro, str) else id_miembro
@@ -32,6 +33,7 @@ class ProgresoFisico:
         
         self.notas = notas
         self.fecha_registro = fecha_registro or datetime.now(timezone.utc)
+        self.fecha_actualizacion = fecha_actualizacion
 
     def to_dict(self):
         return {
@@ -62,12 +64,26 @@ class ProgresoFisico:
             del data["_id"]
             
         if self._id:
+            # fecha_actualizacion: la huella de app/analytics/cache.py detecta las ediciones
+            self.fecha_actualizacion = data["fecha_actualizacion"] = datetime.now(timezone.utc)
             db[self.collection].update_one({"_id": self._id}, {"$set": data})
         else:
+            if data.get("fecha_actualizacion") is None:
+                data.pop("fecha_actualizacion", None)
             result = db[self.collection].insert_one(data)
             self._id = result.inserted_id
         return self._id
 
+    @classmethod
+    def registrar(cls, db, miembro, progreso):
+        """
+        Inserta un registro de progreso (dict crudo) y lo aplica a member_features,
+        para que K-Means y la regresión no sigan con las medidas anteriores.
+        """
+        db[cls.collection].insert_one(progreso)
+        MemberFeatures.registrar_progreso(db, miembro, progreso)
+        return progreso["_id"]
+
     def calcular_bmi(self, estatura_metros):
         if self.peso and estatura_metros and estatura_metros > 0:
             self.bmi = round(self.peso / (estatura_metros ** 2), 2)
@@ -1,5 +1,7 @@
 from datetime import datetime, timezone
 from bson.objectid import ObjectId
+from pymongo import InsertOne, ReplaceOne, UpdateOne, DeleteMany
+from app.config import Config
 from app.mongo import get_db
 
 class Rutina:
@@ -7,7 +9,7 @@ class Rutina:
 
     def __init__(self, nombre, id_miembro=None, id_entrenador=None, objetivo=None,
                  categoria=None, dificultad=None, duracion_minutos=60, descripcion=None,
-                 activa=True, fecha_creacion=None, fecha_actualizacion=None, _id=None):
+                 activa=True, fecha_creacion=None, fecha_actualizacion=None, _id=None, **kwargs):
         self._id = _id
         self.id_miembro = ObjectId(id_miembro) if isinstance(id_miembro, str) and id_miembro else id_miembro
         self.id_entrenador = ObjectId(id_entrenador) if isinstance(id_entrenador, str) and id_entrenador else id_entrenador
@@ -49,18 +51,8 @@ class Rutina:
     def get_dias(self):
         """Obtiene los días de la rutina y sus ejercicios"""
         if not self._id: return []
-        db = get_db()
-        
-        # Busca los días ordenados por el campo 'orden'
-        dias_cursor = db.rutina_dias.find({"id_rutina": self._id}).sort("orden", 1)
-        dias = list(dias_cursor)
-        
-        # Para cada día, busca sus ejercicios ordenados por 'orden'
-        for dia in dias:
-            ejercicios_cursor = db.rutina_ejercicios.find({"id_rutina_dia": dia["_id"]}).sort("orden", 1)
-            dia["ejercicios"] = list(ejercicios_cursor)
-            
-        return dias
+        arbol = RutinaRepositorio.buscar_uno(get_db(), {"_id": self._id})
+        return arbol["dias"] if arbol else []
 
     @classmethod
     def find_by_id(cls, rutina_id):
@@ -162,4 +154,351 @@ class MiembroRutina:
         else:
             result = db[self.collection].insert_one(self.to_dict())
             self._id = result.inserted_id
-        return self._id
\ No newline at end of file
+        return self._id
+
+class RutinaRepositorio:
+    """
+    Acceso a rutinas completas (rutina → días → ejercicios) con dos formatos:
+
+    - "normalizado": días y ejercicios en `rutina_dias` / `rutina_ejercicios`
+      (el esquema heredado de db2.sql). Se leen con dos $in para todas las
+      rutinas pedidas y se arman en memoria.
+    - "embebido": días y ejercicios como arreglos dentro del propio documento
+      de `rutinas` (campo "dias"). Leer una rutina es un solo documento.
+
+    Las lecturas detectan el formato por documento (si tiene "dias" está
+    embebido), así conviven ambos mientras corre spark/DB/migrar_rutinas.py.
+    Las escrituras usan Config.RUTINAS_MODO y convierten al vuelo las rutinas
+    que estaban en el otro formato.
+
+    Las escrituras de varios documentos van en una transacción si el servidor
+    la admite (replica set o mongos). En un MongoDB standalone se hacen en
+    orden, con la cabecera de `rutinas` al final al crear o actualizar y al
+    principio al borrar: un alta o un borrado interrumpido deja filas
+    huérfanas que ninguna lectura alcanza; una edición interrumpida puede
+    quedar a medias y se corrige volviendo a guardarla.
+    """
+
+    MODO_NORMALIZADO = "normalizado"
+    MODO_EMBEBIDO = "embebido"
+
+    @classmethod
+    def embebido(cls):
+        return Config.RUTINAS_MODO == cls.MODO_EMBEBIDO
+
+    # ──────────────────────────────────────────────
+    # LECTURA
+    # ──────────────────────────────────────────────
+
+    @staticmethod
+    def _arbol_embebido(rutina):
+        """Agrega las referencias al padre para que el árbol sea igual al normalizado."""
+        dias = []
+        for dia in sorted(rutina.get("dias") or [], key=lambda d: d.get("orden", 0)):
+            ejercicios = [
+                dict(ej, id_rutina_dia=dia["_id"])
+                for ej in sorted(dia.get("ejercicios") or [], key=lambda e: e.get("orden", 0))
+            ]
+            dias.append(dict(dia, id_rutina=rutina["_id"], ejercicios=ejercicios))
+        return dict(rutina, dias=dias)
+
+    @classmethod
+    def cargar_arboles(cls, db, rutinas_docs):
+        """
+        Recibe documentos de `rutinas` y devuelve copias con la clave "dias"
+        (ordenados por 'orden'), cada día con su lista "ejercicios" (también ordenada).
+        Los documentos embebidos no generan consultas; los normalizados, dos en total.
+        """
+        rutinas_docs = list(rutinas_docs)
+        if not rutinas_docs:
+            return []
+
+        ids_rutina = [r["_id"] for r in rutinas_docs if "dias" not in r]
+        dias = []
+        if ids_rutina:
+            dias = list(db.rutina_dias.find({"id_rutina": {"$in": ids_rutina}}).sort("orden", 1))
+
+        ejercicios_por_dia = {}
+        if dias:
+            ejercicios = db.rutina_ejercicios.find(
+                {"id_rutina_dia": {"$in": [d["_id"] for d in dias]}}
+            ).sort("orden", 1)
+            for ej in ejercicios:
+                ejercicios_por_dia.setdefault(ej["id_rutina_dia"], []).append(ej)
+
+        dias_por_rutina = {}
+        for dia in dias:
+            dia["ejercicios"] = ejercicios_por_dia.get(dia["_id"], [])
+            dias_por_rutina.setdefault(dia["id_rutina"], []).append(dia)
+
+        return [
+            cls._arbol_embebido(r) if "dias" in r else dict(r, dias=dias_por_rutina.get(r["_id"], []))
+            for r in rutinas_docs
+        ]
+
+    @classmethod
+    def buscar(cls, db, filtro, sort=None):
+        """find() sobre `rutinas` + cargar_arboles() en un solo paso."""
+        cursor = db[Rutina.collection].find(filtro)
+        if sort:
+            cursor = cursor.sort(sort)
+        return cls.cargar_arboles(db, cursor)
+
+    @classmethod
+    def buscar_uno(cls, db, filtro):
+        """Una rutina con su árbol, o None si no existe / no cumple el filtro."""
+        rutina = db[Rutina.collection].find_one(filtro)
+        return cls.cargar_arboles(db, [rutina])[0] if rutina else None
+
+    # ──────────────────────────────────────────────
+    # ESCRITURA
+    # Los ObjectId se generan en el cliente. En modo normalizado todos los días
+    # y todos los ejercicios van en una sola operación por colección dentro de
+    # una transacción: nunca queda visible una rutina sin días. En modo
+    # embebido la rutina es un único documento y la escritura ya es atómica.
+    # `dias` es una lista de dicts con los campos de RutinaDia más una clave
+    # "ejercicios" con los campos de RutinaEjercicio (mismo formato que el árbol).
+    # ──────────────────────────────────────────────
+
+    @staticmethod
+    def _admite_transacciones(db):
+        # get_client() ya hizo ping: la topología es conocida
+        return db.client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+    @classmethod
+    def _en_transaccion(cls, db, operacion):
+        """
+        Ejecuta operacion(session) en una transacción (with_transaction reintenta
+        errores transitorios) o, en un standalone, sin sesión (session=None).
+        """
+        if not cls._admite_transacciones(db):
+            return operacion(None)
+        with db.client.start_session() as session:
+            return session.with_transaction(operacion)
+
+    @staticmethod
+    def _campos(doc, excluir):
+        return {k: v for k, v in doc.items() if k not in excluir}
+
+    @classmethod
+    def _preparar_dias(cls, id_rutina, dias):
+        """Devuelve [(doc_dia, [docs_ejercicio])] con _id nuevos y referencias ya resueltas."""
+        pares = []
+        for dia in dias:
+            doc_dia = dict(cls._campos(dia, ("_id", "id_rutina", "ejercicios")), _id=ObjectId(), id_rutina=id_rutina)
+            docs_ej = [
+                dict(cls._campos(ej, ("_id", "id_rutina_dia")), _id=ObjectId(), id_rutina_dia=doc_dia["_id"])
+                for ej in dia.get("ejercicios", [])
+            ]
+            pares.append((doc_dia, docs_ej))
+        return pares
+
+    @classmethod
+    def _dias_embebidos(cls, pares):
+        """Convierte [(doc_dia, [docs_ejercicio])] al arreglo que se guarda en rutinas.dias."""
+        return [
+            dict(
+                cls._campos(dia, ("id_rutina",)),
+                ejercicios=[cls._campos(ej, ("id_rutina_dia",)) for ej in ejercicios]
+            )
+            for dia, ejercicios in pares
+        ]
+
+    @staticmethod
+    def _diff(previos, nuevos, ops):
+        """
+        Compara por posición: reutiliza el _id del documento previo, agrega un
+        ReplaceOne solo si el documento cambió (así no quedan campos del previo,
+        como en el modo embebido), InsertOne para los sobrantes nuevos y
+        devuelve (docs con _id, ids previos que ya no existen).
+        """
+        resultado = []
+        for i, nuevo in enumerate(nuevos):
+            previo = previos[i] if i < len(previos) else None
+            if previo is None:
+                doc = dict(nuevo, _id=ObjectId())
+                ops.append(InsertOne(doc))
+            else:
+                doc = dict(nuevo, _id=previo["_id"])
+                if doc != previo:
+                    ops.append(ReplaceOne({"_id": previo["_id"]}, doc))
+            resultado.append(doc)
+        eliminados = [p["_id"] for p in previos[len(nuevos):]]
+        if eliminados:
+            ops.append(DeleteMany({"_id": {"$in": eliminados}}))
+        return resultado, eliminados
+
+    @staticmethod
+    def _borrar_normalizado(db, ids_dia, session=None):
+        if ids_dia:
+            db[RutinaEjercicio.collection].delete_many({"id_rutina_dia": {"$in": ids_dia}}, session=session)
+            db[RutinaDia.collection].delete_many({"_id": {"$in": ids_dia}}, session=session)
+
+    @classmethod
+    def crear(cls, db, rutina, dias):
+        """Inserta rutina + días + ejercicios y devuelve el árbol armado en memoria."""
+        rutina = dict(cls._campos(rutina, ("_id", "dias")), _id=ObjectId())
+        pares = cls._preparar_dias(rutina["_id"], dias)
+        arbol = dict(rutina, dias=[dict(d, ejercicios=ejs) for d, ejs in pares])
+
+        if cls.embebido():
+            db[Rutina.collection].insert_one(dict(rutina, dias=cls._dias_embebidos(pares)))
+            return arbol
+
+        docs_dias = [d for d, _ in pares]
+        docs_ej = [e for _, ejs in pares for e in ejs]
+
+        def operacion(session):
+            if docs_dias:
+                db[RutinaDia.collection].insert_many(docs_dias, session=session)
+            if docs_ej:
+                db[RutinaEjercicio.collection].insert_many(docs_ej, session=session)
+            db[Rutina.collection].insert_one(rutina, session=session)
+
+        cls._en_transaccion(db, operacion)
+        return arbol
+
+    @classmethod
+    def _actualizar_embebido(cls, db, rutina_doc, actuales, cambios, dias):
+        """Reemplaza el arreglo "dias" conservando por posición los _id existentes."""
+        rutina_id = rutina_doc["_id"]
+        pares = []
+        for i, dia in enumerate(dias):
+            previo = actuales[i] if i < len(actuales) else {}
+            id_dia = previo.get("_id") or ObjectId()
+            ej_previos = previo.get("ejercicios", [])
+            doc_dia = dict(cls._campos(dia, ("_id", "id_rutina", "ejercicios")), _id=id_dia, id_rutina=rutina_id)
+            docs_ej = [
+                dict(
+                    cls._campos(ej, ("_id", "id_rutina_dia")),
+                    _id=ej_previos[j]["_id"] if j < len(ej_previos) else ObjectId(),
+                    id_rutina_dia=id_dia
+                )
+                for j, ej in enumerate(dia.get("ejercicios", []))
+            ]
+            pares.append((doc_dia, docs_ej))
+
+        set_rutina = dict(cambios, dias=cls._dias_embebidos(pares))
+        if "dias" in rutina_doc:
+            db[Rutina.collection].update_one({"_id": rutina_id}, {"$set": set_rutina})
+        else:
+            # La rutina venía normalizada: se embebe y se borran sus filas en la misma transacción
+            # (sin transacción, una vez embebida las filas sobrantes ya no se leen)
+            def operacion(session):
+                db[Rutina.collection].update_one({"_id": rutina_id}, {"$set": set_rutina}, session=session)
+                cls._borrar_normalizado(db, [d["_id"] for d in actuales], session=session)
+            cls._en_transaccion(db, operacion)
+
+        return dict(cls._campos(rutina_doc, ("dias",)), **cambios, dias=[dict(d, ejercicios=ejs) for d, ejs in pares])
+
+    @classmethod
+    def actualizar(cls, db, rutina_doc, cambios, dias):
+        """
+        Aplica `cambios` a la rutina y reemplaza sus días por `dias` calculando
+        la diferencia con lo guardado (en vez de borrar todo y reinsertar).
+        Devuelve el árbol resultante sin volver a leerlo.
+        """
+        rutina_id = rutina_doc["_id"]
+        actuales = cls.cargar_arboles(db, [rutina_doc])[0]["dias"]
+
+        if cls.embebido():
+            return cls._actualizar_embebido(db, rutina_doc, actuales, cambios, dias)
+
+        # Una rutina embebida en modo normalizado se vuelve a escribir en filas
+        era_embebida = "dias" in rutina_doc
+        previos_dias = [] if era_embebida else actuales
+
+        ops_dias, ops_ej = [], []
+        nuevos_dias = [dict(cls._campos(d, ("_id", "id_rutina", "ejercicios")), id_rutina=rutina_id) for d in dias]
+        docs_dias, dias_eliminados = cls._diff(
+            [cls._campos(d, ("ejercicios",)) for d in previos_dias], nuevos_dias, ops_dias
+        )
+        if dias_eliminados:
+            ops_ej.append(DeleteMany({"id_rutina_dia": {"$in": dias_eliminados}}))
+
+        arbol_dias = []
+        for i, doc_dia in enumerate(docs_dias):
+            previos = previos_dias[i]["ejercicios"] if i < len(previos_dias) else []
+            nuevos_ej = [
+                dict(cls._campos(ej, ("_id", "id_rutina_dia")), id_rutina_dia=doc_dia["_id"])
+                for ej in dias[i].get("ejercicios", [])
+            ]
+            docs_ej, _ = cls._diff(previos, nuevos_ej, ops_ej)
+            arbol_dias.append(dict(doc_dia, ejercicios=docs_ej))
+
+        update_rutina = {}
+        if cambios:
+            update_rutina["$set"] = cambios
+        if era_embebida:
+            update_rutina["$unset"] = {"dias": ""}
+
+        def operacion(session):
+            if ops_dias:
+                db[RutinaDia.collection].bulk_write(ops_dias, session=session)
+            if ops_ej:
+                db[RutinaEjercicio.collection].bulk_write(ops_ej, session=session)
+            # Cabecera al final: al quitar "dias" las filas ya están escritas
+            if update_rutina:
+                db[Rutina.collection].update_one({"_id": rutina_id}, update_rutina, session=session)
+
+        cls._en_transaccion(db, operacion)
+        return dict(cls._campos(rutina_doc, ("dias",)), **cambios, dias=arbol_dias)
+
+    @classmethod
+    def duplicar(cls, db, arbol_original, cambios):
+        """Copia una rutina (árbol de cargar_arboles) con ids nuevos, aplicando `cambios` a la cabecera."""
+        rutina = dict(cls._campos(arbol_original, ("_id", "dias")), **cambios)
+        return cls.crear(db, rutina, arbol_original.get("dias", []))
+
+    @classmethod
+    def eliminar(cls, db, rutina_doc):
+        """Borra la rutina con sus días y ejercicios (en cualquiera de los dos formatos)."""
+        if "dias" in rutina_doc:
+            db[Rutina.collection].delete_one({"_id": rutina_doc["_id"]})
+            return
+
+        ids_dia = [d["_id"] for d in db[RutinaDia.collection].find({"id_rutina": rutina_doc["_id"]}, {"_id": 1})]
+
+        def operacion(session):
+            db[Rutina.collection].delete_one({"_id": rutina_doc["_id"]}, session=session)
+            cls._borrar_normalizado(db, ids_dia, session=session)
+
+        cls._en_transaccion(db, operacion)
+
+    # ──────────────────────────────────────────────
+    # CONVERSIÓN (usada por spark/DB/migrar_rutinas.py)
+    # ──────────────────────────────────────────────
+
+    @classmethod
+    def ops_embeber(cls, db, rutinas_docs):
+        """
+        Para un lote de rutinas normalizadas devuelve (ops de `rutinas`, ids de días a borrar):
+        cada rutina recibe su arreglo "dias" conservando todos los _id.
+        """
+        ops, ids_dia = [], []
+        for arbol in cls.cargar_arboles(db, [r for r in rutinas_docs if "dias" not in r]):
+            pares = [(cls._campos(d, ("ejercicios",)), d["ejercicios"]) for d in arbol["dias"]]
+            ids_dia.extend(d["_id"] for d, _ in pares)
+            ops.append(UpdateOne({"_id": arbol["_id"]}, {"$set": {"dias": cls._dias_embebidos(pares)}}))
+        return ops, ids_dia
+
+    @classmethod
+    def filas_normalizadas(cls, rutinas_docs):
+        """Inverso de ops_embeber: (docs de rutina_dias, docs de rutina_ejercicios) de rutinas embebidas."""
+        dias, ejercicios = [], []
+        for arbol in (cls._arbol_embebido(r) for r in rutinas_docs if "dias" in r):
+            for dia in arbol["dias"]:
+                dias.append(cls._campos(dia, ("ejercicios",)))
+                ejercicios.extend(dia["ejercicios"])
+        return dias, ejercicios
+
+    @staticmethod
+    def contar_clientes(db, ids_rutina):
+        """{id_rutina: miembros con la rutina activa} con un solo $group."""
+        if not ids_rutina:
+            return {}
+        pipeline = [
+            {"$match": {"id_rutina": {"$in": list(ids_rutina)}, "activa": True}},
+            {"$group": {"_id": "$id_rutina", "total": {"$sum": 1}}}
+        ]
+        return {r["_id"]: r["total"] for r in db[MiembroRutina.collection].aggregate(pipeline)}
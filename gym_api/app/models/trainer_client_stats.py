@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app.utils.busqueda import CAMPO_TOKENS
+
+
+class TrainerClientStats:
+    """
+    Vista materializada de la cartera de clientes de cada entrenador.
+    Un documento por miembro (_id = id del miembro) con las métricas que muestra
+    /api/trainer/clients ya calculadas, para que el listado sea una sola consulta
+    indexada con el filtro de estado aplicado antes de paginar.
+
+    Se refresca cuando cambia el estado de una sesión, al guardar un miembro
+    (alta o cambio de entrenador) y en cada check-in;
+    spark/DB/refrescar_trainer_stats.py la reconstruye completa (p. ej. a diario,
+    porque la ventana de 30 días avanza aunque no haya eventos).
+
+    `collection_construidas` registra qué entrenadores ya tienen su cartera
+    completa: mientras no la tengan, cualquier refresco la arma entera (una
+    fila suelta de un miembro no es la cartera).
+    """
+    collection = "trainer_client_stats"
+    collection_construidas = "trainer_client_stats_entrenadores"
+
+    DIAS_VENTANA = 30
+
+    # ──────────────────────────────────────────────
+    # CÁLCULO
+    # ──────────────────────────────────────────────
+
+    @staticmethod
+    def _calcular_estado(ultima_sesion, tasa_asistencia, hoy):
+        """'warning' si no hay sesión completada en 7 días o la asistencia baja del 70%."""
+        if not ultima_sesion:
+            return 'warning'
+        fecha_us = ultima_sesion.date() if isinstance(ultima_sesion, datetime) else ultima_sesion
+        dias = (hoy - fecha_us).days
+        return 'warning' if dias > 7 or tasa_asistencia < 70 else 'active'
+
+    @classmethod
+    def _construir_doc(cls, miembro, usuario, metricas, now):
+        completadas_ventana = metricas.get("completadas_ventana", 0)
+        programadas_ventana = completadas_ventana + metricas.get("canceladas_ventana", 0)
+        tasa = round((completadas_ventana / programadas_ventana) * 100) if programadas_ventana else 0
+        ultima_sesion = metricas.get("ultima_sesion")
+
+        return {
+            "_id": miembro["_id"],
+            "id_entrenador": miembro.get("id_entrenador"),
+            "id_usuario": miembro.get("id_usuario"),
+            "nombre": usuario.get("nombre", "Sin nombre") if usuario else "Sin nombre",
+            CAMPO_TOKENS: miembro.get(CAMPO_TOKENS, []),
+            "objetivo": miembro.get("objetivo"),
+            "sesiones_completadas": metricas.get("completadas", 0),
+            "tasa_asistencia": tasa,
+            "racha_actual": miembro.get("racha_actual", 0),
+            "ultima_fecha_asistencia": miembro.get("ultima_fecha_asistencia"),
+            "ultima_sesion": ultima_sesion,
+            "status": cls._calcular_estado(ultima_sesion, tasa, now.date()),
+            "fecha_calculo": now
+        }
+
+    @classmethod
+    def _metricas_sesiones(cls, db, ids_miembro, now):
+        """Métricas de sesiones para varios miembros en una sola agregación."""
+        desde = now - timedelta(days=cls.DIAS_VENTANA)
+        pipeline = [
+            {"$match": {"id_miembro": {"$in": ids_miembro}}},
+            {"$group": {
+                "_id": "$id_miembro",
+                "completadas": {"$sum": {"$cond": [{"$eq": ["$estado", "completed"]}, 1, 0]}},
+                "completadas_ventana": {"$sum": {"$cond": [
+                    {"$and": [{"$eq": ["$estado", "completed"]}, {"$gte": ["$fecha", desde]}]}, 1, 0
+                ]}},
+                "canceladas_ventana": {"$sum": {"$cond": [
+                    {"$and": [{"$eq": ["$estado", "cancelled"]}, {"$gte": ["$fecha", desde]}]}, 1, 0
+                ]}},
+                "ultima_sesion": {"$max": {"$cond": [{"$eq": ["$estado", "completed"]}, "$fecha", None]}}
+            }}
+        ]
+        return {m["_id"]: m for m in db.sesiones.aggregate(pipeline)}
+
+    @classmethod
+    def _refrescar_miembros(cls, db, miembros):
+        if not miembros:
+            return 0
+        now = datetime.now()
+        ids_miembro = [m["_id"] for m in miembros]
+        ids_usuario = [m["id_usuario"] for m in miembros if m.get("id_usuario")]
+
+        usuarios = {u["_id"]: u for u in db.usuarios.find({"_id": {"$in": ids_usuario}}, {"nombre": 1})}
+        metricas = cls._metricas_sesiones(db, ids_miembro, now)
+
+        ops = []
+        for m in miembros:
+            doc = cls._construir_doc(m, usuarios.get(m.get("id_usuario")), metricas.get(m["_id"], {}), now)
+            ops.append(UpdateOne({"_id": m["_id"]}, {"$set": doc}, upsert=True))
+        db[cls.collection].bulk_write(ops, ordered=False)
+        return len(ops)
+
+    # ──────────────────────────────────────────────
+    # REFRESCOS (llamados desde los eventos)
+    # ──────────────────────────────────────────────
+
+    @classmethod
+    def construida(cls, db, id_entrenador):
+        return db[cls.collection_construidas].find_one({"_id": id_entrenador}, {"_id": 1}) is not None
+
+    @classmethod
+    def refrescar(cls, db, id_miembro):
+        """
+        Recalcula la fila de un miembro (cambio de estado de una sesión, alta o
+        cambio de entrenador). Si su entrenador aún no tiene la cartera armada,
+        la arma completa.
+        """
+        miembro = db.miembros.find_one({"_id": id_miembro})
+        if not miembro or not miembro.get("id_entrenador"):
+            db[cls.collection].delete_one({"_id": id_miembro})
+            return
+        if not cls.construida(db, miembro["id_entrenador"]):
+            cls.refrescar_entrenador(db, miembro["id_entrenador"])
+            return
+        cls._refrescar_miembros(db, [miembro])
+
+    @classmethod
+    def refrescar_entrenador(cls, db, id_entrenador):
+        """Reconstruye la cartera completa de un entrenador y la marca como construida."""
+        miembros = list(db.miembros.find({"id_entrenador": id_entrenador}))
+        db[cls.collection].delete_many({
+            "id_entrenador": id_entrenador,
+            "_id": {"$nin": [m["_id"] for m in miembros]}
+        })
+        total = cls._refrescar_miembros(db, miembros)
+        db[cls.collection_construidas].update_one(
+            {"_id": id_entrenador}, {"$set": {"fecha_calculo": datetime.now()}}, upsert=True
+        )
+        return total
+
+    @classmethod
+    def actualizar_racha(cls, db, id_miembro, racha_doc):
+        """El check-in solo cambia la racha: $set directo, sin recalcular el resto."""
+        if not racha_doc:
+            return
+        db[cls.collection].update_one(
+            {"_id": id_miembro},
+            {"$set": {
+                "racha_actual": racha_doc.get("racha_actual", 0),
+                "ultima_fecha_asistencia": racha_doc.get("ultima_fecha_asistencia")
+            }}
+        )
+
+    @classmethod
+    def actualizar_usuario(cls, db, id_usuario, nombre, tokens):
+        """Mantiene nombre y tokens de búsqueda al renombrar un usuario."""
+        db[cls.collection].update_many(
+            {"id_usuario": id_usuario},
+            {"$set": {"nombre": nombre, CAMPO_TOKENS: tokens}}
+        )
@@ -2,15 +2,18 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.utils.busqueda import CAMPO_TOKENS, tokens_busqueda
+from app.models.trainer_client_stats import TrainerClientStats
 
 class User:
     # Nombre de la colección en MongoDB
     collection = "usuarios"
 
-    def __init__(self, id_role, nombre=None, email=None, password=None, activo=True, fecha_creacion=None, _id=None):
+    def __init__(self, id_role, nombre=None, email=None, password=None, activo=True, fecha_creacion=None, _id=None, **kwargs):
         """
         Inicializa un objeto de usuario en memoria.
         El parámetro _id es opcional, se genera automáticamente al guardar por primera vez.
+        Los campos derivados (p. ej. busqueda_tokens) llegan en kwargs y se recalculan al guardar.
         """
         self._id = _id
         
@@ -39,7 +42,8 @@ class User:
             "email": self.email,
             "password": self.password,
             "activo": self.activo,
-            "fecha_creacion": self.fecha_creacion
+            "fecha_creacion": self.fecha_creacion,
+            CAMPO_TOKENS: tokens_busqueda(self.nombre, self.email)
         }
 
     def save(self):
@@ -47,10 +51,17 @@ class User:
         db = get_db()
         if self._id:
             # Si ya tiene un _id, actualizamos el documento
+            data = self.to_dict()
             db[self.collection].update_one(
                 {"_id": self._id},
-                {"$set": self.to_dict()}
+                {"$set": data}
             )
+            # Replicamos los tokens en el miembro para que el buscador filtre en una sola consulta
+            db.miembros.update_many(
+                {"id_usuario": self._id},
+                {"$set": {CAMPO_TOKENS: data[CAMPO_TOKENS]}}
+            )
+            TrainerClientStats.actualizar_usuario(db, self._id, self.nombre, data[CAMPO_TOKENS])
         else:
             # Si no tiene _id, es un documento nuevo
             result = db[self.collection].insert_one(self.to_dict())
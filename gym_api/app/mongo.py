@@ -1,8 +1,12 @@
 import os
+import threading
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
+from app.config import Config
+from app.mongo_metricas import metricas
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -14,10 +18,8 @@ MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
 MONGO_CLUSTER  = os.getenv("MONGO_CLUSTER")
 MONGO_DB       = os.getenv("MONGO_DB")
 
-# Validación
+# Validación (sin usuario/contraseña se asume un MongoDB local)
 missing = [k for k, v in {
-    "MONGO_USER": MONGO_USER,
-    "MONGO_PASSWORD": MONGO_PASSWORD,
     "MONGO_CLUSTER": MONGO_CLUSTER,
     "MONGO_DB": MONGO_DB
 }.items() if not v]
@@ -30,33 +32,78 @@ if missing:
 # ──────────────────────────────────────────────
 # URI
 # ──────────────────────────────────────────────
-MONGO_URI = (
-    f"mongodb+srv://{MONGO_USER}:{MONGO_PASSWORD}"
-    f"@{MONGO_CLUSTER}/{MONGO_DB}"
-    "?retryWrites=true&w=majority"
-)
+if MONGO_USER and MONGO_PASSWORD:
+    MONGO_URI = (
+        f"mongodb+srv://{MONGO_USER}:{MONGO_PASSWORD}"
+        f"@{MONGO_CLUSTER}/{MONGO_DB}"
+        "?retryWrites=true&w=majority"
+    )
+else:
+    MONGO_URI = f"mongodb://{MONGO_CLUSTER}/{MONGO_DB}"
 
 # ──────────────────────────────────────────────
-# CLIENTE GLOBAL (singleton)
+# CLIENTE GLOBAL (uno por proceso)
+# MongoClient no sobrevive a un fork: si gunicorn crea los workers después
+# de que el master abrió el cliente (--preload), cada worker detecta que su
+# pid cambió y abre su propio pool en el primer uso.
 # ──────────────────────────────────────────────
 _client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def opciones_pool():
+    """Parámetros del MongoClient tomados de Config (ver app/config.py)."""
+    opciones = {
+        "maxPoolSize": Config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": Config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": Config.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": Config.MONGO_READ_PREFERENCE,
+        "appname": Config.MONGO_APP_NAME,
+    }
+    if Config.MONGO_COMPRESSORS:
+        opciones["compressors"] = Config.MONGO_COMPRESSORS
+    return opciones
 
 
 def get_client():
-    global _client
-    if _client is None:
-        try:
-            _client = MongoClient(
-                MONGO_URI,
-                serverSelectionTimeoutMS=5000
-            )
-            _client.admin.command("ping")
-            print("✅ Conectado a MongoDB Atlas")
-        except ConnectionFailure as e:
-            raise ConnectionError(f"❌ Error conectando a MongoDB: {e}")
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # Tras un fork el cliente heredado se descarta sin cerrarlo:
+            # sus sockets pertenecen al proceso padre.
+            metricas.reiniciar()
+            try:
+                client = MongoClient(
+                    MONGO_URI,
+                    event_listeners=[metricas],
+                    **opciones_pool()
+                )
+                client.admin.command("ping")
+                print(f"✅ Conectado a MongoDB (pid {pid})")
+            except ConnectionFailure as e:
+                raise ConnectionError(f"❌ Error conectando a MongoDB: {e}")
+            _client, _client_pid = client, pid
     return _client
 
 
 def get_db():
     client = get_client()
-    return client[MONGO_DB]
\ No newline at end of file
+    return client[MONGO_DB]
+
+
+def estado_pool():
+    """Configuración y métricas del pool del proceso actual (para /api/health)."""
+    opciones = opciones_pool()
+    return {
+        "pid": os.getpid(),
+        "conectado": _client is not None and _client_pid == os.getpid(),
+        "configuracion": {k: v for k, v in opciones.items() if k != "appname"},
+        **metricas.snapshot()
+    }
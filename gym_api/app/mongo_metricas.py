@@ -0,0 +1,165 @@
+import threading
+import time
+from pymongo import monitoring
+
+# ──────────────────────────────────────────────
+# MÉTRICAS DEL POOL Y DE LOS COMANDOS
+# Listeners de pymongo registrados en el MongoClient de app/mongo.py.
+# Sirven para distinguir en /api/health si la lentitud viene de esperar
+# una conexión libre (pool saturado) o de consultas lentas.
+# ──────────────────────────────────────────────
+
+UMBRAL_LENTO_MS = 100
+
+
+class _Acumulador:
+    """Conteo, total y máximo de una serie de duraciones en ms."""
+
+    def __init__(self):
+        self.conteo = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def agregar(self, ms):
+        self.conteo += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def to_dict(self):
+        return {
+            "conteo": self.conteo,
+            "promedio_ms": round(self.total_ms / self.conteo, 2) if self.conteo else 0,
+            "max_ms": round(self.max_ms, 2)
+        }
+
+
+class MetricasMongo(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """Un solo objeto escucha comandos y eventos del pool; snapshot() lo resume."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.conexiones_abiertas = 0
+            self.conexiones_en_uso = 0
+            self.max_en_uso = 0
+            self.esperando = 0
+            self.checkout_fallidos = 0
+            self.pools_limpiados = 0
+            self.espera_pool = _Acumulador()
+            self.comandos = _Acumulador()
+            self.comandos_fallidos = 0
+            self.comandos_lentos = 0
+            self.por_comando = {}
+            self.desde = time.time()
+
+    # ── Comandos ────────────────────────────────
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._registrar_comando(event.command_name, event.duration_micros / 1000)
+
+    def failed(self, event):
+        with self._lock:
+            self.comandos_fallidos += 1
+        self._registrar_comando(event.command_name, event.duration_micros / 1000)
+
+    def _registrar_comando(self, nombre, ms):
+        with self._lock:
+            self.comandos.agregar(ms)
+            self.por_comando.setdefault(nombre, _Acumulador()).agregar(ms)
+            if ms >= UMBRAL_LENTO_MS:
+                self.comandos_lentos += 1
+
+    # ── Pool de conexiones ──────────────────────
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_limpiados += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.conexiones_abiertas += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.conexiones_abiertas -= 1
+
+    def connection_check_out_started(self, event):
+        # El checkout ocurre en el hilo que pidió la conexión
+        self._local.inicio = time.perf_counter()
+        with self._lock:
+            self.esperando += 1
+
+    def _fin_espera(self):
+        inicio = getattr(self._local, "inicio", None)
+        self._local.inicio = None
+        return (time.perf_counter() - inicio) * 1000 if inicio else None
+
+    def connection_check_out_failed(self, event):
+        self._fin_espera()
+        with self._lock:
+            self.esperando -= 1
+            self.checkout_fallidos += 1
+
+    def connection_checked_out(self, event):
+        ms = self._fin_espera()
+        with self._lock:
+            self.esperando -= 1
+            self.conexiones_en_uso += 1
+            self.max_en_uso = max(self.max_en_uso, self.conexiones_en_uso)
+            if ms is not None:
+                self.espera_pool.agregar(ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.conexiones_en_uso -= 1
+
+    # ── Resumen ─────────────────────────────────
+
+    def snapshot(self):
+        with self._lock:
+            lentos = sorted(
+                ((n, a.to_dict()) for n, a in self.por_comando.items()),
+                key=lambda item: item[1]["max_ms"], reverse=True
+            )[:10]
+            return {
+                "desde": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.desde)),
+                "pool": {
+                    "conexiones_abiertas": self.conexiones_abiertas,
+                    "conexiones_en_uso": self.conexiones_en_uso,
+                    "max_en_uso": self.max_en_uso,
+                    "esperando": self.esperando,
+                    "checkout_fallidos": self.checkout_fallidos,
+                    "pools_limpiados": self.pools_limpiados,
+                    "espera": self.espera_pool.to_dict()
+                },
+                "comandos": {
+                    **self.comandos.to_dict(),
+                    "fallidos": self.comandos_fallidos,
+                    "lentos": self.comandos_lentos,
+                    "umbral_lento_ms": UMBRAL_LENTO_MS,
+                    "por_comando": dict(lentos)
+                }
+            }
+
+
+metricas = MetricasMongo()
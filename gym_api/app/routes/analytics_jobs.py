@@ -0,0 +1,34 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+
+from app.mongo import get_db
+from app.analytics import cola, cache
+
+analytics_jobs_bp = Blueprint("analytics_jobs", __name__)
+
+
+@analytics_jobs_bp.route("/api/analytics/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def estado_job(job_id):
+    """
+    Estado de un trabajo encolado por los endpoints /train.
+    Cuando está completado incluye `resultado` (lo que quedó en analytics_cache).
+    """
+    try:
+        db = get_db()
+        job = cola.obtener(db, job_id)
+        if not job:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+
+        respuesta = cola.to_dict(job)
+        if job.get("estado") == cola.COMPLETADO and job.get("cache_key"):
+            resultado = cache.leer(db, job["cache_key"])
+            if resultado:
+                respuesta["resultado"] = cache.sin_internos(resultado)
+
+        return jsonify(respuesta), 200
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
@@ -1,7 +1,14 @@
 from flask import Blueprint, jsonify
+from app.mongo import estado_pool
+from app.analytics import cache
 
 health_bp = Blueprint("health", __name__)
 
 @health_bp.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "API GYM activa"}), 200
+    # Sin consultas a la BD: solo lo que ya midieron los listeners del pool
+    return jsonify({
+        "status": "API GYM activa",
+        "mongo": estado_pool(),
+        "analytics_cache": cache.metricas.snapshot()
+    }), 200
@@ -4,11 +4,12 @@ from werkzeug.utils import secure_filename
 from flask_jwt_extended import jwt_required
 from datetime import datetime
 from bson.objectid import ObjectId
-import re
 
 from app.mongo import get_db
 from app.models.user import User
 from app.models.miembro import Miembro
+from app.utils.busqueda import filtro_busqueda
+from app.utils.paginacion import leer_pagina_cursor, contar_total
 
 miembros_bp = Blueprint("miembros", __name__)
 
@@ -18,7 +19,7 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # ==============================================================================
-# 1. LISTAR MIEMBROS (CON BUSCADOR + PAGINACIÓN)
+# 1. LISTAR MIEMBROS (CON BUSCADOR + PAGINACIÓN POR PÁGINA O CURSOR)
 # ==============================================================================
 @miembros_bp.route("/api/miembros", methods=["GET"])
 @jwt_required()
@@ -31,30 +32,28 @@ def listar_miembros():
 
     estado_filtro = "Inactivo" if mostrar_inactivos else "Activo"
 
-    # En Mongo, como los datos de búsqueda (nombre, email) están en la colección "usuarios",
-    # primero buscamos los usuarios que coincidan, extraemos sus IDs, y luego filtramos miembros.
-    usuario_ids_match = []
-    
-    if search:
-        # Regex case-insensitive equivalente a ILIKE en SQL
-        regex = re.compile(f".*{search}.*", re.IGNORECASE)
-        usuarios_match = db.usuarios.find({
-            "$or": [
-                {"nombre": regex},
-                {"email": regex}
-            ]
-        }, {"_id": 1})
-        usuario_ids_match = [u["_id"] for u in usuarios_match]
-
-    # Construimos el filtro para miembros
+    # Los tokens de búsqueda (nombre/email normalizados) viven también en "miembros",
+    # así que el estado y el prefijo se resuelven en una sola consulta indexada.
     filtro_miembros = {"estado": estado_filtro}
-    
-    if search:
-        # Si hubo búsqueda, solo traemos los miembros cuyos id_usuario estén en la lista de coincidencias
-        if not usuario_ids_match:
-            # Si buscaron algo y no hay usuarios, devolvemos vacío rápido
-            return jsonify({"miembros": [], "total": 0, "pages": 0, "current_page": page}), 200
-        filtro_miembros["id_usuario"] = {"$in": usuario_ids_match}
+    filtro_miembros.update(filtro_busqueda(search))
+
+    # Modo cursor: ?after=<token> (vacío en la primera página) evita skip + count_documents
+    if 'after' in request.args:
+        try:
+            docs, siguiente = leer_pagina_cursor(
+                db.miembros, filtro_miembros, "fecha_registro", request.args.get('after'), per_page
+            )
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+        respuesta = {
+            "miembros": Miembro.to_dicts_bulk(docs, include_stats=False),
+            "next_cursor": siguiente,
+            "has_more": siguiente is not None
+        }
+        if request.args.get('con_total', 'false') == 'true':
+            respuesta["total"] = contar_total(db.miembros, filtro_miembros)
+        return jsonify(respuesta), 200
 
     # Paginación manual en Mongo
     skip = (page - 1) * per_page
@@ -66,11 +65,8 @@ def listar_miembros():
     import math
     pages = math.ceil(total_miembros / per_page) if total_miembros > 0 else 0
 
-    miembros_lista = []
-    for m_data in miembros_cursor:
-        m = Miembro(**m_data)
-        # Usamos el nuevo to_dict_full
-        miembros_lista.append(m.to_dict_full(include_stats=False))
+    # Serialización por lotes: 3 consultas $in para toda la página
+    miembros_lista = Miembro.to_dicts_bulk(miembros_cursor, include_stats=False)
 
     return jsonify({
         "miembros": miembros_lista,
@@ -139,7 +135,7 @@ def crear_miembro():
         miembro_id = nuevo_miembro.save()
         nuevo_miembro._id = miembro_id
 
-        return jsonify(nuevo_miembro.to_dict_full()), 201
+        return jsonify(Miembro.to_dicts_bulk([nuevo_miembro])[0]), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -186,7 +182,7 @@ def actualizar_miembro(id):
             miembro.foto_perfil = unique_filename
 
         miembro.save()
-        return jsonify(miembro.to_dict_full()), 200
+        return jsonify(Miembro.to_dicts_bulk([miembro])[0]), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -10,6 +10,7 @@ from app.models.membresia import Membresia
 from app.models.miembro_membresia import MiembroMembresia
 from app.models.miembro import Miembro
 from app.utils.luhn import validar_luhn
+from app.utils.paginacion import leer_pagina_cursor, contar_total
 
 pagos_bp = Blueprint("pagos", __name__)
 
@@ -81,6 +82,32 @@ def listar_pagos():
         db = get_db()
         page = request.args.get("page", 1, type=int)
         per_page = 6
+
+        # Modo cursor: ?after=<token> (vacío en la primera página)
+        if "after" in request.args:
+            try:
+                docs, siguiente = leer_pagina_cursor(
+                    db.pagos, {}, "fecha_pago", request.args.get("after"), per_page
+                )
+            except ValueError as ve:
+                return jsonify({"error": str(ve)}), 400
+
+            pagos_lista = []
+            for p_data in docs:
+                dict_data = Pago(**p_data).to_dict()
+                dict_data["id_pago"] = str(p_data["_id"])
+                pagos_lista.append(dict_data)
+
+            respuesta = {
+                "pagos": pagos_lista,
+                "next_cursor": siguiente,
+                "has_more": siguiente is not None
+            }
+            if request.args.get("con_total", "false") == "true":
+                # Sin filtro: total aproximado desde los metadatos de la colección
+                respuesta["total"] = contar_total(db.pagos, {})
+            return jsonify(respuesta), 200
+
         skip = (page - 1) * per_page
 
         total_pagos = db.pagos.count_documents({})
@@ -73,4 +73,13 @@ def leer_coleccion(spark, collection: str):
         .option("database",       DB_NAME)
         .option("collection",     collection)
         .load()
-    )
\ No newline at end of file
+    )
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HELPER: base de datos para cachés y resultados de los análisis
+# Reutiliza el pool de app/mongo.py en lugar de abrir otro MongoClient.
+# ──────────────────────────────────────────────────────────────────────────────
+def get_mongo_db():
+    from app.mongo import get_db
+    return get_db()
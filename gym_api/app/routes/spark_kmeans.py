@@ -2,6 +2,12 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
 from datetime import datetime
 
+from app.mongo import get_db
+from app.analytics import motor_local
+from app.analytics.motor import elegir_motor, MOTOR_LOCAL
+from app.analytics import cola, cache
+from app.models.member_features import MemberFeatures
+
 spark_kmeans_bp = Blueprint("spark_kmeans", __name__)
 
 CLUSTER_LABELS = {
@@ -24,59 +30,28 @@ def _get_spark():
 
 
 
-CACHE_COLLECTION = "analytics_cache"
-CACHE_KEY_PREFIX  = "kmeans"
-
-def _cache_key(k: int) -> str:
-    return f"{CACHE_KEY_PREFIX}_k{k}"
-
+# ──────────────────────────────────────────────────────────────────────────────
+# CACHÉ — un resultado por k en analytics_cache (TTL + huella, ver app/analytics/cache.py)
+# ──────────────────────────────────────────────────────────────────────────────
 
-def _get_cached_result(k: int):
-    """
-    Devuelve el documento guardado en analytics_cache para este k,
-    o None si no existe. Requiere que spark_config exponga `get_mongo_db()`.
-    """
-    try:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import get_mongo_db          # ← añadir este helper en spark_config
-        db  = get_mongo_db()
-        doc = db[CACHE_COLLECTION].find_one({"_id": _cache_key(k)})
-        if doc:
-            doc.pop("_id", None)
-            return doc
-    except Exception as e:
-        print(f"[kmeans cache] Error leyendo caché: {e}")
-    return None
+CACHE_KEY_PREFIX = "kmeans"
+FUENTES          = ["miembros", "progreso_fisico"]
 
+K_MIN, K_MAX = 2, 15
 
-def _save_cached_result(k: int, payload: dict):
-    """
-    Guarda (upsert) el resultado completo en analytics_cache.
-    """
-    try:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import get_mongo_db
-        db = get_mongo_db()
-        db[CACHE_COLLECTION].replace_one(
-            {"_id": _cache_key(k)},
-            {"_id": _cache_key(k), **payload},
-            upsert=True
-        )
-    except Exception as e:
-        print(f"[kmeans cache] Error guardando caché: {e}")
+def _cache_key(k: int) -> str:
+    return f"{CACHE_KEY_PREFIX}_k{k}"
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # LÓGICA K-MEANS
 # ──────────────────────────────────────────────────────────────────────────────
 
-def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
+def _features_spark(spark):
+    """
+    Pasos 1-5: DataFrame con features escaladas (cacheado) y el StandardScalerModel.
+    En un barrido de k se calcula una vez y lo reutilizan todos los entrenamientos.
+    """
     import sys, os
     
     # Configuración de rutas para asegurar que los módulos locales sean importables
@@ -86,19 +61,23 @@ def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
 
     from spark_config import leer_coleccion
     from pyspark.sql import functions as F
-    from pyspark.ml.clustering import KMeans
     from pyspark.ml.feature import VectorAssembler, StandardScaler
-    from pyspark.ml.evaluation import ClusteringEvaluator
 
-    # 1. CARGA Y LIMPIEZA DE DATOS DE MIEMBROS
-    # Se extraen las características base y se filtran registros inválidos o nulos
-    df_miembros = (
-        leer_coleccion(spark, "miembros")
+    # 1-3. PERFIL + ÚLTIMO PROGRESO DE CADA MIEMBRO
+    # Ya vienen unidos en la vista materializada member_features (se mantiene al
+    # registrar progreso), así no hay join ni ventana row_number sobre progreso_fisico.
+    MemberFeatures.asegurar(get_db())
+    df = (
+        leer_coleccion(spark, MemberFeatures.collection)
         .select(
             F.col("_id").alias("id_miembro"),
             F.col("peso_inicial").cast("double"),
             F.col("estatura").cast("double"),
-            F.col("sexo")
+            F.col("sexo"),
+            F.col("peso").cast("double"),
+            F.col("bmi").cast("double"),
+            F.col("grasa_corporal").cast("double"),
+            F.col("masa_muscular").cast("double")
         )
         .filter(
             F.col("peso_inicial").isNotNull() &
@@ -107,34 +86,6 @@ def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
         )
     )
 
-    # 2. PROCESAMIENTO DE PROGRESO FÍSICO
-    # Se utiliza una ventana (Window) para obtener solo el registro de progreso más reciente de cada miembro
-    from pyspark.sql.window import Window
-    w = Window.partitionBy("id_miembro_prog").orderBy(F.col("fecha_registro").desc())
-
-    df_progreso = (
-        leer_coleccion(spark, "progreso_fisico")
-        .select(
-            F.col("id_miembro").alias("id_miembro_prog"),
-            F.col("peso").cast("double"),
-            F.col("bmi").cast("double"),
-            F.col("grasa_corporal").cast("double"),
-            F.col("masa_muscular").cast("double"),
-            F.col("fecha_registro")
-        )
-        .withColumn("rn", F.row_number().over(w))
-        .filter(F.col("rn") == 1) # Mantiene solo la última actualización de peso/grasa
-        .drop("rn", "fecha_registro")
-    )
-
-    # 3. INTEGRACIÓN DE DATOS (JOIN)
-    # Se une la información de perfil con el progreso físico más reciente
-    df = df_miembros.join(
-        df_progreso,
-        df_miembros["id_miembro"] == df_progreso["id_miembro_prog"],
-        "left"
-    )
-
     # 4. INGENIERÍA DE CARACTERÍSTICAS Y TRATAMIENTO DE NULOS
     # - Se calcula el IMC si no existe.
     # - Se imputan valores por defecto si el miembro no tiene registros de progreso.
@@ -163,10 +114,6 @@ def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
         F.col("peso").isNotNull() & F.col("imc").isNotNull()
     )
 
-    # Validación de seguridad para evitar errores en el algoritmo de clustering
-    if df_features.count() < k:
-        raise ValueError(f"Datos insuficientes: se necesitan al menos {k} miembros con datos.")
-
     # 5. PREPARACIÓN DE VECTORES PARA MLlib
     # VectorAssembler agrupa las columnas numéricas en un solo vector de características
     assembler = VectorAssembler(
@@ -182,7 +129,19 @@ def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
         withStd=True, withMean=True
     )
     scaler_model = scaler.fit(df_assembled)
-    df_scaled = scaler_model.transform(df_assembled)
+    df_scaled = scaler_model.transform(df_assembled).cache()
+    return df_scaled, scaler_model
+
+
+def _kmeans_spark(df_scaled, scaler_model, k: int, max_iter: int = 20, seed: int = 42):
+    """Pasos 6-8 sobre las features ya escaladas. Devuelve lo mismo que motor_local.entrenar_kmeans."""
+    from pyspark.sql import functions as F
+    from pyspark.ml.clustering import KMeans
+    from pyspark.ml.evaluation import ClusteringEvaluator
+
+    # Validación de seguridad para evitar errores en el algoritmo de clustering
+    if df_scaled.count() < k:
+        raise ValueError(f"Datos insuficientes: se necesitan al menos {k} miembros con datos.")
 
     # 6. ENTRENAMIENTO DEL MODELO K-MEANS
     kmeans = KMeans(
@@ -253,15 +212,210 @@ def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
         .orderBy("cluster")
     )
 
+    # Inercia (suma de distancias al cuadrado, para el método del codo) y
+    # centroides en unidades reales para arrancar desde ellos la próxima vez
+    media = scaler_model.mean.toArray()
+    std   = scaler_model.std.toArray()
+    modelo = {
+        "inercia":    round(float(model.summary.trainingCost), 4),
+        "centros":    [(c * std + media).tolist() for c in centroides_raw],
+        "warm_start": False,
+        "mini_batch": False
+    }
+
     # Retorno de datos en formatos nativos de Python (listas de diccionarios)
     return (
         [row.asDict() for row in resumen_clusters.collect()],
         [row.asDict() for row in asignaciones.collect()],
         centroides,
-        round(silhouette, 4)
+        round(silhouette, 4),
+        modelo
     )
 
 
+def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
+    df_scaled, scaler_model = _features_spark(spark)
+    try:
+        return _kmeans_spark(df_scaled, scaler_model, k, max_iter, seed)
+    finally:
+        df_scaled.unpersist()
+
+
+def _barrido_spark(spark, ks, max_iter: int = 20, seed: int = 42):
+    """{k: resultado} con una sola lectura y un solo escalado (DataFrame cacheado)."""
+    df_scaled, scaler_model = _features_spark(spark)
+    try:
+        return {k: _kmeans_spark(df_scaled, scaler_model, k, max_iter, seed) for k in ks}
+    finally:
+        df_scaled.unpersist()
+
+
+def _interpretar_silhouette(s: float) -> str:
+    if s >= 0.7: return "Excelente — clusters bien separados y compactos"
+    if s >= 0.5: return "Bueno — estructura de grupos clara"
+    if s >= 0.3: return "Aceptable — hay solapamiento entre algunos grupos"
+    return "Bajo — los grupos se solapan; prueba con otro k"
+
+
+def _build_payload(k, max_iter, resumen, asignaciones, centroides, silhouette, modelo):
+    """
+    Arma la respuesta común a ambos motores. Los ids de cluster son arbitrarios,
+    así que para k=3 las etiquetas se asignan ordenando por IMC promedio (mayor = más prioridad).
+    """
+    perfiles = {}
+    if k == len(CLUSTER_LABELS):
+        por_imc = sorted(resumen, key=lambda c: c.get("imc_promedio") or 0, reverse=True)
+        perfiles = {c["cluster"]: CLUSTER_LABELS[i] for i, c in enumerate(por_imc)}
+
+    acciones = {
+        CLUSTER_LABELS[0]: "Plan de acondicionamiento y seguimiento semanal",
+        CLUSTER_LABELS[1]: "Mantener rutina y revisar progreso mensual",
+        CLUSTER_LABELS[2]: "Periodización avanzada y objetivos de rendimiento",
+    }
+    recomendaciones = []
+    for c in resumen:
+        perfil = perfiles.get(c["cluster"], f"Cluster {c['cluster'] + 1}")
+        recomendaciones.append({
+            "cluster":         c["cluster"],
+            "perfil":          perfil,
+            "accion_sugerida": acciones.get(perfil, "")
+        })
+
+    return {
+        "algoritmo":                 "K-Means",
+        "k":                         k,
+        "max_iter":                  max_iter,
+        "silhouette_score":          silhouette,
+        "interpretacion_silhouette": _interpretar_silhouette(silhouette),
+        "resumen_clusters":          resumen,
+        "recomendaciones":           recomendaciones,
+        "centroides":                centroides,
+        "asignaciones":              asignaciones,
+        "inercia":                   modelo["inercia"],
+        "warm_start":                modelo["warm_start"],
+        "mini_batch":                modelo["mini_batch"],
+        "ejecutado_en":              datetime.now().isoformat(),
+        # Centroides en unidades reales: punto de partida del próximo entrenamiento
+        "_centros":                  modelo["centros"]
+    }
+
+
+def _entrenar(db, k: int, max_iter: int, mini_batch: bool = False, centros_previos=None):
+    """Elige el motor según el volumen de datos, entrena y arma el payload."""
+    motor = elegir_motor(db, FUENTES)
+    if motor == MOTOR_LOCAL:
+        resultado = motor_local.kmeans(
+            db, k=k, max_iter=max_iter, centros_previos=centros_previos, mini_batch=mini_batch
+        )
+    else:
+        resultado = _ejecutar_kmeans(_get_spark(), k=k, max_iter=max_iter)
+
+    payload = _build_payload(k, max_iter, *resultado)
+    payload["motor"] = motor
+    payload["desde_cache"] = False
+    return payload
+
+
+def _centros_previos(db, k: int):
+    previo = cache.leer(db, _cache_key(k))
+    return previo.get("_centros") if previo else None
+
+
+def reentrenar(k: int, max_iter: int, mini_batch: bool = False):
+    """
+    Entrena arrancando desde los centroides guardados (warm start) y actualiza
+    la caché. Lo ejecuta el worker (app/analytics/worker.py).
+    """
+    db = get_db()
+    huella = cache.huella(db, FUENTES)
+    payload = _entrenar(db, k, max_iter, mini_batch, _centros_previos(db, k))
+    cache.guardar(db, _cache_key(k), payload, FUENTES, huella)
+    return _cache_key(k), f"Modelo K-Means k={k} reentrenado y caché actualizada."
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# BARRIDO DE k (método del codo + silhouette)
+# Los datos se leen y escalan una sola vez; cada k arranca desde sus
+# centroides anteriores si existen y su resultado queda también en kmeans_k{k}.
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _barrido_key(k_min: int, k_max: int) -> str:
+    return f"{CACHE_KEY_PREFIX}_barrido_{k_min}_{k_max}"
+
+
+def _k_codo(resultados):
+    """k del codo: el punto de la curva de inercia más alejado de la recta entre sus extremos."""
+    if len(resultados) < 3:
+        return None
+    ks = [r["k"] for r in resultados]
+    inercias = [r["inercia"] for r in resultados]
+    rango_k = (ks[-1] - ks[0]) or 1
+    rango_i = (max(inercias) - min(inercias)) or 1
+    x = [(k - ks[0]) / rango_k for k in ks]
+    y = [(i - min(inercias)) / rango_i for i in inercias]
+    # Distancia (sin normalizar) de cada punto a la recta (x0, y0) → (x1, y1)
+    dx, dy = x[-1] - x[0], y[-1] - y[0]
+    distancias = [abs(dy * xi - dx * yi + x[-1] * y[0] - y[-1] * x[0]) for xi, yi in zip(x, y)]
+    return ks[distancias.index(max(distancias))]
+
+
+def _barrido(db, k_min: int, k_max: int, max_iter: int, mini_batch: bool = False):
+    ks = list(range(k_min, k_max + 1))
+    motor = elegir_motor(db, FUENTES)
+    previos = {k: _centros_previos(db, k) for k in ks}
+    if motor == MOTOR_LOCAL:
+        por_k = motor_local.barrido_kmeans(
+            db, ks, max_iter=max_iter, centros_previos=previos, mini_batch=mini_batch
+        )
+    else:
+        por_k = _barrido_spark(_get_spark(), ks, max_iter=max_iter)
+
+    resultados = []
+    payloads = {}
+    for k, resultado in por_k.items():
+        payload = _build_payload(k, max_iter, *resultado)
+        payload["motor"] = motor
+        payload["desde_cache"] = False
+        payloads[k] = payload
+        resultados.append({
+            "k":                k,
+            "silhouette_score": payload["silhouette_score"],
+            "inercia":          payload["inercia"],
+            "warm_start":       payload["warm_start"]
+        })
+
+    mejor = max(resultados, key=lambda r: r["silhouette_score"])
+    barrido = {
+        "algoritmo":             "K-Means (barrido de k)",
+        "k_min":                 k_min,
+        "k_max":                 k_max,
+        "max_iter":              max_iter,
+        "mini_batch":            bool(mini_batch),
+        "motor":                 motor,
+        "resultados":            resultados,
+        "k_mejor_silhouette":    mejor["k"],
+        "k_codo":                _k_codo(resultados),
+        "desde_cache":           False,
+        "ejecutado_en":          datetime.now().isoformat()
+    }
+    return barrido, payloads
+
+
+def reentrenar_barrido(k_min: int, k_max: int, max_iter: int, mini_batch: bool = False):
+    """Barrido completo desde el worker: guarda el resumen y el resultado de cada k."""
+    db = get_db()
+    huella = cache.huella(db, FUENTES)
+    barrido, payloads = _barrido(db, k_min, k_max, max_iter, mini_batch)
+    for k, payload in payloads.items():
+        cache.guardar(db, _cache_key(k), payload, FUENTES, huella)
+    cache.guardar(db, _barrido_key(k_min, k_max), barrido, FUENTES, huella)
+    return _barrido_key(k_min, k_max), f"Barrido K-Means k={k_min}..{k_max} completado y caché actualizada."
+
+
+def _es_verdadero(valor):
+    return str(valor).lower() in ("1", "true", "si", "sí", "yes")
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # ENDPOINTS
 # ──────────────────────────────────────────────────────────────────────────────
@@ -271,34 +425,38 @@ def _ejecutar_kmeans(spark, k: int = 3, max_iter: int = 20, seed: int = 42):
 def kmeans_analytics():
     """
     Devuelve el resultado guardado en caché (MongoDB).
-    Si no existe caché para este k, entrena el modelo por primera vez.
+    Si venció o cambiaron los datos se sirve igual y se encola el re-entrenamiento.
+    Si no existe caché para este k, encola el primer entrenamiento en el worker
+    de analítica y responde 202 con el id del trabajo.
 
     Query params:
       k        (int, default=3)
-      max_iter (int, default=20)  ← solo se usa en el primer entrenamiento
+      max_iter (int, default=20)  ← solo se usa al encolar un entrenamiento
     """
     try:
         k        = request.args.get("k",        3,  type=int)
         max_iter = request.args.get("max_iter", 20, type=int)
 
-        if not (2 <= k <= 8):
-            return jsonify({"error": "k debe estar entre 2 y 8"}), 400
+        if not (K_MIN <= k <= K_MAX):
+            return jsonify({"error": f"k debe estar entre {K_MIN} y {K_MAX}"}), 400
+
+        db = get_db()
 
         # ── Intentar servir desde caché ───────────────────────────────────────
-        cached = _get_cached_result(k)
+        cached, _ = cache.obtener(
+            db, _cache_key(k), FUENTES,
+            refrescar=lambda: cola.encolar(db, "kmeans", {"k": k, "max_iter": max_iter})
+        )
         if cached:
-            cached["desde_cache"] = True
-            return jsonify(cached), 200
+            return jsonify(cache.sin_internos(cached)), 200
 
-        # ── Sin caché: entrenar por primera vez ───────────────────────────────
-        spark = _get_spark()
-        resumen, asignaciones, centroides, silhouette = _ejecutar_kmeans(
-            spark, k=k, max_iter=max_iter
-        )
-        payload = _build_payload(k, max_iter, resumen, asignaciones, centroides, silhouette)
-        payload["desde_cache"] = False
-        _save_cached_result(k, payload)
-        return jsonify(payload), 200
+        # ── Sin caché: el primer entrenamiento va al worker ───────────────────
+        job, _ = cola.encolar(db, "kmeans", {"k": k, "max_iter": max_iter})
+        return jsonify({
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": f"Primer entrenamiento de K-Means k={k} en cola: consulte status_url."
+        }), 202
 
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
@@ -312,12 +470,15 @@ def kmeans_analytics():
 @jwt_required()
 def kmeans_train():
     """
-    Fuerza el re-entrenamiento del modelo K-Means y actualiza la caché.
+    Encola el re-entrenamiento del modelo K-Means (lo ejecuta el worker de
+    analítica) y responde 202 con el id del trabajo.
+    Consultar /api/analytics/jobs/<job_id> para el estado y el resultado.
 
     Body JSON (opcional):
-      { "k": 3, "max_iter": 20 }
+      { "k": 3, "max_iter": 20, "mini_batch": false }
 
-    Si no se envía body, usa k=3 y max_iter=20 por defecto.
+    Si no se envía body, usa k=3 y max_iter=20 por defecto. El entrenamiento
+    arranca desde los centroides guardados para ese k (warm start, motor local).
     También acepta query params como fallback.
     """
     try:
@@ -326,26 +487,107 @@ def kmeans_train():
         max_iter = body.get("max_iter", request.args.get("max_iter", 20, type=int))
         k        = int(k)
         max_iter = int(max_iter)
+        mini_batch = _es_verdadero(body.get("mini_batch", request.args.get("mini_batch", False)))
 
-        if not (2 <= k <= 8):
-            return jsonify({"error": "k debe estar entre 2 y 8"}), 400
+        if not (K_MIN <= k <= K_MAX):
+            return jsonify({"error": f"k debe estar entre {K_MIN} y {K_MAX}"}), 400
+
+        params = {"k": k, "max_iter": max_iter}
+        if mini_batch:
+            params["mini_batch"] = True
+        job, _ = cola.encolar(get_db(), "kmeans", params)
+        return jsonify({
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": f"Re-entrenamiento de K-Means k={k} en cola."
+        }), 202
 
-        spark = _get_spark()
-        resumen, asignaciones, centroides, silhouette = _ejecutar_kmeans(
-            spark, k=k, max_iter=max_iter
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@spark_kmeans_bp.route("/api/analytics/kmeans/barrido", methods=["GET"])
+@jwt_required()
+def kmeans_barrido():
+    """
+    Silhouette e inercia para cada k entre k_min y k_max (elegir k por el codo).
+    Sirve desde caché igual que /api/analytics/kmeans; si no existe, encola el
+    barrido en el worker de analítica y responde 202 con el id del trabajo
+    (hasta K_MAX - 1 modelos: no se entrenan dentro de la petición).
+
+    Query params:
+      k_min      (int, default=2)
+      k_max      (int, default=10)
+      max_iter   (int, default=20)
+      mini_batch (bool, default=false)  ← solo motor local
+    """
+    try:
+        k_min      = request.args.get("k_min",    K_MIN, type=int)
+        k_max      = request.args.get("k_max",    10,    type=int)
+        max_iter   = request.args.get("max_iter", 20,    type=int)
+        mini_batch = _es_verdadero(request.args.get("mini_batch", False))
+
+        if not (K_MIN <= k_min < k_max <= K_MAX):
+            return jsonify({"error": f"Se requiere {K_MIN} <= k_min < k_max <= {K_MAX}"}), 400
+
+        db = get_db()
+        params = {"k_min": k_min, "k_max": k_max, "max_iter": max_iter, "mini_batch": mini_batch}
+        cached, _ = cache.obtener(
+            db, _barrido_key(k_min, k_max), FUENTES,
+            refrescar=lambda: cola.encolar(db, "kmeans_barrido", params)
         )
-        payload = _build_payload(k, max_iter, resumen, asignaciones, centroides, silhouette)
-        payload["desde_cache"] = False
-        _save_cached_result(k, payload)
+        if cached:
+            return jsonify(cache.sin_internos(cached)), 200
 
+        job, _ = cola.encolar(db, "kmeans_barrido", params)
         return jsonify({
-            **payload,
-            "mensaje": f"Modelo K-Means k={k} reentrenado y caché actualizada."
-        }), 200
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": f"Barrido K-Means k={k_min}..{k_max} en cola: consulte status_url."
+        }), 202
 
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@spark_kmeans_bp.route("/api/analytics/kmeans/barrido/train", methods=["POST"])
+@jwt_required()
+def kmeans_barrido_train():
+    """
+    Encola un barrido de k (worker de analítica) y responde 202.
+
+    Body JSON (opcional):
+      { "k_min": 2, "k_max": 10, "max_iter": 20, "mini_batch": false }
+    """
+    try:
+        body       = request.get_json(silent=True) or {}
+        k_min      = int(body.get("k_min",    K_MIN))
+        k_max      = int(body.get("k_max",    10))
+        max_iter   = int(body.get("max_iter", 20))
+        mini_batch = _es_verdadero(body.get("mini_batch", False))
+
+        if not (K_MIN <= k_min < k_max <= K_MAX):
+            return jsonify({"error": f"Se requiere {K_MIN} <= k_min < k_max <= {K_MAX}"}), 400
+
+        params = {"k_min": k_min, "k_max": k_max, "max_iter": max_iter, "mini_batch": mini_batch}
+        job, _ = cola.encolar(get_db(), "kmeans_barrido", params)
+        return jsonify({
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": f"Barrido K-Means k={k_min}..{k_max} en cola."
+        }), 202
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
@@ -1,165 +1,28 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
 from datetime import datetime
 
-spark_mapreduce_bp = Blueprint("spark_mapreduce", __name__)
-
-_spark_instance = None
-def _get_spark():
-    global _spark_instance
-    if _spark_instance is None:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import crear_spark_session
-        _spark_instance = crear_spark_session()
-    return _spark_instance
+from app.mongo import get_db
+from app.analytics import cola, cache, rollups
 
+spark_mapreduce_bp = Blueprint("spark_mapreduce", __name__)
 
 # ──────────────────────────────────────────────────────────────────────────────
-# CACHÉ
+# CACHÉ (TTL + huella, ver app/analytics/cache.py)
 # ──────────────────────────────────────────────────────────────────────────────
 
-CACHE_COLLECTION = "analytics_cache"
-CACHE_KEY        = "mapreduce_resultado"
-
-
-def _get_cached_result():
-    try:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import get_mongo_db
-        db  = get_mongo_db()
-        doc = db[CACHE_COLLECTION].find_one({"_id": CACHE_KEY})
-        if doc:
-            doc.pop("_id", None)
-            return doc
-    except Exception as e:
-        print(f"[mapreduce cache] Error leyendo caché: {e}")
-    return None
-
-
-def _save_cached_result(payload: dict):
-    try:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import get_mongo_db
-        db = get_mongo_db()
-        db[CACHE_COLLECTION].replace_one(
-            {"_id": CACHE_KEY},
-            {"_id": CACHE_KEY, **payload},
-            upsert=True
-        )
-    except Exception as e:
-        print(f"[mapreduce cache] Error guardando caché: {e}")
+CACHE_KEY = "mapreduce_resultado"
+FUENTES   = ["pagos", "asistencias"]
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # LÓGICA MAPREDUCE: INGRESOS Y ASISTENCIA
+# Map (mes + método / mes + día de la semana) y reduce parcial los hace Mongo
+# sobre los documentos nuevos (app/analytics/rollups.py); aquí solo se combinan
+# los parciales guardados, así el coste crece con los datos nuevos y no con
+# todo el historial.
 # ──────────────────────────────────────────────────────────────────────────────
 
-def _mapreduce_ingresos(spark):
-    import sys, os
-    # Asegura que el entorno reconozca módulos locales para la configuración de Spark
-    directorio_actual = os.path.dirname(__file__)
-    if directorio_actual not in sys.path:
-        sys.path.insert(0, directorio_actual)
-
-    from spark_config import leer_coleccion
-    from pyspark.sql import functions as F
-
-    # Carga de datos crudos desde la colección de pagos
-    df = leer_coleccion(spark, "pagos")
-
-    # FASE DE MAPPING:
-    # Seleccionamos y transformamos las columnas necesarias.
-    # Se formatea la fecha a "año-mes" para crear las claves de agrupación.
-    df_mapped = df.select(
-        F.date_format(F.col("fecha_pago"), "yyyy-MM").alias("periodo"),
-        F.col("metodo_pago"),
-        F.col("monto").cast("double").alias("monto")
-    ).filter(F.col("monto").isNotNull()) # Limpieza de registros sin valor monetario
-
-    # FASE DE REDUCING (Detalle por Método):
-    # Agrupamos por periodo y método para calcular métricas financieras distribuidas.
-    resultado = (
-        df_mapped
-        .groupBy("periodo", "metodo_pago")
-        .agg(
-            F.sum("monto").alias("total_ingresos"),
-            F.count("*").alias("num_pagos"),
-            F.avg("monto").alias("promedio_pago")
-        )
-        .orderBy("periodo", "metodo_pago")
-    )
-
-    # FASE DE REDUCING (Resumen Mensual):
-    # Segunda agregación para obtener el gran total por mes, independientemente del método.
-    resumen_periodo = (
-        df_mapped
-        .groupBy("periodo")
-        .agg(
-            F.sum("monto").alias("total_periodo"),
-            F.count("*").alias("total_transacciones")
-        )
-        .orderBy("periodo")
-    )
-
-    # Recolección de resultados al driver para su posterior procesamiento
-    return (
-        [row.asDict() for row in resultado.collect()],
-        [row.asDict() for row in resumen_periodo.collect()]
-    )
-
-
-def _mapreduce_asistencia(spark):
-    import sys, os
-    directorio_actual = os.path.dirname(__file__)
-    if directorio_actual not in sys.path:
-        sys.path.insert(0, directorio_actual)
-
-    from spark_config import leer_coleccion
-    from pyspark.sql import functions as F
-
-    df = leer_coleccion(spark, "asistencias")
-
-    # FASE DE MAPPING:
-    # Extraemos dimensiones temporales (mes y nombre del día) de la marca de tiempo.
-    df_mapped = df.select(
-        F.col("fecha"),
-        F.date_format(F.col("fecha"), "yyyy-MM").alias("periodo"),
-        F.date_format(F.col("fecha"), "EEEE").alias("dia_semana")
-    ).filter(F.col("fecha").isNotNull())
-
-    # FASE DE REDUCING (Volumen Mensual):
-    # Conteo de concurrencia total por mes.
-    por_mes = (
-        df_mapped
-        .groupBy("periodo")
-        .agg(F.count("*").alias("total_visitas"))
-        .orderBy("periodo")
-    )
-
-    # FASE DE REDUCING (Frecuencia por Día):
-    # Identificación de los días de la semana con mayor afluencia.
-    por_dia = (
-        df_mapped
-        .groupBy("dia_semana")
-        .agg(F.count("*").alias("total_visitas"))
-        .orderBy(F.count("*").desc()) # Orden descendente para ver picos de asistencia
-    )
-
-    return (
-        [row.asDict() for row in por_mes.collect()],
-        [row.asDict() for row in por_dia.collect()]
-    )
-
-
 def _clean(lst):
     """
     Función de utilidad para sanitizar tipos de datos antes de la serialización JSON.
@@ -179,28 +42,42 @@ def _clean(lst):
     return cleaned
 
 
-def _ejecutar_y_construir_payload(spark):
+def _ejecutar_y_construir_payload(db, completo=False):
     """
-    Orquestador principal: Ejecuta las tareas de MapReduce y construye el objeto de respuesta.
-    Consolidando los ingresos, tendencias de asistencia y metadatos de ejecución.
+    Orquestador principal: actualiza los agregados mensuales con los pagos y
+    asistencias nuevos y construye el objeto de respuesta.
+    Con completo=True se reconstruyen desde cero (tras editar o borrar históricos).
     """
-    from datetime import datetime
+    meses_ingresos   = rollups.actualizar(db, rollups.INGRESOS,   completo)
+    meses_asistencia = rollups.actualizar(db, rollups.ASISTENCIA, completo)
 
-    # Disparo de las tareas de análisis
-    ingresos_detalle, resumen_ingresos = _mapreduce_ingresos(spark)
-    asistencia_mes,   asistencia_dia   = _mapreduce_asistencia(spark)
+    ingresos_detalle, resumen_ingresos = rollups.ingresos(db)
+    asistencia_mes,   asistencia_dia   = rollups.asistencia(db)
 
     # Construcción de la estructura final (Payload)
     return {
         "algoritmo":   "MapReduce",
-        "descripcion": "Agregación distribuida de ingresos y asistencia por periodo",
+        "descripcion": "Agregación incremental de ingresos y asistencia por periodo",
         "ingresos_por_periodo":      _clean(ingresos_detalle),
         "resumen_ingresos":          _clean(resumen_ingresos),
         "asistencia_por_mes":        _clean(asistencia_mes),
         "asistencia_por_dia_semana": _clean(asistencia_dia),
+        "motor":                     "incremental",
+        "periodos_recalculados":     {"ingresos": len(meses_ingresos), "asistencia": len(meses_asistencia)},
         "ejecutado_en":              datetime.now().isoformat()
     }
 
+def reentrenar(completo=False):
+    """Re-ejecuta el MapReduce y actualiza la caché. Lo ejecuta el worker (app/analytics/worker.py)."""
+    db = get_db()
+    huella = cache.huella(db, FUENTES)
+    payload = _ejecutar_y_construir_payload(db, completo)
+    payload["desde_cache"] = False
+    cache.guardar(db, CACHE_KEY, payload, FUENTES, huella)
+    tipo = "completo" if completo else "incremental"
+    return CACHE_KEY, f"MapReduce {tipo} re-ejecutado y caché actualizada."
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # ENDPOINTS
 # ──────────────────────────────────────────────────────────────────────────────
@@ -209,19 +86,25 @@ def _ejecutar_y_construir_payload(spark):
 @jwt_required()
 def mapreduce_analytics():
     """
-    Devuelve el resultado desde caché. Si no existe, lo calcula por primera vez.
+    Devuelve el resultado desde caché. Si venció o llegaron pagos/asistencias
+    nuevos se sirve igual y se encola la actualización incremental.
+    Si no existe, encola el primer cálculo en el worker de analítica y
+    responde 202 con el id del trabajo.
     """
     try:
-        cached = _get_cached_result()
+        db = get_db()
+        cached, _ = cache.obtener(
+            db, CACHE_KEY, FUENTES, refrescar=lambda: cola.encolar(db, "mapreduce")
+        )
         if cached:
-            cached["desde_cache"] = True
-            return jsonify(cached), 200
+            return jsonify(cache.sin_internos(cached)), 200
 
-        spark   = _get_spark()
-        payload = _ejecutar_y_construir_payload(spark)
-        payload["desde_cache"] = False
-        _save_cached_result(payload)
-        return jsonify(payload), 200
+        job, _ = cola.encolar(db, "mapreduce")
+        return jsonify({
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": "Primer cálculo de MapReduce en cola: consulte status_url."
+        }), 202
 
     except Exception as e:
         import traceback
@@ -233,19 +116,19 @@ def mapreduce_analytics():
 @jwt_required()
 def mapreduce_train():
     """
-    Fuerza la re-ejecución del MapReduce y actualiza la caché.
-    No requiere body.
+    Encola la re-ejecución del MapReduce (worker de analítica) y responde 202.
+    Consultar /api/analytics/jobs/<job_id> para el estado y el resultado.
+    Body opcional: { "completo": true } para reconstruir los agregados desde cero.
     """
     try:
-        spark   = _get_spark()
-        payload = _ejecutar_y_construir_payload(spark)
-        payload["desde_cache"] = False
-        _save_cached_result(payload)
-
+        body = request.get_json(silent=True) or {}
+        params = {"completo": True} if body.get("completo") else {}
+        job, _ = cola.encolar(get_db(), "mapreduce", params)
         return jsonify({
-            **payload,
-            "mensaje": "MapReduce re-ejecutado y caché actualizada."
-        }), 200
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": "Re-ejecución de MapReduce en cola."
+        }), 202
 
     except Exception as e:
         import traceback
@@ -1,6 +1,13 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
-from datetime import datetime, timedelta
+from datetime import datetime
+from bson.objectid import ObjectId
+
+from app.mongo import get_db
+from app.analytics import motor_local, ids
+from app.analytics.motor import elegir_motor, MOTOR_LOCAL
+from app.analytics import cola, cache
+from app.models.member_features import MemberFeatures
 
 spark_regresion_bp = Blueprint("spark_regresion", __name__)
 
@@ -18,99 +25,15 @@ def _get_spark():
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# CACHÉ — solo se guarda el resultado global (métricas + coeficientes + tendencia)
-# Las predicciones individuales NO se cachean (son dinámicas por miembro)
-# ──────────────────────────────────────────────────────────────────────────────
-
-CACHE_COLLECTION = "analytics_cache"
-CACHE_KEY        = "regresion_global"
-
-
-def _get_cached_result():
-    try:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import get_mongo_db
-        db  = get_mongo_db()
-        doc = db[CACHE_COLLECTION].find_one({"_id": CACHE_KEY})
-        if doc:
-            doc.pop("_id", None)
-            return doc
-    except Exception as e:
-        print(f"[regresion cache] Error leyendo caché: {e}")
-    return None
-
-
-def _save_cached_result(payload: dict):
-    try:
-        import sys, os
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-        from spark_config import get_mongo_db
-        db = get_mongo_db()
-        db[CACHE_COLLECTION].replace_one(
-            {"_id": CACHE_KEY},
-            {"_id": CACHE_KEY, **payload},
-            upsert=True
-        )
-    except Exception as e:
-        print(f"[regresion cache] Error guardando caché: {e}")
-
-
-# ──────────────────────────────────────────────────────────────────────────────
-# HELPER: normalizar id
+# CACHÉ (app/analytics/cache.py) — resultado global (métricas + coeficientes +
+# tendencia) y, en `_modelo`, los pesos crudos con los que /predecir calcula
+# sin re-entrenar.
+# Las predicciones de todos los miembros las precalcula el job "predicciones"
+# en la colección predicciones_peso (motor_local.precalcular_predicciones).
 # ──────────────────────────────────────────────────────────────────────────────
 
-def _resolver_id_miembro(spark, id_entrada: str) -> str:
-    import sys, os, re
-    directorio_actual = os.path.dirname(__file__)
-    if directorio_actual not in sys.path:
-        sys.path.insert(0, directorio_actual)
-
-    from spark_config import leer_coleccion
-    from pyspark.sql import functions as F
-    from pyspark.sql.types import StringType
-
-    def oid_hex(val):
-        if val is None:
-            return None
-        m = re.search(r"[0-9a-fA-F]{24}", str(val))
-        return m.group(0) if m else str(val)
-
-    oid_udf = F.udf(oid_hex, StringType())
-
-    hits = (
-        leer_coleccion(spark, "progreso_fisico")
-        .withColumn("id_hex", oid_udf(F.col("id_miembro")))
-        .filter(F.col("id_hex") == id_entrada)
-        .count()
-    )
-    if hits > 0:
-        return id_entrada
-
-    df_miembro = (
-        leer_coleccion(spark, "miembros")
-        .withColumn("id_usuario_hex", oid_udf(F.col("id_usuario")))
-        .filter(F.col("id_usuario_hex") == id_entrada)
-        .select(oid_udf(F.col("_id")).alias("id_miembro_hex"))
-        .limit(1)
-    )
-    filas = df_miembro.collect()
-    if filas:
-        id_miembro_real = filas[0]["id_miembro_hex"]
-        hits2 = (
-            leer_coleccion(spark, "progreso_fisico")
-            .withColumn("id_hex", oid_udf(F.col("id_miembro")))
-            .filter(F.col("id_hex") == id_miembro_real)
-            .count()
-        )
-        if hits2 > 0:
-            return id_miembro_real
-
-    return None
+CACHE_KEY = "regresion_global"
+FUENTES   = ["progreso_fisico"]
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -125,7 +48,6 @@ def _regresion_global(spark):
 
     from spark_config import leer_coleccion
     from pyspark.sql import functions as F
-    from pyspark.sql.window import Window
     from pyspark.ml.regression import LinearRegression
     from pyspark.ml.feature import VectorAssembler
     from pyspark.ml.evaluation import RegressionEvaluator
@@ -156,11 +78,18 @@ def _regresion_global(spark):
     # 2. INGENIERÍA DE CARACTERÍSTICAS (FEATURE ENGINEERING)
     # Calculamos la "antigüedad" en días para cada registro respecto al primer registro del miembro.
     # Esto convierte una fecha absoluta en una variable numérica lineal para la regresión.
-    w_min = Window.partitionBy("id_miembro")
-    df = df.withColumn(
-        "fecha_inicio", F.min("fecha_registro").over(w_min)
-    ).withColumn(
-        "dias", F.datediff(F.col("fecha_registro"), F.col("fecha_inicio")).cast("double")
+    # La fecha del primer registro ya está en member_features: un join en lugar de
+    # una ventana (shuffle + sort) sobre todo progreso_fisico.
+    MemberFeatures.asegurar(get_db())
+    df_inicio = (
+        leer_coleccion(spark, MemberFeatures.collection)
+        .select(F.col("_id").cast("string").alias("id_miembro"), F.col("fecha_inicio"))
+        .filter(F.col("fecha_inicio").isNotNull())
+    )
+    df = df.join(df_inicio, on="id_miembro", how="left").withColumn(
+        "dias", F.datediff(
+            F.col("fecha_registro"), F.coalesce(F.col("fecha_inicio"), F.col("fecha_registro"))
+        ).cast("double")
     )
 
     # 3. IMPUTACIÓN DE VALORES FALTANTES
@@ -254,183 +183,107 @@ def _build_global_payload(metricas, coeficientes, tendencia):
     }
 
 
-def _predecir_miembro(spark, model, id_miembro: str, dias_futuro: int,
-                     media_cintura: float, media_grasa: float):
+def _entrenar_global(db, motor):
+    """(modelo, metricas, coeficientes, tendencia, media_cintura, media_grasa) con el motor elegido."""
+    if motor == MOTOR_LOCAL:
+        return motor_local.regresion_global(db)
+    model, *resto = _regresion_global(_get_spark())
+    return (_modelo_a_dict(model), *resto)
+
+
+def _modelo_a_dict(model):
+    """Coeficientes de un LinearRegressionModel de Spark en el formato de motor_local."""
+    return {
+        "features":   motor_local.FEATURES_REGRESION,
+        "pesos":      [float(v) for v in model.coefficients],
+        "intercepto": float(model.intercept)
+    }
+
+
+def _payload_global(db):
+    motor = elegir_motor(db, FUENTES)
+    modelo, metricas, coeficientes, tendencia, media_cintura, media_grasa = _entrenar_global(db, motor)
+    payload = _build_global_payload(metricas, coeficientes, tendencia)
+    payload["motor"] = motor
+    payload["desde_cache"] = False
+    # Modelo y medias para que /predecir no tenga que re-entrenar
+    payload["_modelo"] = {**modelo, "version": payload["ejecutado_en"]}
+    payload["_medias"] = {"cintura": media_cintura, "grasa": media_grasa}
+    return payload
+
+
+def _modelo_vigente(db):
     """
-    Realiza una proyección futura para un miembro específico.
-    Utiliza el modelo global pero con los datos base (cintura, grasa) del usuario.
+    (modelo, media_cintura, media_grasa) desde la caché global, o None si la
+    caché no existe o es anterior a que se guardaran los coeficientes. No
+    entrena: eso lo hace el worker con el job "regresion".
     """
-    import sys, os, re
-    from datetime import datetime, timedelta
-    
-    # UDF para limpiar y estandarizar el formato de los ID provenientes de MongoDB.
-    def oid_hex(val):
-        if val is None:
-            return None
-        m = re.search(r"[0-9a-fA-F]{24}", str(val))
-        return m.group(0) if m else str(val)
-
-    from pyspark.sql.types import StringType
-    oid_udf = F.udf(oid_hex, StringType())
-
-    # Carga de la historia de progreso del miembro seleccionado.
-    df = (
-        leer_coleccion(spark, "progreso_fisico")
-        .withColumn("id_miembro_hex", oid_udf(F.col("id_miembro")))
-        .filter(F.col("id_miembro_hex") == id_miembro)
-        .select(
-            F.col("peso").cast("double"),
-            F.col("bmi").cast("double"),
-            F.col("cintura").cast("double"),
-            F.col("grasa_corporal").cast("double"),
-            F.col("fecha_registro")
-        )
-        .filter(F.col("peso").isNotNull())
-        .orderBy("fecha_registro")
-    )
+    cached = cache.leer(db, CACHE_KEY)
+    if not cached or "_modelo" not in cached:
+        return None
+    medias = cached.get("_medias", {})
+    return cached["_modelo"], medias.get("cintura", 80.0), medias.get("grasa", 22.0)
 
-    if df.count() == 0:
-        return None, []
-
-    # Obtenemos los últimos valores físicos registrados para proyectarlos.
-    ultimo          = df.orderBy(F.col("fecha_registro").desc()).limit(1).collect()[0]
-    primer_registro = df.agg(F.min("fecha_registro")).collect()[0][0]
-    dias_actuales   = (datetime.now() - primer_registro).days if primer_registro else 0
-
-    historial = [
-        {
-            "fecha": row["fecha_registro"].strftime("%Y-%m-%d")
-                     if hasattr(row["fecha_registro"], "strftime")
-                     else str(row["fecha_registro"]),
-            "peso": round(float(row["peso"]), 1)
-        }
-        for row in df.collect()
-    ]
-
-    # Datos de entrada estables para la predicción (Ceteris Paribus).
-    cintura = float(ultimo["cintura"]         or media_cintura)
-    grasa   = float(ultimo["grasa_corporal"] or media_grasa)
-    bmi     = float(ultimo["bmi"]            or 25.0)
 
-    from pyspark.ml.feature import VectorAssembler
-    assembler = VectorAssembler(
-        inputCols=["dias", "cintura", "grasa_corporal", "bmi"], outputCol="features"
+def _respuesta_en_cola(job, mensaje):
+    return jsonify({
+        **cola.to_dict(job),
+        "status_url": f"/api/analytics/jobs/{job['_id']}",
+        "mensaje": mensaje
+    }), 202
+
+
+def reentrenar():
+    """
+    Re-entrena el modelo global y actualiza la caché. Lo ejecuta el worker
+    (app/analytics/worker.py), que después recalcula las predicciones precalculadas.
+    """
+    db = get_db()
+    huella = cache.huella(db, FUENTES)
+    cache.guardar(db, CACHE_KEY, _payload_global(db), FUENTES, huella)
+    cola.encolar(db, "predicciones")
+    return CACHE_KEY, "Modelo de regresión reentrenado y caché actualizada."
+
+
+def precalcular():
+    """Predicciones de todos los miembros con el modelo en caché (job "predicciones" del worker)."""
+    db = get_db()
+    vigente = _modelo_vigente(db)
+    if vigente is None:
+        # Aún no hay modelo: se entrena aquí mismo, ya dentro del worker
+        huella = cache.huella(db, FUENTES)
+        cache.guardar(db, CACHE_KEY, _payload_global(db), FUENTES, huella)
+        vigente = _modelo_vigente(db)
+    modelo, media_cintura, media_grasa = vigente
+    total = motor_local.precalcular_predicciones(
+        db, modelo, media_cintura, media_grasa, modelo["version"]
     )
+    return None, f"Predicciones precalculadas para {total} miembros."
 
-    # 7. GENERACIÓN DE PREDICCIONES POR INTERVALOS
-    # Generamos estimaciones cada 30 días hasta el límite definido.
-    predicciones_futuras = []
-    for d in [30, 60, 90, 120, 150, 180]:
-        if d <= dias_futuro:
-            # Creamos un DataFrame efímero para alimentar el modelo.
-            pred_data = spark.createDataFrame(
-                [(float(dias_actuales + d), cintura, grasa, bmi)],
-                ["dias", "cintura", "grasa_corporal", "bmi"]
-            )
-            # El modelo aplica la fórmula lineal aprendida:
-            # Peso_pred = Intercepto + (coef_dias * dias_futuros) + ...
-            peso_pred = model.transform(
-                assembler.transform(pred_data)
-            ).collect()[0]["prediction"]
-            
-            predicciones_futuras.append({
-                "dias_desde_hoy":   d,
-                "fecha_estimada":   (datetime.now() + timedelta(days=d)).strftime("%Y-%m-%d"),
-                "peso_predicho_kg": round(float(peso_pred), 2)
-            })
-
-    return historial, predicciones_futuras
+
+def _precalculadas(db, id_miembro: str, modelo, registros):
+    """
+    Predicciones de predicciones_peso si siguen vigentes: mismo modelo,
+    calculadas hoy y sin registros de progreso posteriores. Si no, None.
+    """
+    doc = db[motor_local.COLECCION_PREDICCIONES].find_one({"_id": ObjectId(id_miembro)})
+    if not doc or doc.get("modelo_version") != modelo.get("version"):
+        return None
+    if doc["fecha_calculo"].date() != datetime.now().date():
+        return None
+    if doc.get("fecha_ultimo_registro") != registros[-1].get("fecha_registro"):
+        return None
+    return doc["predicciones"]
 
 # ──────────────────────────────────────────────────────────────────────────────
-# ENDPOINTS DIAGNÓSTICO (sin cambios)
+# ENDPOINTS DIAGNÓSTICO (lecturas indexadas, ver app/analytics/ids.py)
 # ──────────────────────────────────────────────────────────────────────────────
 
 @spark_regresion_bp.route("/api/analytics/regresion/debug2/<id_entrada>", methods=["GET"])
 @jwt_required()
 def debug_cadena_ids(id_entrada: str):
     try:
-        import sys, os, re
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-
-        from spark_config import leer_coleccion
-        from pyspark.sql import functions as F
-        from pyspark.sql.types import StringType
-
-        id_entrada = id_entrada.strip("{}")
-        spark = _get_spark()
-
-        def oid_hex(val):
-            if val is None:
-                return None
-            m = re.search(r"[0-9a-fA-F]{24}", str(val))
-            return m.group(0) if m else str(val)
-
-        oid_udf = F.udf(oid_hex, StringType())
-        resultado = {"id_entrada": id_entrada, "pasos": {}}
-
-        usuarios = [
-            r.asDict() for r in (
-                leer_coleccion(spark, "usuarios")
-                .withColumn("_id_hex", oid_udf(F.col("_id")))
-                .filter(F.col("_id_hex") == id_entrada)
-                .select(oid_udf(F.col("_id")).alias("id_usuario"), F.col("nombre"), F.col("email"))
-            ).collect()
-        ]
-        resultado["pasos"]["1_en_usuarios"] = {"encontrado": len(usuarios) > 0, "datos": usuarios}
-
-        miembro_por_id = [
-            r.asDict() for r in (
-                leer_coleccion(spark, "miembros")
-                .withColumn("_id_hex", oid_udf(F.col("_id")))
-                .filter(F.col("_id_hex") == id_entrada)
-                .select(oid_udf(F.col("_id")).alias("id_miembro"),
-                        oid_udf(F.col("id_usuario")).alias("id_usuario"), F.col("estado"))
-            ).collect()
-        ]
-        resultado["pasos"]["2_en_miembros_como_id"] = {"encontrado": len(miembro_por_id) > 0, "datos": miembro_por_id}
-
-        miembro_por_usuario = [
-            r.asDict() for r in (
-                leer_coleccion(spark, "miembros")
-                .withColumn("id_usuario_hex", oid_udf(F.col("id_usuario")))
-                .filter(F.col("id_usuario_hex") == id_entrada)
-                .select(oid_udf(F.col("_id")).alias("id_miembro"),
-                        oid_udf(F.col("id_usuario")).alias("id_usuario"), F.col("estado"))
-            ).collect()
-        ]
-        resultado["pasos"]["3_en_miembros_como_id_usuario"] = {"encontrado": len(miembro_por_usuario) > 0, "datos": miembro_por_usuario}
-
-        registros_progreso = (
-            leer_coleccion(spark, "progreso_fisico")
-            .withColumn("id_hex", oid_udf(F.col("id_miembro")))
-            .filter(F.col("id_hex") == id_entrada)
-            .count()
-        )
-        resultado["pasos"]["4_en_progreso_fisico"] = {
-            "encontrado": registros_progreso > 0,
-            "num_registros": registros_progreso
-        }
-
-        id_correcto = None
-        if registros_progreso > 0:
-            id_correcto = id_entrada
-            diagnostico = "OK: Este id ya es correcto para el endpoint predecir."
-        elif miembro_por_usuario:
-            id_correcto = miembro_por_usuario[0]["id_miembro"]
-            diagnostico = f"CORREGIR: Estas pasando el id de USUARIO. El id correcto de MIEMBRO es: {id_correcto}"
-        elif miembro_por_id:
-            id_correcto = id_entrada
-            diagnostico = "PROBLEMA: Es un id de miembro valido pero no tiene registros en progreso_fisico."
-        elif usuarios:
-            diagnostico = "PROBLEMA: Es un id de usuario sin miembro asociado."
-        else:
-            diagnostico = "NOT_FOUND: El id no existe en ninguna coleccion."
-
-        resultado["id_correcto_para_predecir"] = id_correcto
-        resultado["diagnostico"]               = diagnostico
-        return jsonify(resultado), 200
+        return jsonify(ids.diagnosticar_cadena(get_db(), id_entrada.strip("{}"))), 200
 
     except Exception as e:
         import traceback
@@ -441,51 +294,8 @@ def debug_cadena_ids(id_entrada: str):
 @spark_regresion_bp.route("/api/analytics/regresion/debug/<id_miembro>", methods=["GET"])
 @jwt_required()
 def debug_miembro(id_miembro: str):
-    id_miembro = id_miembro.strip("{}")
     try:
-        import sys, os, re
-        directorio_actual = os.path.dirname(__file__)
-        if directorio_actual not in sys.path:
-            sys.path.insert(0, directorio_actual)
-
-        from spark_config import leer_coleccion
-        from pyspark.sql import functions as F
-        from pyspark.sql.types import StringType, StructType
-
-        spark  = _get_spark()
-        df_raw = leer_coleccion(spark, "progreso_fisico")
-        tipo_campo = str(df_raw.schema["id_miembro"].dataType)
-        es_struct  = isinstance(df_raw.schema["id_miembro"].dataType, StructType)
-        subcampos  = ([f.name for f in df_raw.schema["id_miembro"].dataType.fields] if es_struct else [])
-
-        muestras_raw  = [str(r["id_miembro"]) for r in df_raw.select("id_miembro").limit(5).collect()]
-        muestras_cast = [str(r["c"]) for r in df_raw.select(F.col("id_miembro").cast("string").alias("c")).limit(5).collect()]
-
-        def oid_hex(val):
-            if val is None: return None
-            m = re.search(r"[0-9a-fA-F]{24}", str(val))
-            return m.group(0) if m else str(val)
-
-        oid_udf = F.udf(oid_hex, StringType())
-        muestras_udf = [str(r["h"]) for r in df_raw.select(oid_udf(F.col("id_miembro")).alias("h")).limit(5).collect()]
-
-        total_db   = df_raw.count()
-        hits_cast  = df_raw.filter(F.col("id_miembro").cast("string") == id_miembro).count()
-        hits_udf   = (df_raw.withColumn("h", oid_udf(F.col("id_miembro"))).filter(F.col("h") == id_miembro).count())
-
-        diagnostico = (
-            "OK_UDF"  if hits_udf  > 0 else
-            "OK_CAST" if hits_cast > 0 else
-            "FALLO: Este id no existe en progreso_fisico. Usa /debug2/{id} para trazar la cadena completa."
-        )
-
-        return jsonify({
-            "id_recibido": id_miembro, "tipo_campo_spark": tipo_campo,
-            "muestras_raw": muestras_raw, "muestras_cast_string": muestras_cast,
-            "muestras_udf_hex": muestras_udf, "total_registros_db": total_db,
-            "hits_con_cast": hits_cast, "hits_con_udf": hits_udf,
-            "diagnostico": diagnostico
-        }), 200
+        return jsonify(ids.diagnosticar_campo(get_db(), id_miembro.strip("{}"))), 200
 
     except Exception as e:
         import traceback; traceback.print_exc()
@@ -501,22 +311,20 @@ def debug_miembro(id_miembro: str):
 def regresion_analytics():
     """
     Devuelve métricas globales del modelo desde caché.
-    Si no hay caché, entrena el modelo por primera vez.
+    Si venció o hay progreso nuevo se sirve igual y se encola el re-entrenamiento.
+    Si no hay caché, encola el primer entrenamiento en el worker de analítica
+    y responde 202 con el id del trabajo.
     """
     try:
-        cached = _get_cached_result()
+        db = get_db()
+        cached, _ = cache.obtener(
+            db, CACHE_KEY, FUENTES, refrescar=lambda: cola.encolar(db, "regresion")
+        )
         if cached:
-            cached["desde_cache"] = True
-            return jsonify(cached), 200
-
-        spark = _get_spark()
-        model, metricas, coeficientes, tendencia, media_cintura, media_grasa = _regresion_global(spark)
-        payload = _build_global_payload(metricas, coeficientes, tendencia)
-        payload["desde_cache"] = False
-        # Guardar medias para predicciones futuras también
-        payload["_medias"] = {"cintura": media_cintura, "grasa": media_grasa}
-        _save_cached_result(payload)
-        return jsonify(payload), 200
+            return jsonify(cache.sin_internos(cached)), 200
+
+        job, _ = cola.encolar(db, "regresion")
+        return _respuesta_en_cola(job, "Primer entrenamiento de regresión en cola: consulte status_url.")
 
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
@@ -529,24 +337,39 @@ def regresion_analytics():
 @jwt_required()
 def regresion_train():
     """
-    Fuerza el re-entrenamiento del modelo de regresión y actualiza la caché.
+    Encola el re-entrenamiento del modelo de regresión (worker de analítica) y responde 202.
+    Consultar /api/analytics/jobs/<job_id> para el estado y el resultado.
     No requiere body.
     """
     try:
-        spark = _get_spark()
-        model, metricas, coeficientes, tendencia, media_cintura, media_grasa = _regresion_global(spark)
-        payload = _build_global_payload(metricas, coeficientes, tendencia)
-        payload["desde_cache"] = False
-        payload["_medias"] = {"cintura": media_cintura, "grasa": media_grasa}
-        _save_cached_result(payload)
+        job, _ = cola.encolar(get_db(), "regresion")
+        return jsonify({
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": "Re-entrenamiento de regresión en cola."
+        }), 202
 
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@spark_regresion_bp.route("/api/analytics/regresion/predicciones/train", methods=["POST"])
+@jwt_required()
+def predicciones_train():
+    """
+    Encola el precálculo de predicciones de todos los miembros (colección
+    predicciones_peso) con el modelo en caché y responde 202.
+    También se encola solo después de cada re-entrenamiento.
+    """
+    try:
+        job, _ = cola.encolar(get_db(), "predicciones")
         return jsonify({
-            **payload,
-            "mensaje": "Modelo de regresión reentrenado y caché actualizada."
-        }), 200
+            **cola.to_dict(job),
+            "status_url": f"/api/analytics/jobs/{job['_id']}",
+            "mensaje": "Precálculo de predicciones en cola."
+        }), 202
 
-    except ValueError as ve:
-        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -557,7 +380,9 @@ def regresion_train():
 def predecir_peso_miembro(id_entrada: str):
     """
     Acepta tanto el id de MIEMBRO como el id de USUARIO.
-    Siempre re-entrena el modelo en vivo (las predicciones individuales no se cachean).
+    Usa los coeficientes guardados en la caché global (no re-entrena) y, si están
+    vigentes, las predicciones precalculadas por el job "predicciones". Si aún
+    no hay modelo, encola su entrenamiento y responde 202 con el id del trabajo.
     """
     try:
         id_entrada  = id_entrada.strip("{}")
@@ -565,8 +390,8 @@ def predecir_peso_miembro(id_entrada: str):
         if not (30 <= dias_futuro <= 365):
             return jsonify({"error": "dias debe estar entre 30 y 365"}), 400
 
-        spark = _get_spark()
-        id_miembro_real = _resolver_id_miembro(spark, id_entrada)
+        db = get_db()
+        id_miembro_real = ids.resolver_id_miembro(db, id_entrada)
 
         if id_miembro_real is None:
             return jsonify({
@@ -574,22 +399,30 @@ def predecir_peso_miembro(id_entrada: str):
                 "sugerencia": f"Llama a /api/analytics/regresion/debug2/{id_entrada} para diagnosticar la cadena de ids."
             }), 404
 
-        # Intentar usar medias guardadas en caché para evitar re-entrenar
-        media_cintura, media_grasa = 80.0, 22.0
-        cached = _get_cached_result()
-        if cached and "_medias" in cached:
-            media_cintura = cached["_medias"].get("cintura", 80.0)
-            media_grasa   = cached["_medias"].get("grasa",   22.0)
-
-        model, _, _, _, media_cintura, media_grasa = _regresion_global(spark)
-
-        historial, predicciones = _predecir_miembro(
-            spark, model, id_miembro_real, dias_futuro, media_cintura, media_grasa
-        )
-
-        if historial is None:
+        registros = motor_local.historial_miembro(db, id_miembro_real)
+        if not registros:
             return jsonify({"error": "El miembro no tiene registros de progreso"}), 404
 
+        vigente = _modelo_vigente(db)
+        if vigente is None:
+            job, _ = cola.encolar(db, "regresion")
+            return _respuesta_en_cola(
+                job, "Aún no hay modelo de regresión: entrenamiento en cola, consulte status_url."
+            )
+        modelo, media_cintura, media_grasa = vigente
+        precalculadas = _precalculadas(db, id_miembro_real, modelo, registros)
+
+        if precalculadas is not None:
+            vigentes = [p for p in precalculadas if p["dias_desde_hoy"] <= dias_futuro]
+            historial = motor_local.formatear_historial(registros)
+            predicciones = motor_local.formatear_predicciones(
+                [p["dias_desde_hoy"] for p in vigentes], [p["peso_predicho_kg"] for p in vigentes]
+            )
+        else:
+            historial, predicciones = motor_local.predecir_miembro(
+                db, modelo, id_miembro_real, dias_futuro, media_cintura, media_grasa, registros
+            )
+
         tendencia = "estable"
         if len(predicciones) >= 2 and len(historial) >= 1:
             diff = predicciones[-1]["peso_predicho_kg"] - historial[-1]["peso"]
@@ -600,6 +433,8 @@ def predecir_peso_miembro(id_entrada: str):
             "id_entrada":           id_entrada,
             "id_miembro_resuelto":  id_miembro_real,
             "algoritmo":            "Regresion Lineal",
+            "modelo_version":       modelo.get("version"),
+            "precalculada":         precalculadas is not None,
             "horizonte_dias":       dias_futuro,
             "peso_actual_kg":       historial[-1]["peso"] if historial else None,
             "tendencia":            tendencia,
@@ -5,6 +5,11 @@ from datetime import datetime, date, timedelta
 import traceback
 
 from app.mongo import get_db
+from app.utils.paginacion import leer_pagina_cursor, contar_total
+from app.models.asistencia import Asistencia
+from app.models.trainer_client_stats import TrainerClientStats
+from app.models.rutina_models import RutinaRepositorio
+from app.utils.busqueda import filtro_busqueda
 
 trainer_bp = Blueprint('trainer', __name__, url_prefix='/api/trainer')
 
@@ -32,137 +37,35 @@ def get_trainer_clients():
         search = request.args.get('search', '')
         status = request.args.get('status', 'all')
 
-        inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0)
+        # 📊 Vista materializada: métricas ya calculadas por miembro
+        query = {"id_entrenador": current_user_id}
+        query.update(filtro_busqueda(search))
 
-        pipeline = [
-            {"$match": {"id_entrenador": current_user_id}},
-
-            # 🔗 JOIN USUARIOS
-            {
-                "$lookup": {
-                    "from": "usuarios",
-                    "localField": "id_usuario",
-                    "foreignField": "_id",
-                    "as": "usuario"
-                }
-            },
-            {"$unwind": {"path": "$usuario", "preserveNullAndEmptyArrays": True}},
-        ]
-
-        # 🔍 FILTRO POR NOMBRE (YA CON JOIN)
-        if search:
-            pipeline.append({
-                "$match": {
-                    "usuario.nombre": {"$regex": search, "$options": "i"}
-                }
-            })
+        # ✅ FILTRO POR STATUS ANTES DE PAGINAR (las páginas salen completas)
+        if status != "all":
+            query["status"] = status
 
-        pipeline.extend([
-            {
-                "$facet": {
-                    "data": [
-                        {"$skip": skip},
-                        {"$limit": per_page},
-
-                        # 📊 sesiones completadas
-                        {
-                            "$lookup": {
-                                "from": "sesiones",
-                                "let": {"miembro_id": "$_id"},
-                                "pipeline": [
-                                    {
-                                        "$match": {
-                                            "$expr": {
-                                                "$and": [
-                                                    {"$eq": ["$id_miembro", "$$miembro_id"]},
-                                                    {"$eq": ["$estado", "completed"]}
-                                                ]
-                                            }
-                                        }
-                                    },
-                                    {"$count": "total"}
-                                ],
-                                "as": "sesiones_data"
-                            }
-                        },
-
-                        # 📅 asistencias del mes
-                        {
-                            "$lookup": {
-                                "from": "asistencias",
-                                "let": {"miembro_id": "$_id"},
-                                "pipeline": [
-                                    {
-                                        "$match": {
-                                            "$expr": {
-                                                "$and": [
-                                                    {"$eq": ["$id_miembro", "$$miembro_id"]},
-                                                    {"$gte": ["$fecha", inicio_mes]}
-                                                ]
-                                            }
-                                        }
-                                    },
-                                    {"$count": "total"}
-                                ],
-                                "as": "asistencias_mes_data"
-                            }
-                        },
-
-                        # 🔄 NORMALIZACIÓN
-                        {
-                            "$addFields": {
-                                "total_sesiones": {
-                                    "$ifNull": [{"$arrayElemAt": ["$sesiones_data.total", 0]}, 0]
-                                },
-                                "asistencias_mes": {
-                                    "$ifNull": [{"$arrayElemAt": ["$asistencias_mes_data.total", 0]}, 0]
-                                }
-                            }
-                        }
-                    ],
-                    "totalCount": [
-                        {"$count": "total"}
-                    ]
-                }
-            }
-        ])
+        # Primera visita de un entrenador sin vista construida: se arma una vez
+        if not TrainerClientStats.construida(db, current_user_id):
+            TrainerClientStats.refrescar_entrenador(db, current_user_id)
 
-        result = list(db.miembros.aggregate(pipeline))[0]
+        coleccion = db[TrainerClientStats.collection]
+        total = coleccion.count_documents(query)
 
-        data = result["data"]
-        total = result["totalCount"][0]["total"] if result["totalCount"] else 0
+        filas = coleccion.find(query).sort("nombre", 1).skip(skip).limit(per_page)
 
         clients_data = []
 
-        for r in data:
-            miembro_id = r["_id"]
-
-            # 🔥 cálculos ligeros
-            racha = calcular_racha_dias(db, miembro_id)
-            tasa_asistencia = calcular_tasa_asistencia(db, miembro_id)
-
-            estado = determinar_estado_cliente(
-                None,  # puedes mejorar luego con última sesión
-                tasa_asistencia
-            )
-
-            client_data = {
-                "id": str(miembro_id),
-                "name": r.get("usuario", {}).get("nombre", "Sin nombre"),
+        for r in filas:
+            clients_data.append({
+                "id": str(r["_id"]),
+                "name": r.get("nombre", "Sin nombre"),
                 "goal": r.get("objetivo"),
-                "sessionsTotal": r.get("total_sesiones", 0),
-                "attendance": tasa_asistencia,
-                "streak": racha,
-                "status": estado
-            }
-
-            clients_data.append(client_data)
-
-        # ⚠️ FILTRO POR STATUS (POST-PROCESO)
-        if status != "all":
-            clients_data = [
-                c for c in clients_data if c["status"] == status
-            ]
+                "sessionsTotal": r.get("sesiones_completadas", 0),
+                "attendance": r.get("tasa_asistencia", 0),
+                "streak": calcular_racha_dias(r),
+                "status": r.get("status", "warning")
+            })
 
         return jsonify({
             "success": True,
@@ -375,12 +278,33 @@ def get_sessions():
         if status_f != 'all':
             query["estado"] = status_f
 
-        total = db.sesiones.count_documents(query)
-        sessions = list(db.sesiones.find(query).sort([("fecha", -1), ("hora_inicio", -1)]).skip((page - 1) * per_page).limit(per_page))
-
         all_sessions = list(db.sesiones.find({"id_entrenador": trainer_id}))
         stats = _compute_stats(all_sessions)
 
+        # Modo cursor: ?after=<token> (vacío en la primera página), mismo orden que el
+        # modo página (fecha + hora_inicio) con _id como desempate
+        if 'after' in request.args:
+            try:
+                sessions, siguiente = leer_pagina_cursor(
+                    db.sesiones, query, ["fecha", "hora_inicio"], request.args.get('after'), per_page
+                )
+            except ValueError as ve:
+                return jsonify({"error": str(ve)}), 400
+
+            respuesta = {
+                "sessions": [_sesion_to_dict(db, s) for s in sessions],
+                "next_cursor": siguiente,
+                "has_more": siguiente is not None,
+                "per_page": per_page,
+                "stats": stats
+            }
+            if request.args.get('con_total', 'false') == 'true':
+                respuesta["total"] = contar_total(db.sesiones, query)
+            return jsonify(respuesta), 200
+
+        total = db.sesiones.count_documents(query)
+        sessions = list(db.sesiones.find(query).sort([("fecha", -1), ("hora_inicio", -1)]).skip((page - 1) * per_page).limit(per_page))
+
         return jsonify({
             "sessions": [_sesion_to_dict(db, s) for s in sessions],
             "total": total,
@@ -448,14 +372,19 @@ def update_session_status(session_id):
         if new_status == 'completed':
             update_data["asistencia"] = True
 
-        result = db.sesiones.update_one(
+        sesion = db.sesiones.find_one_and_update(
             {"_id": ObjectId(session_id), "id_entrenador": trainer_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"id_miembro": 1}
         )
         
-        if result.matched_count == 0:
+        if sesion is None:
             return jsonify({"error": "Sesión no encontrada"}), 404
 
+        # Mantener la cartera materializada del entrenador
+        if sesion.get("id_miembro"):
+            TrainerClientStats.refrescar(db, sesion["id_miembro"])
+
         return jsonify({"message": f"Estado actualizado a {new_status}"}), 200
 
     except Exception as e:
@@ -502,19 +431,19 @@ def get_routines():
         if category != 'all': query["categoria"] = category
         if search: query["nombre"] = {"$regex": search, "$options": "i"}
 
-        routines = list(db.rutinas.find(query).sort("fecha_actualizacion", -1))
+        # Árboles completos + conteo de clientes: 4 consultas para toda la biblioteca
+        routines = RutinaRepositorio.buscar(db, query, sort=[("fecha_actualizacion", -1)])
+        clientes_por_rutina = RutinaRepositorio.contar_clientes(db, [r["_id"] for r in routines])
         result = []
         
         for r in routines:
-            clients_count = db.miembro_rutina.count_documents({"id_rutina": r["_id"], "activa": True})
-            
-            dias = list(db.rutina_dias.find({"id_rutina": r["_id"]}).sort("orden", 1))
+            clients_count = clientes_por_rutina.get(r["_id"], 0)
             
             exercise_list = []
             total_ejercicios = 0
             
-            for dia in dias:
-                ejercicios = list(db.rutina_ejercicios.find({"id_rutina_dia": dia["_id"]}).sort("orden", 1))
+            for dia in r["dias"]:
+                ejercicios = dia["ejercicios"]
                 total_ejercicios += len(ejercicios)
                 
                 for ej in ejercicios:
@@ -541,10 +470,15 @@ def get_routines():
             })
 
         # Category Counts
-        category_counts = {
-            cat: db.rutinas.count_documents({"id_entrenador": trainer_id, "categoria": cat})
-            for cat in ['Fuerza', 'Hipertrofia', 'Cardio', 'Funcional', 'Movilidad']
+        categorias = ['Fuerza', 'Hipertrofia', 'Cardio', 'Funcional', 'Movilidad']
+        conteos = {
+            c["_id"]: c["total"]
+            for c in db.rutinas.aggregate([
+                {"$match": {"id_entrenador": trainer_id, "categoria": {"$in": categorias}}},
+                {"$group": {"_id": "$categoria", "total": {"$sum": 1}}}
+            ])
         }
+        category_counts = {cat: conteos.get(cat, 0) for cat in categorias}
 
         return jsonify({
             'success': True,
@@ -568,7 +502,28 @@ def create_routine():
         if not data or not data.get('name', '').strip():
             return jsonify({'success': False, 'message': 'El campo "name" es requerido'}), 400
 
-        nueva_rutina = {
+        dias = [
+            {
+                "dia_semana": day_data.get('day'),
+                "grupo_muscular": day_data.get('muscleGroup', ''),
+                "orden": order_d,
+                "ejercicios": [
+                    {
+                        "nombre_ejercicio": ej_data.get('name', '').strip(),
+                        "series": str(ej_data.get('sets', '3')),
+                        "repeticiones": str(ej_data.get('reps', '12')),
+                        "peso": ej_data.get('peso', ''),
+                        "notas": ej_data.get('notes', ''),
+                        "orden": order_e
+                    }
+                    for order_e, ej_data in enumerate(day_data.get('exercises', []))
+                ]
+            }
+            for order_d, day_data in enumerate(data.get('days', []))
+        ]
+
+        # Rutina + días + ejercicios: 3 escrituras dentro de una transacción
+        nueva_rutina = RutinaRepositorio.crear(db, {
             "id_entrenador": trainer_id,
             "id_miembro": ObjectId(data.get('id_miembro')) if data.get('id_miembro') else None,
             "nombre": data['name'].strip(),
@@ -580,32 +535,8 @@ def create_routine():
             "activa": True,
             "fecha_creacion": datetime.now(),
             "fecha_actualizacion": datetime.now()
-        }
-        rutina_id = db.rutinas.insert_one(nueva_rutina).inserted_id
-
-        for order_d, day_data in enumerate(data.get('days', [])):
-            nuevo_dia = {
-                "id_rutina": rutina_id,
-                "dia_semana": day_data.get('day'),
-                "grupo_muscular": day_data.get('muscleGroup', ''),
-                "orden": order_d
-            }
-            dia_id = db.rutina_dias.insert_one(nuevo_dia).inserted_id
-
-            ejercicios_insert = []
-            for order_e, ej_data in enumerate(day_data.get('exercises', [])):
-                ejercicios_insert.append({
-                    "id_rutina_dia": dia_id,
-                    "nombre_ejercicio": ej_data.get('name', '').strip(),
-                    "series": str(ej_data.get('sets', '3')),
-                    "repeticiones": str(ej_data.get('reps', '12')),
-                    "peso": ej_data.get('peso', ''),
-                    "notas": ej_data.get('notes', ''),
-                    "orden": order_e
-                })
-            
-            if ejercicios_insert:
-                db.rutina_ejercicios.insert_many(ejercicios_insert)
+        }, dias)
+        rutina_id = nueva_rutina["_id"]
 
         return jsonify({
             'success': True,
@@ -780,21 +711,10 @@ def _compute_stats(sessions: list) -> dict:
         "attendance_rate": round((attended / total) * 100) if total else 0,
     }
 
-def calcular_racha_dias(db, id_miembro):
+def calcular_racha_dias(miembro):
+    """Racha guardada en el documento del miembro (se mantiene en cada check-in)."""
     try:
-        asistencias = list(db.asistencias.find({"id_miembro": id_miembro}).sort("fecha", -1))
-        if not asistencias: return 0
-        racha = 0
-        fecha_actual = datetime.now().date()
-        for asistencia in asistencias:
-            f_asist = asistencia.get("fecha")
-            if isinstance(f_asist, datetime): f_asist = f_asist.date()
-            if f_asist == fecha_actual or f_asist == fecha_actual - timedelta(days=racha):
-                racha += 1
-                fecha_actual = f_asist
-            else:
-                break
-        return racha
+        return Asistencia.racha_vigente(miembro)
     except Exception: return 0
 
 def calcular_progreso_porcentaje(miembro, progreso_inicial, progreso_actual):
@@ -810,23 +730,6 @@ def calcular_progreso_porcentaje(miembro, progreso_inicial, progreso_actual):
         return min(round((progreso / objetivo_total) * 100), 100)
     except Exception: return 0
 
-def calcular_tasa_asistencia(db, id_miembro):
-    try:
-        fecha_inicio = datetime.now() - timedelta(days=30)
-        programadas = db.sesiones.count_documents({
-            "id_miembro": id_miembro,
-            "fecha": {"$gte": fecha_inicio},
-            "estado": {"$in": ['completed', 'cancelled']}
-        })
-        if programadas == 0: return 0
-        completadas = db.sesiones.count_documents({
-            "id_miembro": id_miembro,
-            "fecha": {"$gte": fecha_inicio},
-            "estado": 'completed'
-        })
-        return round((completadas / programadas) * 100)
-    except Exception: return 0
-
 def determinar_tendencia(progreso_inicial, progreso_actual):
     try:
         if not progreso_inicial or not progreso_actual: return 'stable'
@@ -837,15 +740,6 @@ def determinar_tendencia(progreso_inicial, progreso_actual):
         return 'down' if diferencia > 0 else 'up'
     except Exception: return 'stable'
 
-def determinar_estado_cliente(ultima_sesion, tasa_asistencia):
-    try:
-        if not ultima_sesion: return 'warning'
-        fecha_us = ultima_sesion.get("fecha")
-        if isinstance(fecha_us, datetime): fecha_us = fecha_us.date()
-        dias = (datetime.now().date() - fecha_us).days
-        return 'warning' if dias > 7 or tasa_asistencia < 70 else 'active'
-    except Exception: return 'active'
-
 def calcular_edad(fecha_nacimiento):
     try:
         if not fecha_nacimiento: return 0
@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.models.progreso_fisico import ProgresoFisico
 
 user_body_progress_bp = Blueprint('user_body_progress', __name__)
 
@@ -164,7 +165,7 @@ def add_body_progress():
             bmi = round(_calcular_imc(nuevo_progreso["peso"], estatura), 2)
             nuevo_progreso["bmi"] = bmi
             
-        db.progreso_fisico.insert_one(nuevo_progreso)
+        ProgresoFisico.registrar(db, miembro, nuevo_progreso)
         
         return jsonify({
             "message": "Progreso registrado correctamente",
@@ -3,6 +3,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.models.asistencia import Asistencia
+from app.models.trainer_client_stats import TrainerClientStats
+from app.models.progreso_fisico import ProgresoFisico
 
 user_dashboard_bp = Blueprint('user_dashboard', __name__)
 
@@ -31,17 +34,25 @@ def get_user_dashboard():
             "foto_perfil": miembro.get("foto_perfil")
         }
 
+        # Consultas compartidas: una agregación $facet sobre asistencias y una
+        # lectura de progreso_fisico; todos los bloques se arman a partir de ellas.
+        now = datetime.now()
+        resumen_asistencias = _get_resumen_asistencias(db, miembro["_id"], now)
+        progresos_recientes = list(
+            db.progreso_fisico.find({"id_miembro": miembro["_id"]}).sort("fecha_registro", -1).limit(2)
+        )
+
         # 2. ESTADÍSTICAS DE WORKOUT
-        workout_stats = _get_workout_stats(db, miembro["_id"], miembro.get("estatura"))
+        workout_stats = _get_workout_stats(miembro, resumen_asistencias, progresos_recientes, now)
         
         # 3. RUTINA DE HOY (simulada)
         today_workout = _get_today_workout()
         
         # 4. PROGRESO SEMANAL
-        weekly_progress = _get_weekly_progress(db, miembro["_id"])
+        weekly_progress = _get_weekly_progress(resumen_asistencias)
         
         # 5. LOGROS RECIENTES
-        recent_achievements = _get_recent_achievements(db, miembro["_id"])
+        recent_achievements = _get_recent_achievements(miembro, resumen_asistencias, progresos_recientes)
         
         # 6. INFORMACIÓN DE MEMBRESÍA ACTIVA
         membership_info = _get_active_membership(db, miembro["_id"])
@@ -62,43 +73,98 @@ def get_user_dashboard():
         return jsonify({"error": str(e)}), 500
 
 
-def _get_workout_stats(db, id_miembro, estatura):
+def _rango_mes(now):
+    start_of_month = datetime(now.year, now.month, 1)
+    if now.month == 12:
+        start_of_next_month = datetime(now.year + 1, 1, 1)
+    else:
+        start_of_next_month = datetime(now.year, now.month + 1, 1)
+    return start_of_month, start_of_next_month
+
+
+def _a_fecha(valor):
+    """Normaliza una fecha de asistencia (datetime o string 'YYYY-MM-DD...') a date."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, str):
+        return datetime.strptime(valor[:10], "%Y-%m-%d").date()
+    return valor
+
+
+def _get_resumen_asistencias(db, id_miembro, now):
+    """
+    Una sola agregación $facet sobre asistencias con todo lo que necesita el dashboard:
+    conteo del mes, días asistidos de la semana y primera asistencia.
+    """
+    resumen = {"asistencias_mes": 0, "dias_semana": set(), "primera_fecha": None}
     try:
-        now = datetime.now()
-        start_of_month = datetime(now.year, now.month, 1)
-        if now.month == 12:
-            start_of_next_month = datetime(now.year + 1, 1, 1)
-        else:
-            start_of_next_month = datetime(now.year, now.month + 1, 1)
-            
-        # Asistencias este mes
-        asistencias_mes = db.asistencias.count_documents({
-            "id_miembro": id_miembro,
-            "fecha": {"$gte": start_of_month, "$lt": start_of_next_month}
-        })
-        
-        racha = _calcular_racha(db, id_miembro)
+        start_of_month, start_of_next_month = _rango_mes(now)
+        inicio_semana = datetime.combine(now.date() - timedelta(days=now.weekday()), datetime.min.time())
+        fin_semana = inicio_semana + timedelta(days=7)
+
+        # Día "YYYY-MM-DD" tanto si fecha es datetime como string
+        dia_expr = {
+            "$cond": [
+                {"$eq": [{"$type": "$fecha"}, "date"]},
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha"}},
+                {"$substrCP": ["$fecha", 0, 10]}
+            ]
+        }
+
+        pipeline = [
+            {"$match": {"id_miembro": id_miembro}},
+            {"$facet": {
+                "mes": [
+                    {"$match": {"fecha": {"$gte": start_of_month, "$lt": start_of_next_month}}},
+                    {"$count": "total"}
+                ],
+                "semana": [
+                    {"$match": {"fecha": {"$gte": inicio_semana, "$lt": fin_semana}}},
+                    {"$group": {"_id": dia_expr}}
+                ],
+                "primera": [
+                    {"$sort": {"fecha": 1}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 0, "fecha": 1}}
+                ]
+            }}
+        ]
+        resultado = list(db.asistencias.aggregate(pipeline))
+        if not resultado:
+            return resumen
+        facetas = resultado[0]
+
+        resumen["asistencias_mes"] = facetas["mes"][0]["total"] if facetas["mes"] else 0
+
+        for d in facetas["semana"]:
+            if d["_id"]:
+                dia = datetime.strptime(d["_id"], "%Y-%m-%d").date()
+                resumen["dias_semana"].add((dia - inicio_semana.date()).days)
+
+        if facetas["primera"]:
+            resumen["primera_fecha"] = _a_fecha(facetas["primera"][0].get("fecha"))
+
+    except Exception as e:
+        print(f"Error en _get_resumen_asistencias: {e}")
+    return resumen
+
+
+def _get_workout_stats(miembro, resumen, progresos_recientes, now):
+    try:
+        asistencias_mes = resumen["asistencias_mes"]
+        # Racha mantenida en el check-in (lectura O(1) desde el propio miembro)
+        racha = Asistencia.racha_vigente(miembro, now.date())
         calorias_estimadas = asistencias_mes * 300
         
         # Progreso reciente
-        progreso_reciente = list(db.progreso_fisico.find({"id_miembro": id_miembro}).sort("fecha_registro", -1).limit(1))
-        
-        if progreso_reciente and progreso_reciente[0].get("peso"):
-            peso_actual = float(progreso_reciente[0]["peso"])
+        if progresos_recientes and progresos_recientes[0].get("peso"):
+            peso_actual = float(progresos_recientes[0]["peso"])
         else:
-            miembro = db.miembros.find_one({"_id": id_miembro})
             peso_actual = float(miembro.get("peso_inicial", 0) or 0)
             
         # Calcular semana actual (basado en fecha de primera asistencia)
-        primera_asistencia = list(db.asistencias.find({"id_miembro": id_miembro}).sort("fecha", 1).limit(1))
-        
-        if primera_asistencia:
-            fecha_pa = primera_asistencia[0].get("fecha")
-            if isinstance(fecha_pa, str):
-                fecha_pa = datetime.strptime(fecha_pa[:10], "%Y-%m-%d").date()
-            elif isinstance(fecha_pa, datetime):
-                fecha_pa = fecha_pa.date()
-                
+        fecha_pa = resumen["primera_fecha"]
+        if fecha_pa:
             dias_desde_inicio = (now.date() - fecha_pa).days
             semana_actual = (dias_desde_inicio // 7) + 1
         else:
@@ -119,44 +185,6 @@ def _get_workout_stats(db, id_miembro, estatura):
         }
 
 
-def _calcular_racha(db, id_miembro):
-    try:
-        asistencias = list(db.asistencias.find({"id_miembro": id_miembro}).sort("fecha", -1))
-        if not asistencias: return 0
-        
-        # Limpiar y ordenar fechas únicas
-        fechas_asistencia = []
-        for a in asistencias:
-            f = a.get("fecha")
-            if isinstance(f, datetime): f = f.date()
-            elif isinstance(f, str): f = datetime.strptime(f[:10], "%Y-%m-%d").date()
-            if f not in fechas_asistencia:
-                fechas_asistencia.append(f)
-                
-        fechas_asistencia.sort(reverse=True)
-        
-        fecha_actual = datetime.now().date()
-        fecha_mas_reciente = fechas_asistencia[0]
-        
-        dias_desde_ultima = (fecha_actual - fecha_mas_reciente).days
-        if dias_desde_ultima > 1: return 0
-        
-        racha = 0
-        fecha_esperada = fecha_actual if dias_desde_ultima == 0 else fecha_actual - timedelta(days=1)
-        
-        for fecha in fechas_asistencia:
-            if fecha == fecha_esperada:
-                racha += 1
-                fecha_esperada -= timedelta(days=1)
-            elif fecha < fecha_esperada:
-                break
-                
-        return racha
-    except Exception as e:
-        print(f"Error calculando racha: {e}")
-        return 0
-
-
 def _get_today_workout():
     dias = ["Descanso", "Pecho y Tríceps", "Espalda y Bíceps", "Pierna", "Hombro", "Cardio", "Descanso"]
     dia_semana = datetime.now().weekday()
@@ -203,33 +231,18 @@ def _get_today_workout():
     }
 
 
-def _get_weekly_progress(db, id_miembro):
+def _get_weekly_progress(resumen):
     try:
-        now = datetime.now()
-        inicio_semana = datetime.combine(now.date() - timedelta(days=now.weekday()), datetime.min.time())
-        progreso_diario = []
-        
-        for i in range(7):
-            dia_inicio = inicio_semana + timedelta(days=i)
-            dia_fin = dia_inicio + timedelta(days=1)
-            
-            asistencias = db.asistencias.count_documents({
-                "id_miembro": id_miembro,
-                "fecha": {"$gte": dia_inicio, "$lt": dia_fin}
-            })
-            
-            progreso_diario.append(100 if asistencias > 0 else 0)
-            
-        return progreso_diario
+        return [100 if i in resumen["dias_semana"] else 0 for i in range(7)]
     except Exception as e:
         print(f"Error en _get_weekly_progress: {e}")
         return [0, 0, 0, 0, 0, 0, 0]
 
 
-def _get_recent_achievements(db, id_miembro):
+def _get_recent_achievements(miembro, resumen, progresos):
     achievements = []
     try:
-        racha = _calcular_racha(db, id_miembro)
+        racha = Asistencia.racha_vigente(miembro)
         if racha >= 7:
             achievements.append({
                 "icon": "FaFire",
@@ -245,8 +258,6 @@ def _get_recent_achievements(db, id_miembro):
                 "color": "var(--warning-color)"
             })
             
-        progresos = list(db.progreso_fisico.find({"id_miembro": id_miembro}).sort("fecha_registro", -1).limit(2))
-        
         if len(progresos) >= 2:
             peso_actual = float(progresos[0].get("peso", 0) or 0)
             peso_anterior = float(progresos[1].get("peso", 0) or 0)
@@ -261,17 +272,7 @@ def _get_recent_achievements(db, id_miembro):
                     "color": "var(--success-color)"
                 })
                 
-        now = datetime.now()
-        start_of_month = datetime(now.year, now.month, 1)
-        if now.month == 12:
-            start_of_next_month = datetime(now.year + 1, 1, 1)
-        else:
-            start_of_next_month = datetime(now.year, now.month + 1, 1)
-            
-        asistencias_mes = db.asistencias.count_documents({
-            "id_miembro": id_miembro,
-            "fecha": {"$gte": start_of_month, "$lt": start_of_next_month}
-        })
+        asistencias_mes = resumen["asistencias_mes"]
         
         if asistencias_mes >= 20:
             achievements.append({
@@ -295,15 +296,23 @@ def _get_recent_achievements(db, id_miembro):
 
 def _get_active_membership(db, id_miembro):
     try:
-        membresia_activa = db.miembro_membresia.find_one({
-            "id_miembro": id_miembro,
-            "estado": 'Activa'
-        })
-        
-        if not membresia_activa:
+        # Asignación activa + plan en una sola ida a la base ($lookup)
+        resultado = list(db.miembro_membresia.aggregate([
+            {"$match": {"id_miembro": id_miembro, "estado": 'Activa'}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "membresias",
+                "localField": "id_membresia",
+                "foreignField": "_id",
+                "as": "plan"
+            }}
+        ]))
+        
+        if not resultado:
             return None
+        membresia_activa = resultado[0]
             
-        plan_doc = db.membresias.find_one({"_id": membresia_activa.get("id_membresia")})
+        plan_doc = membresia_activa["plan"][0] if membresia_activa.get("plan") else None
         nombre_plan = plan_doc.get("nombre", "N/A") if plan_doc else "N/A"
         
         fecha_fin = membresia_activa.get("fecha_fin")
@@ -375,10 +384,13 @@ def register_checkin():
         }
         
         db.asistencias.insert_one(nueva_asistencia)
+        racha = Asistencia.registrar_racha(db, miembro["_id"], now)
+        TrainerClientStats.actualizar_racha(db, miembro["_id"], racha)
         
         return jsonify({
             "message": "Asistencia registrada exitosamente",
-            "fecha": now.strftime('%Y-%m-%d')
+            "fecha": now.strftime('%Y-%m-%d'),
+            "racha": Asistencia.racha_vigente(racha, now.date())
         }), 201
         
     except Exception as e:
@@ -418,7 +430,7 @@ def register_progress():
             
         nuevo_progreso["bmi"] = float(bmi) if bmi else None
             
-        db.progreso_fisico.insert_one(nuevo_progreso)
+        ProgresoFisico.registrar(db, miembro, nuevo_progreso)
         
         # Para retornar un id como string sin romper
         nuevo_progreso["_id"] = str(nuevo_progreso["_id"])
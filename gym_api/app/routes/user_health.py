@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.models.progreso_fisico import ProgresoFisico
 
 user_health_bp = Blueprint('user_health', __name__)
 
@@ -195,7 +196,7 @@ def update_user_health():
                 else:
                     nuevo_progreso[campo] = float(data.get(campo))
 
-        db.progreso_fisico.insert_one(nuevo_progreso)
+        ProgresoFisico.registrar(db, miembro, nuevo_progreso)
 
         return jsonify({
             "message": "Datos de salud actualizados correctamente"
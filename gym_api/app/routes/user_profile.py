@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.utils.busqueda import CAMPO_TOKENS, tokens_busqueda
+from app.models.trainer_client_stats import TrainerClientStats
+from app.models.member_features import MemberFeatures
 
 user_profile_bp = Blueprint('user_profile', __name__)
 
@@ -129,10 +132,19 @@ def update_user_profile():
                 return jsonify({"error": "El email ya está en uso"}), 400
             update_usuario['email'] = data.get('email')
             
+        update_miembro = {}
         if update_usuario:
-            db.usuarios.update_one({"_id": user_id}, {"$set": update_usuario})
+            # Mantener los tokens del buscador en usuario y miembro
+            tokens = tokens_busqueda(
+                update_usuario.get('nombre', usuario.get('nombre')),
+                update_usuario.get('email', usuario.get('email'))
+            )
+            db.usuarios.update_one({"_id": user_id}, {"$set": {**update_usuario, CAMPO_TOKENS: tokens}})
+            update_miembro[CAMPO_TOKENS] = tokens
+            TrainerClientStats.actualizar_usuario(
+                db, user_id, update_usuario.get('nombre', usuario.get('nombre')), tokens
+            )
         
-        update_miembro = {}
         if data.get('telefono'):
             update_miembro['telefono'] = data.get('telefono')
         
@@ -175,7 +187,10 @@ def update_user_profile():
             foto_final = unique_filename
         
         if update_miembro:
+            update_miembro["fecha_actualizacion"] = datetime.now(timezone.utc)
             db.miembros.update_one({"_id": miembro["_id"]}, {"$set": update_miembro})
+            if "estatura" in update_miembro:
+                MemberFeatures.actualizar_miembro(db, {**miembro, **update_miembro})
         
         return jsonify({
             "message": "Perfil actualizado correctamente",
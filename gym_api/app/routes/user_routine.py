@@ -3,19 +3,19 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from bson.objectid import ObjectId
 from app.mongo import get_db
+from app.models.rutina_models import RutinaRepositorio
 
 user_routines_bp = Blueprint('user_routines', __name__)
 
-def _build_routine_dict(db, rutina_doc):
-    """Helper para armar el diccionario de la rutina con sus días y ejercicios"""
-    dias = list(db.rutina_dias.find({"id_rutina": rutina_doc["_id"]}).sort("orden", 1))
-    
+def _build_routine_dict(rutina_doc):
+    """
+    Helper para armar el diccionario de la rutina con sus días y ejercicios.
+    Recibe el árbol ya cargado por RutinaRepositorio (no consulta la BD).
+    """
     dias_formateados = []
-    for dia in dias:
-        ejercicios = list(db.rutina_ejercicios.find({"id_rutina_dia": dia["_id"]}).sort("orden", 1))
-        
+    for dia in rutina_doc.get("dias", []):
         ej_formateados = []
-        for ej in ejercicios:
+        for ej in dia.get("ejercicios", []):
             ej_formateados.append({
                 "id": str(ej["_id"]),
                 "nombre": ej.get("nombre_ejercicio", ""),
@@ -46,6 +46,27 @@ def _build_routine_dict(db, rutina_doc):
         "dias": dias_formateados
     }
 
+def _dias_desde_payload(dias_data):
+    """Convierte los días del frontend al formato de RutinaRepositorio (ejercicios sin nombre se descartan)."""
+    dias = []
+    for idx, dia_data in enumerate(dias_data):
+        dias.append({
+            "dia_semana": dia_data.get('dia', ''),
+            "grupo_muscular": dia_data.get('grupo', ''),
+            "orden": idx,
+            "ejercicios": [
+                {
+                    "nombre_ejercicio": ejercicio_data['nombre'],
+                    "series": str(ejercicio_data.get('series', '3')),
+                    "repeticiones": str(ejercicio_data.get('reps', '12')),
+                    "orden": ej_idx
+                }
+                for ej_idx, ejercicio_data in enumerate(dia_data.get('ejercicios', []))
+                if ejercicio_data.get('nombre', '').strip()
+            ]
+        })
+    return dias
+
 @user_routines_bp.route('/routines', methods=['GET'])
 @jwt_required()
 def get_user_routines():
@@ -57,8 +78,8 @@ def get_user_routines():
         if not miembro:
             return jsonify({"error": "Miembro no encontrado"}), 404
         
-        rutinas_docs = list(db.rutinas.find({"id_miembro": miembro["_id"]}))
-        rutinas_completas = [_build_routine_dict(db, r) for r in rutinas_docs]
+        rutinas_docs = RutinaRepositorio.buscar(db, {"id_miembro": miembro["_id"]})
+        rutinas_completas = [_build_routine_dict(r) for r in rutinas_docs]
         
         return jsonify({
             "rutinas": rutinas_completas
@@ -82,7 +103,7 @@ def get_routine(id):
         if not miembro:
             return jsonify({"error": "Miembro no encontrado"}), 404
         
-        rutina_doc = db.rutinas.find_one({
+        rutina_doc = RutinaRepositorio.buscar_uno(db, {
             "_id": ObjectId(id),
             "id_miembro": miembro["_id"]
         })
@@ -90,7 +111,7 @@ def get_routine(id):
         if not rutina_doc:
             return jsonify({"error": "Rutina no encontrada"}), 404
         
-        return jsonify(_build_routine_dict(db, rutina_doc)), 200
+        return jsonify(_build_routine_dict(rutina_doc)), 200
         
     except Exception as e:
         print(f"Error en get_routine: {e}")
@@ -116,44 +137,18 @@ def create_routine():
         if not data.get('dias') or len(data['dias']) == 0:
             return jsonify({"error": "Debes agregar al menos un día"}), 400
         
-        # Crear rutina
-        nueva_rutina = {
+        # Crear rutina, días y ejercicios en una sola transacción
+        nueva_rutina = RutinaRepositorio.crear(db, {
             "id_miembro": miembro["_id"],
             "nombre": data['nombre'],
             "activa": True,
             "fecha_creacion": datetime.now(),
             "fecha_actualizacion": datetime.now()
-        }
-        rutina_id = db.rutinas.insert_one(nueva_rutina).inserted_id
-        nueva_rutina["_id"] = rutina_id
-        
-        # Crear días y ejercicios
-        for idx, dia_data in enumerate(data['dias']):
-            nuevo_dia = {
-                "id_rutina": rutina_id,
-                "dia_semana": dia_data.get('dia', ''),
-                "grupo_muscular": dia_data.get('grupo', ''),
-                "orden": idx
-            }
-            dia_id = db.rutina_dias.insert_one(nuevo_dia).inserted_id
-            
-            ejercicios_a_insertar = []
-            for ej_idx, ejercicio_data in enumerate(dia_data.get('ejercicios', [])):
-                if ejercicio_data.get('nombre', '').strip():
-                    ejercicios_a_insertar.append({
-                        "id_rutina_dia": dia_id,
-                        "nombre_ejercicio": ejercicio_data['nombre'],
-                        "series": str(ejercicio_data.get('series', '3')),
-                        "repeticiones": str(ejercicio_data.get('reps', '12')),
-                        "orden": ej_idx
-                    })
-                    
-            if ejercicios_a_insertar:
-                db.rutina_ejercicios.insert_many(ejercicios_a_insertar)
+        }, _dias_desde_payload(data['dias']))
         
         return jsonify({
             "message": "Rutina creada exitosamente",
-            "rutina": _build_routine_dict(db, nueva_rutina)
+            "rutina": _build_routine_dict(nueva_rutina)
         }), 201
         
     except Exception as e:
@@ -185,53 +180,21 @@ def update_routine(id):
         
         data = request.json
         
-        # Actualizar nombre
+        cambios = {}
         if data.get('nombre'):
-            db.rutinas.update_one(
-                {"_id": rutina_id},
-                {"$set": {
-                    "nombre": data['nombre'],
-                    "fecha_actualizacion": datetime.now()
-                }}
-            )
-            # Refrescar el documento para armar el diccionario final
-            rutina_doc["nombre"] = data['nombre']
-        
-        # Eliminar días y ejercicios existentes para reemplazarlos
-        dias_existentes = list(db.rutina_dias.find({"id_rutina": rutina_id}))
-        dias_ids = [d["_id"] for d in dias_existentes]
-        
-        if dias_ids:
-            db.rutina_ejercicios.delete_many({"id_rutina_dia": {"$in": dias_ids}})
-            db.rutina_dias.delete_many({"id_rutina": rutina_id})
-        
-        # Crear nuevos días y ejercicios
-        for idx, dia_data in enumerate(data.get('dias', [])):
-            nuevo_dia = {
-                "id_rutina": rutina_id,
-                "dia_semana": dia_data.get('dia', ''),
-                "grupo_muscular": dia_data.get('grupo', ''),
-                "orden": idx
+            cambios = {
+                "nombre": data['nombre'],
+                "fecha_actualizacion": datetime.now()
             }
-            dia_id = db.rutina_dias.insert_one(nuevo_dia).inserted_id
-            
-            ejercicios_a_insertar = []
-            for ej_idx, ejercicio_data in enumerate(dia_data.get('ejercicios', [])):
-                if ejercicio_data.get('nombre', '').strip():
-                    ejercicios_a_insertar.append({
-                        "id_rutina_dia": dia_id,
-                        "nombre_ejercicio": ejercicio_data['nombre'],
-                        "series": str(ejercicio_data.get('series', '3')),
-                        "repeticiones": str(ejercicio_data.get('reps', '12')),
-                        "orden": ej_idx
-                    })
-                    
-            if ejercicios_a_insertar:
-                db.rutina_ejercicios.insert_many(ejercicios_a_insertar)
+        
+        # Cabecera + diferencia de días/ejercicios en una sola transacción
+        rutina_doc = RutinaRepositorio.actualizar(
+            db, rutina_doc, cambios, _dias_desde_payload(data.get('dias', []))
+        )
         
         return jsonify({
             "message": "Rutina actualizada exitosamente",
-            "rutina": _build_routine_dict(db, rutina_doc)
+            "rutina": _build_routine_dict(rutina_doc)
         }), 200
         
     except Exception as e:
@@ -261,15 +224,8 @@ def delete_routine(id):
         if not rutina_doc:
             return jsonify({"error": "Rutina no encontrada"}), 404
         
-        # Eliminar cascada
-        dias_existentes = list(db.rutina_dias.find({"id_rutina": rutina_id}))
-        dias_ids = [d["_id"] for d in dias_existentes]
-        
-        if dias_ids:
-            db.rutina_ejercicios.delete_many({"id_rutina_dia": {"$in": dias_ids}})
-            db.rutina_dias.delete_many({"id_rutina": rutina_id})
-            
-        db.rutinas.delete_one({"_id": rutina_id})
+        # Eliminar cascada (días y ejercicios, en cualquier formato)
+        RutinaRepositorio.eliminar(db, rutina_doc)
         
         return jsonify({"message": "Rutina eliminada exitosamente"}), 200
         
@@ -290,7 +246,7 @@ def duplicate_routine(id):
             return jsonify({"error": "Miembro no encontrado"}), 404
             
         rutina_id = ObjectId(id)
-        rutina_original = db.rutinas.find_one({
+        rutina_original = RutinaRepositorio.buscar_uno(db, {
             "_id": rutina_id,
             "id_miembro": miembro["_id"]
         })
@@ -298,42 +254,17 @@ def duplicate_routine(id):
         if not rutina_original:
             return jsonify({"error": "Rutina no encontrada"}), 404
         
-        # Crear copia de la rutina
-        nueva_rutina = rutina_original.copy()
-        del nueva_rutina["_id"] # Eliminar el ID original
-        nueva_rutina["nombre"] = f"Copia de {rutina_original.get('nombre', '')}"
-        nueva_rutina["activa"] = False
-        nueva_rutina["fecha_creacion"] = datetime.now()
-        nueva_rutina["fecha_actualizacion"] = datetime.now()
-        
-        nuevo_id_rutina = db.rutinas.insert_one(nueva_rutina).inserted_id
-        nueva_rutina["_id"] = nuevo_id_rutina
-        
-        # Copiar días y ejercicios
-        dias_originales = list(db.rutina_dias.find({"id_rutina": rutina_id}))
-        
-        for dia in dias_originales:
-            ejercicios_originales = list(db.rutina_ejercicios.find({"id_rutina_dia": dia["_id"]}))
-            
-            nuevo_dia = dia.copy()
-            del nuevo_dia["_id"]
-            nuevo_dia["id_rutina"] = nuevo_id_rutina
-            
-            nuevo_id_dia = db.rutina_dias.insert_one(nuevo_dia).inserted_id
-            
-            ejercicios_a_insertar = []
-            for ej in ejercicios_originales:
-                nuevo_ej = ej.copy()
-                del nuevo_ej["_id"]
-                nuevo_ej["id_rutina_dia"] = nuevo_id_dia
-                ejercicios_a_insertar.append(nuevo_ej)
-                
-            if ejercicios_a_insertar:
-                db.rutina_ejercicios.insert_many(ejercicios_a_insertar)
+        # Copia de la rutina con ids nuevos (cabecera, días y ejercicios en una transacción)
+        nueva_rutina = RutinaRepositorio.duplicar(db, rutina_original, {
+            "nombre": f"Copia de {rutina_original.get('nombre', '')}",
+            "activa": False,
+            "fecha_creacion": datetime.now(),
+            "fecha_actualizacion": datetime.now()
+        })
         
         return jsonify({
             "message": "Rutina duplicada exitosamente",
-            "rutina": _build_routine_dict(db, nueva_rutina)
+            "rutina": _build_routine_dict(nueva_rutina)
         }), 201
         
     except Exception as e:
@@ -0,0 +1,46 @@
+import re
+import unicodedata
+
+# Campo indexado con los tokens normalizados de nombre y email.
+# Se mantiene en "usuarios" y se replica en "miembros" para poder
+# filtrar por estado + búsqueda en una sola consulta.
+CAMPO_TOKENS = "busqueda_tokens"
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sin acentos y con espacios colapsados ("José  Pérez" -> "jose perez")."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.lower().split())
+
+
+def tokens_busqueda(nombre, email):
+    """
+    Genera el arreglo de tokens que se guarda en CAMPO_TOKENS:
+    cada palabra del nombre, el email completo y la parte local del email.
+    """
+    tokens = set(normalizar_texto(nombre).split())
+
+    email_norm = normalizar_texto(email).replace(" ", "")
+    if email_norm:
+        tokens.add(email_norm)
+        tokens.add(email_norm.split("@", 1)[0])
+
+    return sorted(t for t in tokens if t)
+
+
+def filtro_busqueda(search):
+    """
+    Traduce el texto del buscador a un filtro de prefijo sobre CAMPO_TOKENS.
+    Cada palabra debe ser prefijo de algún token; los regex anclados (^) y
+    sensibles a mayúsculas pueden resolverse con el índice.
+    Devuelve {} si no hay nada que buscar.
+    """
+    palabras = normalizar_texto(search).split()
+    if not palabras:
+        return {}
+    return {
+        CAMPO_TOKENS: {"$all": [re.compile("^" + re.escape(p)) for p in palabras]}
+    }
@@ -0,0 +1,89 @@
+import base64
+from bson import json_util
+from bson.objectid import ObjectId
+
+# ──────────────────────────────────────────────
+# PAGINACIÓN POR CURSOR (keyset)
+# En lugar de skip((page-1)*per_page), cada página continúa desde la última
+# clave (fecha, _id) vista, así el costo no crece con la profundidad. La clave
+# puede tener varios campos (p. ej. fecha + hora_inicio) antes del _id.
+# ──────────────────────────────────────────────
+
+
+def codificar_cursor(valor, _id):
+    """Token opaco (base64 url-safe) con la clave (valor o lista de valores) y el _id del último documento."""
+    crudo = json_util.dumps({"v": valor, "id": _id})
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii")
+
+
+def decodificar_cursor(token):
+    """Devuelve (valor, ObjectId). Lanza ValueError si el token no es válido."""
+    try:
+        relleno = "=" * (-len(token) % 4)
+        data = json_util.loads(base64.urlsafe_b64decode(token + relleno).decode("utf-8"))
+        _id = data["id"]
+        if not isinstance(_id, ObjectId):
+            _id = ObjectId(_id)
+        return data["v"], _id
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+
+def _despues_de(campos, valores, oid):
+    """Documentos posteriores a la clave en orden descendente: (c1 < v1) o (c1 = v1 y c2 < v2) ... o _id < oid."""
+    ramas, iguales = [], {}
+    for c, v in zip(campos, valores):
+        ramas.append({**iguales, c: {"$lt": v}})
+        iguales[c] = v
+    ramas.append({**iguales, "_id": {"$lt": oid}})
+    return {"$or": ramas}
+
+
+def leer_pagina_cursor(coleccion, filtro, campo, after, limite):
+    """
+    Lee `limite` documentos ordenados por (campo desc, _id desc) a partir del
+    cursor `after` (vacío o None = primera página). `campo` puede ser una lista
+    de campos (todos desc), p. ej. ["fecha", "hora_inicio"].
+    Devuelve (docs, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    campos = [campo] if isinstance(campo, str) else list(campo)
+    condiciones = [filtro] if filtro else []
+    if after:
+        valor, oid = decodificar_cursor(after)
+        valores = [valor] if isinstance(campo, str) else valor
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            raise ValueError("Cursor de paginación inválido")
+        condiciones.append(_despues_de(campos, valores, oid))
+
+    if not condiciones:
+        filtro_final = {}
+    elif len(condiciones) == 1:
+        filtro_final = condiciones[0]
+    else:
+        filtro_final = {"$and": condiciones}
+
+    # Pedimos uno extra para saber si hay más páginas sin un count_documents
+    docs = list(
+        coleccion.find(filtro_final)
+        .sort([(c, -1) for c in campos] + [("_id", -1)])
+        .limit(limite + 1)
+    )
+    hay_mas = len(docs) > limite
+    docs = docs[:limite]
+
+    siguiente = None
+    if hay_mas and docs:
+        ultimo = docs[-1]
+        valor = ultimo.get(campo) if isinstance(campo, str) else [ultimo.get(c) for c in campos]
+        siguiente = codificar_cursor(valor, ultimo["_id"])
+    return docs, siguiente
+
+
+def contar_total(coleccion, filtro):
+    """
+    Total para el modo cursor. Sin filtro usa estimated_document_count()
+    (metadatos de la colección, no recorre documentos); con filtro cae a count_documents().
+    """
+    if not filtro:
+        return coleccion.estimated_document_count()
+    return coleccion.count_documents(filtro)
@@ -1,40 +1,21 @@
 import os
+import sys
 from dotenv import load_dotenv
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING
 from pymongo.errors import CollectionInvalid, OperationFailure
 
 load_dotenv()
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
 # ──────────────────────────────────────────────
 # CONEXIÓN
 # ──────────────────────────────────────────────
 def get_db():
-    user     = os.getenv("MONGO_USER")
-    password = os.getenv("MONGO_PASSWORD")
-    cluster  = os.getenv("MONGO_CLUSTER")
-    DB_NAME  = os.getenv("MONGO_DB")
-
-    if not cluster or not DB_NAME:
-        raise EnvironmentError(
-            "❌ Variables faltantes: MONGO_CLUSTER y MONGO_DB"
-        )
-
-    # ── CONEXIÓN LOCAL ─────────────────────────
-    if not user or not password:
-        uri = f"mongodb://{cluster}/{DB_NAME}"
-        print(f"   🔗 Conectando a MongoDB LOCAL → {cluster}")
-
-    # ── CONEXIÓN ATLAS ─────────────────────────
-    else:
-        uri = f"mongodb+srv://{user}:{password}@{cluster}/{DB_NAME}?retryWrites=true&w=majority"
-        print(f"   🔗 Conectando a MongoDB Atlas → {cluster}")
-
-    client = MongoClient(uri)
-
-    # verificar conexión
-    client.admin.command("ping")
-
-    return client[DB_NAME], DB_NAME
+    """Usa el mismo cliente/pool que la API (app/mongo.py); local si no hay usuario."""
+    from app.mongo import get_db as _get_db, MONGO_CLUSTER, MONGO_DB
+    print(f"   🔗 Conectando a MongoDB → {MONGO_CLUSTER}")
+    return _get_db(), MONGO_DB
 
 
 # ──────────────────────────────────────────────
@@ -330,11 +311,24 @@ def crear_indices(db):
     db.usuarios.create_index("email",    unique=True,  name="idx_usuarios_email")
     db.usuarios.create_index("id_role",                name="idx_usuarios_role")
     db.usuarios.create_index("activo",                 name="idx_usuarios_activo")
+    db.usuarios.create_index("busqueda_tokens",        name="idx_usuarios_busqueda")
 
     # miembros
     db.miembros.create_index("id_usuario",    name="idx_miembros_usuario")
     db.miembros.create_index("id_entrenador", name="idx_miembros_entrenador")
     db.miembros.create_index("estado",        name="idx_miembros_estado")
+    # buscador de recepción: estado + prefijo de nombre/email en una sola consulta
+    db.miembros.create_index(
+        [("estado", ASCENDING), ("busqueda_tokens", ASCENDING)],
+        name="idx_miembros_estado_busqueda"
+    )
+    # paginación por cursor (fecha_registro, _id)
+    db.miembros.create_index(
+        [("estado", ASCENDING), ("fecha_registro", DESCENDING), ("_id", DESCENDING)],
+        name="idx_miembros_estado_registro"
+    )
+    # huella de la caché de analítica (app/analytics/cache.py): última edición
+    db.miembros.create_index("fecha_actualizacion", name="idx_miembros_actualizacion")
 
     # asistencias
     db.asistencias.create_index("id_miembro", name="idx_asistencias_miembro")
@@ -343,11 +337,17 @@ def crear_indices(db):
         [("id_miembro", ASCENDING), ("fecha", DESCENDING)],
         name="idx_asistencias_miembro_fecha"
     )
+    db.asistencias.create_index("fecha_actualizacion", name="idx_asistencias_actualizacion")
 
     # pagos
     db.pagos.create_index("id_miembro",    name="idx_pagos_miembro")
     db.pagos.create_index("id_entrenador", name="idx_pagos_entrenador")
     db.pagos.create_index("fecha_pago",    name="idx_pagos_fecha")
+    db.pagos.create_index(
+        [("fecha_pago", DESCENDING), ("_id", DESCENDING)],
+        name="idx_pagos_fecha_id"
+    )
+    db.pagos.create_index("fecha_actualizacion", name="idx_pagos_actualizacion")
 
     # progreso_fisico
     db.progreso_fisico.create_index("id_miembro",     name="idx_progreso_miembro")
@@ -356,6 +356,7 @@ def crear_indices(db):
         [("id_miembro", ASCENDING), ("fecha_registro", DESCENDING)],
         name="idx_progreso_miembro_fecha"
     )
+    db.progreso_fisico.create_index("fecha_actualizacion", name="idx_progreso_actualizacion")
 
     # rutinas
     db.rutinas.create_index("id_miembro",    name="idx_rutinas_miembro")
@@ -394,6 +395,11 @@ def crear_indices(db):
         [("id_entrenador", ASCENDING), ("fecha", DESCENDING)],
         name="idx_ses_entrenador_fecha"
     )
+    # paginación por cursor de /trainer/sessions (fecha, hora_inicio, _id)
+    db.sesiones.create_index(
+        [("id_entrenador", ASCENDING), ("fecha", DESCENDING), ("hora_inicio", DESCENDING), ("_id", DESCENDING)],
+        name="idx_ses_entrenador_fecha_hora"
+    )
 
     # tipos_dieta
     db.tipos_dieta.create_index("nombre", unique=True, name="idx_tipos_dieta_nombre")
@@ -435,6 +441,45 @@ def crear_indices(db):
     )
     db.miembro_rutina.create_index("id_rutina", name="idx_mr_rutina")
 
+    # trainer_client_stats (vista materializada de /api/trainer/clients)
+    db.trainer_client_stats.create_index(
+        [("id_entrenador", ASCENDING), ("status", ASCENDING), ("nombre", ASCENDING)],
+        name="idx_tcs_entrenador_status"
+    )
+    db.trainer_client_stats.create_index(
+        [("id_entrenador", ASCENDING), ("busqueda_tokens", ASCENDING)],
+        name="idx_tcs_entrenador_busqueda"
+    )
+    db.trainer_client_stats.create_index("id_usuario", name="idx_tcs_usuario")
+
+    # analytics_jobs (cola del worker de analítica)
+    db.analytics_jobs.create_index(
+        [("estado", ASCENDING), ("fecha_creacion", ASCENDING)],
+        name="idx_jobs_estado_fecha"
+    )
+    db.analytics_jobs.create_index([("tipo", ASCENDING), ("estado", ASCENDING)], name="idx_jobs_tipo_estado")
+    # Un solo trabajo pendiente/en proceso por tipo + params (ver app/analytics/cola.py)
+    db.analytics_jobs.create_index(
+        "clave_activa",
+        unique=True,
+        partialFilterExpression={"clave_activa": {"$exists": True}},
+        name="idx_jobs_clave_activa"
+    )
+
+    # analytics_rollups (parciales mensuales del MapReduce incremental)
+    db.analytics_rollups.create_index([("tipo", ASCENDING), ("periodo", ASCENDING)], name="idx_rollups_tipo_periodo")
+
+    # backup_jobs (historial y progreso de respaldos, /api/backups/status y /jobs)
+    db.backup_jobs.create_index(
+        [("estado", ASCENDING), ("fecha_creacion", DESCENDING)],
+        name="idx_backup_jobs_estado_fecha"
+    )
+    db.backup_jobs.create_index(
+        [("tipo", ASCENDING), ("fecha_creacion", DESCENDING)],
+        name="idx_backup_jobs_tipo_fecha"
+    )
+    db.backup_jobs.create_index("fecha_creacion", name="idx_backup_jobs_fecha")
+
     print("   ✅ Todos los índices creados")
 
 
@@ -0,0 +1,63 @@
+"""
+Rellena el campo `busqueda_tokens` en usuarios y miembros existentes
+y crea los índices que usa el buscador de /api/miembros.
+
+Los documentos nuevos ya lo reciben desde User.save(); este script solo
+hace falta una vez sobre datos previos (o después de poblar_db.py).
+
+Uso (desde gym_api/):
+    python spark/DB/migrar_busqueda.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from pymongo import ASCENDING, UpdateOne, UpdateMany
+
+from app.mongo import get_db
+from app.utils.busqueda import CAMPO_TOKENS, tokens_busqueda
+
+LOTE = 1000
+
+
+def migrar(db):
+    print("\n🔎 Generando tokens de búsqueda...")
+    ops_usuarios, ops_miembros, total = [], [], 0
+
+    for u in db.usuarios.find({}, {"nombre": 1, "email": 1}).batch_size(LOTE):
+        tokens = tokens_busqueda(u.get("nombre"), u.get("email"))
+        ops_usuarios.append(UpdateOne({"_id": u["_id"]}, {"$set": {CAMPO_TOKENS: tokens}}))
+        ops_miembros.append(UpdateMany({"id_usuario": u["_id"]}, {"$set": {CAMPO_TOKENS: tokens}}))
+        total += 1
+
+        if len(ops_usuarios) >= LOTE:
+            db.usuarios.bulk_write(ops_usuarios, ordered=False)
+            db.miembros.bulk_write(ops_miembros, ordered=False)
+            ops_usuarios, ops_miembros = [], []
+            print(f"   ⏳ {total} usuarios procesados...")
+
+    if ops_usuarios:
+        db.usuarios.bulk_write(ops_usuarios, ordered=False)
+        db.miembros.bulk_write(ops_miembros, ordered=False)
+
+    print(f"   ✅ {total} usuarios actualizados")
+
+
+def crear_indices(db):
+    db.usuarios.create_index(CAMPO_TOKENS, name="idx_usuarios_busqueda")
+    db.miembros.create_index(
+        [("estado", ASCENDING), (CAMPO_TOKENS, ASCENDING)],
+        name="idx_miembros_estado_busqueda"
+    )
+    print("   ✅ Índices de búsqueda creados")
+
+
+def main():
+    db = get_db()
+    migrar(db)
+    crear_indices(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Convierte las rutinas entre los dos formatos que soporta RutinaRepositorio:
+
+  normalizado → embebido   (por defecto)
+      Los días y ejercicios de `rutina_dias` / `rutina_ejercicios` pasan a un
+      arreglo "dias" dentro de cada documento de `rutinas` y se borran las filas.
+  embebido → normalizado   (--revertir)
+      Vuelve a escribir las filas y quita el arreglo "dias".
+
+Se conservan todos los _id, así las URLs y referencias siguen siendo válidas.
+Cada lote va en una transacción y el script puede relanzarse: solo toca las
+rutinas que todavía están en el formato de origen. Las lecturas de la API
+entienden ambos formatos, así que puede correr con el servidor levantado;
+después conviene fijar RUTINAS_MODO=embebido (o normalizado) en el .env.
+
+Uso (desde gym_api/):
+    python spark/DB/migrar_rutinas.py
+    python spark/DB/migrar_rutinas.py --revertir
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.mongo import get_db
+from app.models.rutina_models import RutinaRepositorio, Rutina, RutinaDia, RutinaEjercicio
+
+LOTE = 500
+
+
+def _por_lotes(cursor):
+    lote = []
+    for doc in cursor:
+        lote.append(doc)
+        if len(lote) >= LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def embeber(db):
+    print("\n🏋️  Embebiendo días y ejercicios en rutinas...")
+    total = 0
+    cursor = db[Rutina.collection].find({"dias": {"$exists": False}}).batch_size(LOTE)
+
+    for lote in _por_lotes(cursor):
+        ops, ids_dia = RutinaRepositorio.ops_embeber(db, lote)
+
+        def operacion(session):
+            db[Rutina.collection].bulk_write(ops, session=session)
+            if ids_dia:
+                db[RutinaEjercicio.collection].delete_many({"id_rutina_dia": {"$in": ids_dia}}, session=session)
+                db[RutinaDia.collection].delete_many({"_id": {"$in": ids_dia}}, session=session)
+
+        with db.client.start_session() as session:
+            session.with_transaction(operacion)
+        total += len(ops)
+        print(f"   ⏳ {total} rutinas convertidas...")
+
+    print(f"   ✅ {total} rutinas en formato embebido")
+
+
+def normalizar(db):
+    print("\n🏋️  Devolviendo rutinas a rutina_dias / rutina_ejercicios...")
+    total = 0
+    cursor = db[Rutina.collection].find({"dias": {"$exists": True}}).batch_size(LOTE)
+
+    for lote in _por_lotes(cursor):
+        dias, ejercicios = RutinaRepositorio.filas_normalizadas(lote)
+        ids_rutina = [r["_id"] for r in lote]
+
+        def operacion(session):
+            if dias:
+                db[RutinaDia.collection].insert_many(dias, session=session)
+            if ejercicios:
+                db[RutinaEjercicio.collection].insert_many(ejercicios, session=session)
+            db[Rutina.collection].update_many(
+                {"_id": {"$in": ids_rutina}}, {"$unset": {"dias": ""}}, session=session
+            )
+
+        with db.client.start_session() as session:
+            session.with_transaction(operacion)
+        total += len(lote)
+        print(f"   ⏳ {total} rutinas convertidas...")
+
+    print(f"   ✅ {total} rutinas en formato normalizado")
+
+
+def main():
+    db = get_db()
+    if "--revertir" in sys.argv:
+        normalizar(db)
+    else:
+        embeber(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import os
+import sys
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from bson import ObjectId
 from faker import Faker
 import random
@@ -8,30 +8,17 @@ from datetime import datetime, timedelta
 
 load_dotenv()
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
 # ──────────────────────────────────────────────
 # CONEXIÓN
 # ──────────────────────────────────────────────
 def get_db():
-    user     = os.getenv("MONGO_USER")
-    password = os.getenv("MONGO_PASSWORD")
-    cluster  = os.getenv("MONGO_CLUSTER")
-    DB_NAME  = os.getenv("MONGO_DB")
-
-    missing = [k for k, v in {
-        "MONGO_USER": user, "MONGO_PASSWORD": password,
-        "MONGO_CLUSTER": cluster, "MONGO_DB": DB_NAME
-    }.items() if not v]
-
-    if missing:
-        raise EnvironmentError(
-            f"❌ Variables de entorno faltantes: {', '.join(missing)}"
-        )
-
-    uri = f"mongodb+srv://{user}:{password}@{cluster}/{DB_NAME}?retryWrites=true&w=majority"
-    client = MongoClient(uri)
-    client.admin.command("ping")
-    print(f"   🔗 Conectado → {cluster} / {DB_NAME}")
-    return client[DB_NAME]
+    """Usa el mismo cliente/pool que la API (app/mongo.py)."""
+    from app.mongo import get_db as _get_db, MONGO_CLUSTER, MONGO_DB
+    db = _get_db()
+    print(f"   🔗 Conectado → {MONGO_CLUSTER} / {MONGO_DB}")
+    return db
 
 fake = Faker("es_MX")
 
@@ -554,7 +541,12 @@ def main():
     # 7. Currículum y evaluaciones de los entrenadores
     generar_extras_entrenadores(db)
 
-    print("\n✅ ¡POBLACIÓN TOTAL EXITOSA EN LAS 22 COLECCIONES!\n")
+    print("\n✅ ¡POBLACIÓN TOTAL EXITOSA EN LAS 22 COLECCIONES!")
+    print("   Siguiente paso: python spark/DB/migrar_busqueda.py")
+    print("                   python spark/DB/reparar_rachas.py")
+    print("                   python spark/DB/refrescar_trainer_stats.py")
+    print("                   python spark/DB/refrescar_member_features.py")
+    print("   Opcional:        python spark/DB/migrar_rutinas.py  (rutinas embebidas)\n")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
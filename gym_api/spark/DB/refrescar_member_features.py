@@ -0,0 +1,29 @@
+"""
+Reconstruye la vista materializada `member_features` (perfil + último
+progreso de cada miembro) que leen K-Means y la regresión.
+
+La vista se mantiene sola al registrar progreso y al guardar miembros;
+este script es para la carga inicial o tras importar/editar progreso_fisico
+directamente en la base.
+
+Uso (desde gym_api/):
+    python spark/DB/refrescar_member_features.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from app.mongo import get_db
+from app.models.member_features import MemberFeatures
+
+
+def main():
+    db = get_db()
+    print("\n📊 Reconstruyendo member_features...")
+    total = MemberFeatures.reconstruir(db)
+    print(f"   ✅ {total} miembros")
+
+
+if __name__ == "__main__":
+    main()
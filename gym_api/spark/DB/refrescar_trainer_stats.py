@@ -0,0 +1,55 @@
+"""
+Reconstruye la vista materializada `trainer_client_stats` para todos los
+entrenadores y crea sus índices.
+
+La vista se mantiene sola con los cambios de estado de sesión y los
+check-ins, pero la tasa de asistencia usa una ventana móvil de 30 días:
+conviene programar este script una vez al día (p. ej. cron a las 3:00).
+
+Uso (desde gym_api/):
+    python spark/DB/refrescar_trainer_stats.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from pymongo import ASCENDING
+
+from app.mongo import get_db
+from app.models.trainer_client_stats import TrainerClientStats
+
+
+def crear_indices(db):
+    coll = db[TrainerClientStats.collection]
+    coll.create_index(
+        [("id_entrenador", ASCENDING), ("status", ASCENDING), ("nombre", ASCENDING)],
+        name="idx_tcs_entrenador_status"
+    )
+    coll.create_index(
+        [("id_entrenador", ASCENDING), ("busqueda_tokens", ASCENDING)],
+        name="idx_tcs_entrenador_busqueda"
+    )
+    coll.create_index("id_usuario", name="idx_tcs_usuario")
+
+
+def refrescar(db):
+    print("\n📊 Reconstruyendo trainer_client_stats...")
+    entrenadores = [e for e in db.miembros.distinct("id_entrenador") if e]
+    total = 0
+    for id_entrenador in entrenadores:
+        total += TrainerClientStats.refrescar_entrenador(db, id_entrenador)
+
+    # Filas de entrenadores que ya no tienen miembros asignados
+    db[TrainerClientStats.collection].delete_many({"id_entrenador": {"$nin": entrenadores}})
+    print(f"   ✅ {total} clientes en {len(entrenadores)} carteras")
+
+
+def main():
+    db = get_db()
+    crear_indices(db)
+    refrescar(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Recalcula racha_actual, racha_max y ultima_fecha_asistencia de cada miembro
+a partir de su historial de asistencias.
+
+Sirve como backfill inicial (antes de este cambio la racha no se guardaba)
+y como reparación si los datos se desalinean (asistencias cargadas a mano,
+restauraciones de backup, etc.). Desde ese momento register_checkin la
+mantiene de forma incremental.
+
+Uso (desde gym_api/):
+    python spark/DB/reparar_rachas.py
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from pymongo import UpdateOne
+
+from app.mongo import get_db
+from app.models.asistencia import Asistencia
+
+LOTE = 500
+
+
+def reparar(db):
+    print("\n🔥 Recalculando rachas de asistencia...")
+
+    # Un solo recorrido: fechas agrupadas por miembro en el servidor
+    pipeline = [
+        {"$match": {"fecha": {"$ne": None}}},
+        {"$group": {"_id": "$id_miembro", "fechas": {"$addToSet": "$fecha"}}}
+    ]
+
+    ops, total = [], 0
+    for grupo in db.asistencias.aggregate(pipeline, allowDiskUse=True):
+        racha, racha_max, ultima = Asistencia.calcular_rachas(grupo["fechas"])
+        ultima_dt = datetime(ultima.year, ultima.month, ultima.day) if ultima else None
+        ops.append(UpdateOne(
+            {"_id": grupo["_id"]},
+            {"$set": {
+                "racha_actual": racha,
+                "racha_max": racha_max,
+                "ultima_fecha_asistencia": ultima_dt
+            }}
+        ))
+        total += 1
+        if len(ops) >= LOTE:
+            db.miembros.bulk_write(ops, ordered=False)
+            ops = []
+            print(f"   ⏳ {total} miembros procesados...")
+
+    if ops:
+        db.miembros.bulk_write(ops, ordered=False)
+
+    print(f"   ✅ Rachas recalculadas para {total} miembros")
+
+
+def main():
+    reparar(get_db())
+
+
+if __name__ == "__main__":
+    main()